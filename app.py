@@ -1,10 +1,116 @@
+import hashlib
 import os
+import time
+from collections import OrderedDict
+
 import streamlit as st
 import requests
+from requests.adapters import HTTPAdapter
 
 
 # Docker Backend environment variable
 API_URL = os.getenv("API_URL", "http://localhost:5000/scan")
+JOBS_URL = os.getenv("JOBS_URL", API_URL.rsplit("/scan", 1)[0] + "/jobs")
+# Thumbnails come back as /thumb?... paths on the backend (resized and cached there)
+BACKEND_URL = os.getenv("BACKEND_URL", API_URL.rsplit("/scan", 1)[0])
+
+# Slow methods go through the backend job queue instead of one long blocking request
+SLOW_METHODS = {"selenium", "ensemble", "auto"}
+JOB_POLL_LIMIT = 300  # seconds
+# Results kept per browser session, by image digest, so a rerun does not upload the image again
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", 50))
+# Methods whose results the backend caches by digest (GET /scan/<digest> can answer for them)
+DIGEST_METHODS = {"cloud_vision", "serpapi", "selenium"}
+
+
+@st.cache_resource
+def get_session():
+    """One pooled session for every backend call: kept-alive connections, gzip responses."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def scan_via_job(files, data):
+    """Submits a background job and long-polls it. Returns (result, error)."""
+    session = get_session()
+    response = session.post(JOBS_URL, files=files, data=data)
+    if response.status_code != 202:
+        return None, response.text
+
+    job = response.json()
+    deadline = time.time() + JOB_POLL_LIMIT
+    while time.time() < deadline:
+        response = session.get(f"{JOBS_URL}/{job['job_id']}", params={"wait": 10})
+        if response.status_code != 200:
+            return None, response.text
+        job = response.json()
+        if job["status"] == "done":
+            return job["result"], None
+        if job["status"] in ("failed", "timeout"):
+            return None, job.get("error", job["status"])
+    return None, "Timed out waiting for the scan to finish."
+
+
+def scan_image(image_bytes, data):
+    """
+    Returns (result, error). A result this session already has for the image is reused: for
+    single methods once the backend confirms it by digest and ETag (a 304, no upload); for
+    ensemble and auto, which the backend does not cache, straight away. Otherwise the image
+    is uploaded.
+    """
+    digest = hashlib.sha256(image_bytes).hexdigest()
+    key = (digest, tuple(sorted(data.items())))
+    results = st.session_state.setdefault("results", OrderedDict())
+    cached = results.get(key)  # (etag, result)
+    method = data["method"]
+    session = get_session()
+
+    if method in DIGEST_METHODS:
+        headers = {"If-None-Match": cached[0]} if cached and cached[0] else {}
+        response = session.get(f"{API_URL}/{digest}", params={"method": method}, headers=headers, timeout=30)
+        if response.status_code == 304:
+            results.move_to_end(key)
+            return cached[1], None
+        if response.status_code == 200:
+            result = response.json()
+            remember(results, key, response.headers.get("ETag"), result)
+            return result, None
+        # 404: the backend does not have it (or no longer); upload it below
+    elif cached:
+        results.move_to_end(key)
+        return cached[1], None
+
+    files = {"image": image_bytes}
+    if method in SLOW_METHODS:
+        result, error = scan_via_job(files, data)
+        etag = None
+    else:
+        response = session.post(API_URL, files=files, data=data)
+        if response.status_code != 200:
+            return None, response.text
+        result, error, etag = response.json(), None, response.headers.get("ETag")
+    if result is not None:
+        remember(results, key, etag, result)
+    return result, error
+
+
+def remember(results, key, etag, result):
+    results[key] = (etag, result)
+    results.move_to_end(key)
+    while len(results) > RESULT_CACHE_SIZE:
+        results.popitem(last=False)
+
+@st.cache_data(max_entries=500, show_spinner=False)
+def load_thumbnail(path):
+    """Fetches a proxied thumbnail from the backend, so the browser never has to reach it."""
+    try:
+        response = get_session().get(BACKEND_URL + path, timeout=10)
+    except requests.RequestException:
+        return None
+    return response.content if response.status_code == 200 else None
 
 st.set_page_config(page_title="Poke-Dex Vision (Unified)", page_icon="🔍", layout="wide")
 
@@ -15,14 +121,17 @@ st.write("Compare different techniques for identifying objects.")
 st.sidebar.header("⚙️ Configuration")
 method = st.sidebar.radio(
     "Select Search Method:",
-    ("Google Cloud Vision API", "SerpApi (Google Lens)", "Selenium Scraping (Free)")
+    ("Google Cloud Vision API", "SerpApi (Google Lens)", "Selenium Scraping (Free)", "Ensemble (All Methods)",
+     "Auto (Cheapest Confident)")
 )
 
 # Map friendly names to backend keys
 method_map = {
     "Google Cloud Vision API": "cloud_vision",
     "SerpApi (Google Lens)": "serpapi",
-    "Selenium Scraping (Free)": "selenium"
+    "Selenium Scraping (Free)": "selenium",
+    "Ensemble (All Methods)": "ensemble",
+    "Auto (Cheapest Confident)": "auto"
 }
 selected_method_key = method_map[method]
 
@@ -30,6 +139,10 @@ st.sidebar.info(f"**Current Mode:** {method}")
 if selected_method_key == "selenium":
     st.sidebar.warning("⚠️ Selenium mode is slow and may be blocked by Google.")
 
+ensemble_deadline = None
+if selected_method_key == "ensemble":
+    ensemble_deadline = st.sidebar.slider("Ensemble deadline (seconds)", 3, 30, 15)
+
 # --- MAIN UI ---
 input_source = st.radio("Select Input Source:", ("📸 Take Photo", "📂 Upload Image"), horizontal=True)
 image_file = None
@@ -50,15 +163,31 @@ if image_file is not None:
         with st.spinner(f"Analyzing using {method}..."):
             try:
                 # Prepare request
-                files = {"image": image_file.getvalue()}
                 data = {"method": selected_method_key}
+                if ensemble_deadline:
+                    data["deadline"] = ensemble_deadline
                 
-                response = requests.post(API_URL, files=files, data=data)
+                result, error = scan_image(image_file.getvalue(), data)
                 
-                if response.status_code == 200:
-                    result = response.json()
-                    
+                if result is not None:
                     st.success("Analysis Complete!")
+
+                    providers = result.get("providers")
+                    if providers:
+                        status_icons = {"ok": "✅", "timeout": "⏱️", "error": "❌"}
+                        st.caption(" | ".join(
+                            f"{status_icons.get(info['status'], '')} {name}" + (f" ({info['seconds']}s)" if info.get('seconds') is not None else "")
+                            for name, info in providers.items()
+                        ))
+
+                    tiers = result.get("tiers")
+                    if tiers:
+                        tier_icons = {"confident": "✅", "below_threshold": "⬆️", "error": "❌"}
+                        st.caption(" → ".join(
+                            f"{tier_icons.get(tier['status'], '')} {tier['method']} ({tier['seconds']}s"
+                            + (f", confidence {tier['confidence']}" if tier.get('confidence') is not None else "") + ")"
+                            for tier in tiers
+                        ))
                     
                     col1, col2 = st.columns([1, 2])
                     
@@ -85,15 +214,18 @@ if image_file is not None:
                             grid_cols = st.columns(3)
                             for idx, match in enumerate(matches):
                                 with grid_cols[idx % 3]:
-                                    if match.get('thumbnail'):
-                                        st.image(match['thumbnail'], width='stretch')
+                                    thumbnail = match.get('thumbnail')
+                                    if thumbnail and thumbnail.startswith('/thumb'):
+                                        thumbnail = load_thumbnail(thumbnail)
+                                    if thumbnail:
+                                        st.image(thumbnail, width='stretch')
                                     st.markdown(f"[{match.get('title', 'Link')}]({match.get('link', '#')})")
                                     st.caption(match.get('source', 'Unknown'))
                         else:
                             st.write("No visual matches returned.")
 
                 else:
-                    st.error(f"Server Error: {response.text}")
+                    st.error(f"Server Error: {error}")
 
             except requests.exceptions.ConnectionError:
                 st.error("Cannot connect to backend. Is `server.py` running?")
@@ -0,0 +1,380 @@
+"""
+asyncio (ASGI) variant of server.py with the same /scan contract.
+
+ImgBB, SerpApi and Cloud Vision are called without blocking the event loop, Selenium
+runs on its own executor, and each method has its own concurrency limit so a backlog
+of slow browser scans cannot starve the fast methods.
+
+Run with:
+    hypercorn async_server:app --bind 0.0.0.0:5000
+"""
+import asyncio
+import contextvars
+import logging
+import math
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+from quart import Quart, Response, g, request, jsonify
+
+from methods.driver_pool import PoolTimeout
+from methods.cache import image_digest
+from methods.ratelimit import ProviderUnavailable
+from methods.responses import encode as encode_response
+from methods.thumbnails import ThumbnailError, proxy_thumbnails, thumbnail_cache, verify
+from methods.ensemble import merge_results
+from methods.singleflight import AsyncSingleFlight
+from scan_service import (
+    GOOGLE_CREDS, SERPAPI_KEY, IMGBB_KEY, SELENIUM_POOL_SIZE, ENSEMBLE_METHODS, ensemble_deadline,
+    ensemble_failure, ScanError, selenium_pool, lookup_cached, store_result, prepare_image, service_stats,
+    add_provider_timings, MAX_UPLOAD_BYTES, read_upload, COALESCE_ENABLED, get_provider, health as service_health,
+    AUTO_THRESHOLD, auto_tiers, record_auto_tier, record_auto_error, finish_auto, lookup_digest,
+    check_method,
+)
+from methods.telemetry import (
+    METRICS_CONTENT_TYPE, current_request_id, current_timings, http_requests, http_seconds, render_metrics,
+    coalesced, scan_context, scans, span, start_request,
+)
+
+log = logging.getLogger(__name__)
+
+app = Quart(__name__)
+# Quart buffers request bodies in memory, so the size limit is what bounds memory here
+app.config["MAX_CONTENT_LENGTH"] = MAX_UPLOAD_BYTES + 64 * 1024
+
+# --- CONCURRENCY CONFIG ---
+# Max in-flight provider calls per method; extra requests wait up to ASYNC_QUEUE_TIMEOUT seconds.
+METHOD_LIMITS = {
+    "cloud_vision": int(os.environ.get("ASYNC_LIMIT_CLOUD_VISION", 32)),
+    "serpapi": int(os.environ.get("ASYNC_LIMIT_SERPAPI", 16)),
+    "selenium": int(os.environ.get("ASYNC_LIMIT_SELENIUM", SELENIUM_POOL_SIZE or 2)),
+}
+QUEUE_TIMEOUT = float(os.environ.get("ASYNC_QUEUE_TIMEOUT", 30))
+# Connections of the shared httpx client, which only SerpApi scans (ImgBB + SerpApi) use. httpcore
+# walks its whole pool for every request, so spare connections cost CPU on every call.
+HTTP_CONNECTIONS = int(os.environ.get("ASYNC_HTTP_CONNECTIONS", METHOD_LIMITS["serpapi"]))
+
+# Selenium is blocking; give it a dedicated executor so it never occupies the default one
+selenium_executor = ThreadPoolExecutor(max_workers=METHOD_LIMITS["selenium"], thread_name_prefix="selenium")
+
+http_client = None
+method_semaphores = {}
+method_waiting = {method: 0 for method in METHOD_LIMITS}
+method_in_flight = {method: 0 for method in METHOD_LIMITS}
+# Identical concurrent scans (same digest and method) share one provider call
+scan_flight = AsyncSingleFlight()
+# Ensemble providers that missed the deadline; referenced here so they can finish and fill the cache
+background_tasks = set()
+
+
+@app.before_serving
+async def startup():
+    global http_client
+    http_client = httpx.AsyncClient(limits=httpx.Limits(max_connections=HTTP_CONNECTIONS,
+                                                         max_keepalive_connections=HTTP_CONNECTIONS))
+    for method, limit in METHOD_LIMITS.items():
+        method_semaphores[method] = asyncio.Semaphore(limit)
+
+
+@app.after_serving
+async def shutdown():
+    await http_client.aclose()
+    selenium_executor.shutdown(wait=False)
+
+
+async def run_blocking(executor, fn, *args):
+    # run_in_executor does not carry contextvars over; copy them so logs keep the request id
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, contextvars.copy_context().run, fn, *args)
+
+
+async def _run_cloud_vision(module, image_bytes):
+    return await module.analyze_with_google_cloud_async(image_bytes, GOOGLE_CREDS)
+
+
+async def _run_serpapi(module, image_bytes):
+    return await module.analyze_with_serpapi_async(image_bytes, SERPAPI_KEY, IMGBB_KEY, http_client)
+
+
+async def _run_selenium(module, image_bytes):
+    return await run_blocking(selenium_executor, module.analyze_with_selenium, image_bytes, IMGBB_KEY, selenium_pool)
+
+
+# The async entry point of each provider in scan_service.providers
+ASYNC_RUNNERS = {
+    "cloud_vision": _run_cloud_vision,
+    "serpapi": _run_serpapi,
+    "selenium": _run_selenium,
+}
+
+
+async def run_method_async(method, image_bytes):
+    provider = get_provider(method)
+    # The first call imports the provider's module; keep that off the event loop
+    module = await run_blocking(None, provider.load) if not provider.loaded else provider.load()
+    return await ASYNC_RUNNERS[method](module, image_bytes)
+
+
+async def run_limited(method, image_bytes):
+    semaphore = method_semaphores[method]
+    method_waiting[method] += 1
+    try:
+        await asyncio.wait_for(semaphore.acquire(), QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise ScanError(f"Too many concurrent {method} scans, try again later", 503)
+    finally:
+        method_waiting[method] -= 1
+    method_in_flight[method] += 1
+    try:
+        return await run_method_async(method, image_bytes)
+    finally:
+        method_in_flight[method] -= 1
+        semaphore.release()
+
+
+async def scan_async(method, image_bytes):
+    """Cached scan. Returns (result, cache status, preprocess info or None)."""
+    # Before the method is used as a metric label
+    check_method(method)
+
+    # Hashing, the SQLite tier and Pillow are blocking; keep them off the event loop
+    with scan_context(method):
+        with span("cache_lookup"):
+            result, cache_status, cache_key, phash = await run_blocking(None, lookup_cached, method, image_bytes)
+        scans.labels(method=method, cache=cache_status).inc()
+        if result is not None:
+            return result, cache_status, None
+
+        if not COALESCE_ENABLED:
+            result, preprocess_info = await scan_uncached_async(method, image_bytes, cache_key, phash)
+            return result, cache_status, preprocess_info
+
+        # Shielded: a request that goes away does not cancel the scan other requests are waiting on
+        (result, preprocess_info), shared = await scan_flight.do(
+            cache_key, scan_uncached_async, method, image_bytes, cache_key, phash,
+            on_join=coalesced.labels(method=method).inc)
+        if shared:
+            return result, "COALESCED", preprocess_info
+        return result, cache_status, preprocess_info
+
+
+async def scan_uncached_async(method, image_bytes, cache_key, phash):
+    with span("preprocess"):
+        send_bytes, preprocess_info = await run_blocking(None, prepare_image, image_bytes)
+    result = await run_limited(method, send_bytes)
+    with span("cache_store"):
+        await run_blocking(None, store_result, method, cache_key, phash, result)
+    return result, preprocess_info
+
+
+async def _timed_scan_async(method, image_bytes):
+    started = time.monotonic()
+    with scan_context(method, collect=True) as timings:
+        result, cache_status, _ = await scan_async(method, image_bytes)
+    return result, cache_status, time.monotonic() - started, timings
+
+
+async def scan_ensemble_async(image_bytes, deadline=None):
+    deadline = ensemble_deadline(deadline)
+    started = time.monotonic()
+    tasks = {asyncio.ensure_future(_timed_scan_async(method, image_bytes)): method for method in ENSEMBLE_METHODS}
+    done, pending = await asyncio.wait(tasks, timeout=deadline)
+    for task in pending:
+        background_tasks.add(task)
+        task.add_done_callback(background_tasks.discard)
+
+    finished, provider_status, last_error = [], {}, None
+    for task, method in tasks.items():
+        if task not in done:
+            provider_status[method] = {"status": "timeout"}
+            continue
+        try:
+            result, cache_status, seconds, timings = task.result()
+        except Exception as e:
+            provider_status[method] = {"status": "error", "error": str(e)}
+            last_error = e
+            continue
+        provider_status[method] = {"status": "ok", "cache": cache_status, "seconds": round(seconds, 3)}
+        add_provider_timings(method, timings)
+        finished.append((method, result))
+    if not finished:
+        raise ensemble_failure(provider_status, last_error, deadline)
+
+    merged = merge_results(finished, provider_status)
+    merged["elapsed_seconds"] = round(time.monotonic() - started, 3)
+    return merged
+
+
+async def scan_auto_async(image_bytes, threshold=None):
+    """scan_auto for the event loop: tiers run one at a time, escalating while below the threshold."""
+    threshold = AUTO_THRESHOLD if threshold is None else threshold
+    started = time.monotonic()
+    tiers, best, last_error = [], None, None
+    for method in auto_tiers.order():
+        tier_started = time.monotonic()
+        try:
+            result, cache_status, seconds, timings = await _timed_scan_async(method, image_bytes)
+        except Exception as e:
+            record_auto_error(tiers, method, e, time.monotonic() - tier_started)
+            last_error = e
+            continue
+        add_provider_timings(method, timings)
+        score = record_auto_tier(tiers, method, result, cache_status, seconds, threshold)
+        if best is None or score > best[0]:
+            best = (score, len(tiers) - 1, result, cache_status)
+        if score >= threshold:
+            break
+
+    if best is None:
+        if last_error is None:
+            raise ScanError("No provider is enabled for method auto", 400)
+        raise last_error
+    return finish_auto(tiers, best, started, threshold)
+
+
+@app.before_request
+async def begin_request():
+    g.started = time.perf_counter()
+    start_request(request.headers.get("X-Request-ID"))
+
+
+@app.after_request
+async def finish_request(response):
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    http_requests.labels(endpoint=endpoint, status=response.status_code).inc()
+    http_seconds.labels(endpoint=endpoint).observe(time.perf_counter() - g.started)
+    response.headers["X-Request-ID"] = current_request_id()
+    return response
+
+
+def unavailable(e):
+    # The provider is throttling us or its circuit is open: tell the client when to come back
+    response = jsonify({"error": str(e), "provider": e.provider})
+    response.status_code = 503
+    if e.retry_after:
+        response.headers["Retry-After"] = str(max(1, math.ceil(e.retry_after)))
+    return response
+
+
+def encoded(data, fields=None):
+    # orjson body with a content-hash ETag, compressed if the client accepts it; 304 if its copy is current
+    status, body, headers = encode_response(data, request.headers.get("Accept-Encoding"),
+                                            request.headers.get("If-None-Match"), fields)
+    return Response(body, status=status, headers=headers, mimetype="application/json")
+
+
+@app.route('/scan', methods=['POST'])
+async def scan_image():
+    files = await request.files
+    if 'image' not in files:
+        return jsonify({"error": "No image file provided"}), 400
+
+    form = await request.form
+    method = form.get('method', 'cloud_vision') # Default to method 1
+
+    try:
+        image_bytes = read_upload(files['image'])
+        if method == 'ensemble':
+            deadline = ensemble_deadline(form.get('deadline'))
+            result, cache_status, preprocess_info = await scan_ensemble_async(image_bytes, deadline), "ENSEMBLE", None
+        elif method == 'auto':
+            threshold = form.get('threshold', type=float)
+            threshold = None if threshold is None else min(1.0, max(0.0, threshold))
+            (result, cache_status), preprocess_info = await scan_auto_async(image_bytes, threshold), None
+        else:
+            result, cache_status, preprocess_info = await scan_async(method, image_bytes)
+
+        # Thumbnails start downloading on the prefetch pool while the response is serialized
+        result = proxy_thumbnails(result)
+        # timings=1 adds a per-stage "timings" block (a copy, so the cached result is untouched)
+        if form.get('timings', request.args.get('timings', '0')).lower() in ('1', 'true', 'yes'):
+            result = dict(result, timings=current_timings())
+        response = encoded(result, form.get('fields', request.args.get('fields')))
+        response.headers["X-Cache"] = cache_status
+        # The key for GET /scan/<digest> next time, without uploading the image again
+        response.headers["X-Image-Digest"] = image_digest(image_bytes)
+        if preprocess_info:
+            response.headers["X-Image-Bytes-Original"] = str(preprocess_info["original_bytes"])
+            response.headers["X-Image-Bytes-Sent"] = str(preprocess_info["sent_bytes"])
+        return response
+
+    except ScanError as e:
+        return jsonify({"error": str(e)}), e.status_code
+    except PoolTimeout as e:
+        return jsonify({"error": str(e)}), 503
+    except ProviderUnavailable as e:
+        return unavailable(e)
+    except Exception as e:
+        log.exception(f"Error processing request ({method}): {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/scan/<digest>', methods=['GET'])
+async def scan_by_digest(digest):
+    # A result this server already has for the image, by digest; 404 means upload it to /scan
+    method = request.args.get('method', 'cloud_vision')
+    try:
+        # The SQLite tier is blocking
+        result = await run_blocking(None, lookup_digest, method, digest)
+    except ScanError as e:
+        return jsonify({"error": str(e)}), e.status_code
+    if result is None:
+        return jsonify({"error": "No cached result for this image; upload it to /scan"}), 404
+
+    # The client has (or is revalidating) this result; its thumbnails were prefetched with the scan
+    response = encoded(proxy_thumbnails(result, prefetch=False), request.args.get('fields'))
+    response.headers["X-Cache"] = "HIT"
+    response.headers["X-Image-Digest"] = digest.lower()
+    return response
+
+
+@app.route('/thumb', methods=['GET'])
+async def thumb():
+    url = request.args.get('url', '')
+    if not verify(url, request.args.get('sig')):
+        return jsonify({"error": "Invalid thumbnail signature"}), 403
+    try:
+        data = await run_blocking(None, thumbnail_cache.get, url)
+    except ThumbnailError as e:
+        return jsonify({"error": str(e)}), e.status_code
+    return Response(data, mimetype="image/jpeg", headers={"Cache-Control": "public, max-age=86400"})
+
+
+@app.route('/health', methods=['GET'])
+async def health():
+    return jsonify(service_health())
+
+
+def async_service_stats():
+    data = service_stats()
+    data["coalescing"] = scan_flight.stats()  # this server's, not scan_service's thread-based one
+    return data
+
+
+@app.route('/stats', methods=['GET'])
+async def stats():
+    data = async_service_stats()
+    data["concurrency"] = {
+        method: {
+            "limit": limit,
+            "in_flight": method_in_flight[method],
+            "waiting": method_waiting[method],
+        }
+        for method, limit in METHOD_LIMITS.items()
+    }
+    return jsonify(data)
+
+
+@app.route('/metrics', methods=['GET'])
+async def metrics():
+    return Response(render_metrics(async_service_stats()), mimetype=METRICS_CONTENT_TYPE)
+
+if __name__ == '__main__':
+    from hypercorn.asyncio import serve
+    from hypercorn.config import Config
+
+    config = Config()
+    config.bind = ["0.0.0.0:5000"]
+    asyncio.run(serve(app, config))
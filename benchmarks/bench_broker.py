@@ -0,0 +1,134 @@
+"""
+Several backend workers sharing one Lens broker (lens_broker.py), against the fake Lens page.
+
+Starts benchmarks/fakes.py, a broker with --browsers workers and --backends server.py
+processes that use it for method=selenium (each one its own broker caller, backend-<n>).
+Backend n is then kept busy with as many concurrent /scan requests as the n-th --concurrency
+value for --seconds. With equal weights every backend gets the same share of the browsers
+however many requests it queues; --weights and --priorities change that.
+
+By default the broker runs with --static (plain HTTP instead of Chrome), so this runs
+anywhere; --chrome uses real browsers against the same page.
+
+Usage:
+    python benchmarks/bench_broker.py [--backends 2] [--concurrency 8 2] [--browsers 2] [--seconds 20]
+                                      [--weights backend-0:1,backend-1:3] [--priorities backend-1:1] [--chrome]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+import requests
+
+from harness import peak_rss_mb, percentile
+from load_test import ROOT, SAMPLE_IMAGE, SERVERS, wait_until_up
+
+
+def start(command, env):
+    return subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def drive(scan_url, concurrency, stop_at, image, samples):
+    """Closed loop: concurrency clients, each sending its next scan as soon as the last one returns."""
+    def client():
+        session = requests.Session()
+        while time.monotonic() < stop_at:
+            started = time.perf_counter()
+            try:
+                response = session.post(scan_url, files={"image": image + uuid.uuid4().bytes},
+                                        data={"method": "selenium"}, timeout=120)
+                ok = response.status_code == 200 and bool(response.json().get("visual_matches"))
+                status = response.status_code
+            except requests.RequestException:
+                ok, status = False, "connection_error"
+            samples.append((time.perf_counter() - started, ok, status))
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    return threads
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backends", type=int, default=2)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[8, 2],
+                        help="concurrent requests per backend (the last value repeats)")
+    parser.add_argument("--browsers", type=int, default=2)
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--weights", default="", help="BROKER_WEIGHTS, e.g. backend-0:1,backend-1:3")
+    parser.add_argument("--priorities", default="", help="BROKER_PRIORITIES, e.g. backend-1:1")
+    parser.add_argument("--lens-latency", type=float, default=0.5, help="seconds the fake Lens page takes")
+    parser.add_argument("--chrome", action="store_true", help="real browsers instead of --static")
+    parser.add_argument("--fakes-port", type=int, default=8900)
+    parser.add_argument("--broker-port", type=int, default=5100)
+    parser.add_argument("--port", type=int, default=5060, help="first backend port")
+    args = parser.parse_args()
+
+    fakes_url = f"http://127.0.0.1:{args.fakes_port}"
+    broker_url = f"http://127.0.0.1:{args.broker_port}"
+    env = dict(os.environ, LOG_LEVEL="WARNING", LENS_UPLOAD_URL=f"{fakes_url}/uploadbyurl",
+               IMGBB_KEY="fake", IMGBB_UPLOAD_URL=f"{fakes_url}/1/upload",
+               RATE_LIMIT_LENS="0", RATE_LIMIT_IMGBB="0")
+    with open(SAMPLE_IMAGE, "rb") as f:
+        image = f.read()
+
+    processes = [start([sys.executable, os.path.join(ROOT, "benchmarks", "fakes.py"), "--port", str(args.fakes_port),
+                        "--lens-latency", str(args.lens_latency), "--imgbb-latency", "0"], env)]
+    try:
+        wait_until_up(f"{fakes_url}/_stats")
+        broker_cmd = [sys.executable, os.path.join(ROOT, "lens_broker.py"), "--port", str(args.broker_port),
+                      "--browsers", str(args.browsers)] + ([] if args.chrome else ["--static"])
+        broker = start(broker_cmd, dict(env, BROKER_WEIGHTS=args.weights, BROKER_PRIORITIES=args.priorities,
+                                        SELENIUM_HEADLESS="1"))
+        processes.append(broker)
+        wait_until_up(f"{broker_url}/health")
+
+        backends = []
+        for n in range(args.backends):
+            port = args.port + n
+            processes.append(start(SERVERS["flask"](port), dict(
+                env, LENS_BROKER_URL=broker_url, LENS_BROKER_CALLER=f"backend-{n}", SCAN_METHODS="selenium",
+                CACHE_TTL_SELENIUM="0", PHASH_ENABLED="0", COALESCE_ENABLED="0", THUMB_ENABLED="0",
+                ASYNC_LIMIT_SELENIUM="64")))
+            backends.append(f"http://127.0.0.1:{port}")
+        for url in backends:
+            wait_until_up(f"{url}/health")
+
+        print(f"{args.backends} backends -> broker with {args.browsers} {'chrome' if args.chrome else 'static'}"
+              f" workers, {args.seconds:.0f}s...", flush=True)
+        stop_at = time.monotonic() + args.seconds
+        samples, threads = [], []
+        for n, url in enumerate(backends):
+            concurrency = args.concurrency[min(n, len(args.concurrency) - 1)]
+            samples.append([])
+            threads += drive(f"{url}/scan", concurrency, stop_at, image, samples[n])
+        for t in threads:
+            t.join()
+
+        broker_stats = requests.get(f"{broker_url}/stats", timeout=5).json()
+        broker_rss = peak_rss_mb(broker.pid)
+    finally:
+        for proc in reversed(processes):
+            proc.terminate()
+            proc.wait()
+
+    total_ok = sum(ok for backend in samples for _, ok, _ in backend) or 1
+    print(f"\n{'caller':<11} {'conc':>5} {'ok':>5} {'err':>5} {'share':>7} {'p50 ms':>8} {'p95 ms':>8} {'queue ms':>9}")
+    for n, backend in enumerate(samples):
+        caller = f"backend-{n}"
+        latencies = sorted(seconds for seconds, ok, _ in backend if ok)
+        ok = len(latencies)
+        wait = broker_stats["callers"].get(caller, {}).get("wait_seconds_avg")
+        print(f"{caller:<11} {args.concurrency[min(n, len(args.concurrency) - 1)]:>5} {ok:>5} {len(backend) - ok:>5}"
+              f" {ok / total_ok:>7.1%} {(percentile(latencies, 50) or 0) * 1000:>8.0f}"
+              f" {(percentile(latencies, 95) or 0) * 1000:>8.0f} {(wait or 0) * 1000:>9.0f}")
+    print(f"\nbroker: {broker_stats['busy_workers']} busy at the end, peak RSS {broker_rss} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Lens page loads with the default vs. the lean Chrome profile (SELENIUM_PROFILE).
+
+Loads the results page --runs times per profile in one warm browser each and reports
+time-to-ready, requests sent, requests blocked and bytes transferred, all as measured by
+scrape_google_lens_selenium. By default the page comes from benchmarks/fakes.py, which
+serves a Lens-like page with thumbnails, a web font and a tracking script. Pass --lens-url
+to load a real Lens URL instead (e.g. https://lens.google.com/uploadbyurl) with --image-url.
+
+Needs Chrome installed.
+
+Usage:
+    python benchmarks/bench_chrome_profile.py [--runs 10] [--headless] [--lens-url URL --image-url URL]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from harness import percentile  # noqa: E402
+from load_test import ROOT, wait_until_up  # noqa: E402
+
+PROFILES = ("default", "lean")
+
+
+def measure(profile, args):
+    from methods.selenium_lens import create_driver, scrape_google_lens_selenium
+
+    samples = []
+    driver = create_driver(headless=args.headless, profile=profile, measure_network=True)
+    try:
+        for _ in range(args.runs + 1):
+            stats = {}
+            scrape_google_lens_selenium(args.image_url, headless=args.headless, driver=driver, page_stats=stats)
+            samples.append(stats)
+    finally:
+        driver.quit()
+    samples = samples[1:]  # the first load fills Chrome's caches
+
+    def values(key):
+        return sorted(s[key] for s in samples if s.get(key) is not None)
+
+    ready, transferred = values("time_to_ready_seconds"), values("bytes_transferred")
+    return {
+        "ready_p50_ms": round(percentile(ready, 50) * 1000, 1) if ready else None,
+        "ready_p95_ms": round(percentile(ready, 95) * 1000, 1) if ready else None,
+        "requests": round(sum(values("requests")) / len(samples), 1),
+        "blocked": round(sum(values("blocked")) / len(samples), 1),
+        "kb_transferred": round(sum(transferred) / len(samples) / 1024, 1) if transferred else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--headless", action="store_true")
+    parser.add_argument("--lens-url", default=None, help="Lens 'search by URL' page (default: the fake one)")
+    parser.add_argument("--image-url", default="https://example.com/test_char.jpg")
+    parser.add_argument("--fakes-port", type=int, default=8900)
+    parser.add_argument("--profiles", nargs="+", default=list(PROFILES), choices=PROFILES)
+    args = parser.parse_args()
+
+    fakes = None
+    if args.lens_url is None:
+        fakes = subprocess.Popen(
+            [sys.executable, os.path.join(ROOT, "benchmarks", "fakes.py"), "--port", str(args.fakes_port),
+             "--lens-latency", "0"],
+            stdout=subprocess.DEVNULL,
+        )
+        args.lens_url = f"http://127.0.0.1:{args.fakes_port}/uploadbyurl"
+        wait_until_up(f"http://127.0.0.1:{args.fakes_port}/_stats")
+    # Read by methods.selenium_lens at import time
+    os.environ["LENS_UPLOAD_URL"] = args.lens_url
+
+    results = {}
+    try:
+        for profile in args.profiles:
+            print(f"{profile}: {args.runs} page loads...", flush=True)
+            started = time.perf_counter()
+            results[profile] = measure(profile, args)
+            print(f"  done in {time.perf_counter() - started:.1f}s")
+    finally:
+        if fakes:
+            fakes.terminate()
+            fakes.wait()
+
+    print(f"\n{'profile':<10} {'ready p50':>10} {'ready p95':>10} {'requests':>9} {'blocked':>8} {'KB':>9}")
+    for profile, r in results.items():
+        print(f"{profile:<10} {r['ready_p50_ms']!s:>10} {r['ready_p95_ms']!s:>10} {r['requests']:>9}"
+              f" {r['blocked']:>8} {r['kb_transferred']!s:>9}")
+
+
+if __name__ == "__main__":
+    main()
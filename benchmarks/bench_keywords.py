@@ -0,0 +1,91 @@
+"""
+Keyword extraction: the old per-module get_common_words vs. methods/keywords.py.
+
+extract() is extract_batch() of one list, so the two cost about the same per list; what
+a batch saves is the repeated normalization calls and corpus updates, not tokenizing work.
+Mixed-script titles cost more than with the old function, which dropped non-ASCII characters
+instead of normalizing them.
+
+Usage:
+    python benchmarks/bench_keywords.py [--lists 5000]
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from methods.keywords import KeywordCorpus, KeywordExtractor  # noqa: E402
+
+WORDS = ["Pokemon", "Pokémon", "Charmander", "Plush", "Center", "Original", "Large", "Cute", "Stuffed",
+         "ヒトカゲ", "ぬいぐるみ", "ポケモンセンター", "Limited", "Edition", "2024", "Sitting", "Cuties", "Fit",
+         "Squirtle", "Bulbasaur", "Toy", "eBay", "Amazon.com", "Official", "Japan", "Mercari"]
+
+
+def legacy_get_common_words(titles):
+    if not titles:
+        return []
+    STOP_WORDS = {
+        'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by',
+        'is', 'are', 'was', 'were', 'be', 'been', 'buy', 'sell', 'shop', 'online', 'store',
+        'price', 'best', 'review', 'images', 'photos', 'video', 'youtube', 'com', 'www', 'http',
+        'https', 'reddit', 'ebay', 'amazon', 'pinterest', 'twitter', 'facebook', 'instagram',
+        'stuffed', 'animal', 'toy', 'plush', 'soft', 'doll', 'figure', 'figurine', 'new', 'used',
+        'sale', 'free', 'shipping', 'official', 'licensed', 'authentic', 'japan', 'center', 'collection'
+    }
+    all_text = " ".join(titles)
+    cleaned_text = re.sub(r'[^a-zA-Z0-9\s]', '', all_text.lower())
+    words = cleaned_text.split()
+    meaningful_words = [w for w in words if w not in STOP_WORDS and len(w) > 2]
+    word_counts = Counter(meaningful_words)
+    return [{"word": word, "count": count} for word, count in word_counts.most_common(5)]
+
+
+def make_title_lists(count, rng, words=WORDS):
+    return [
+        [" ".join(rng.choices(words, k=rng.randint(4, 10))) for _ in range(rng.randint(5, 20))]
+        for _ in range(count)
+    ]
+
+
+def timed(label, fn, count):
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<42} {elapsed * 1000:>9.1f} ms  {elapsed / count * 1e6:>8.1f} us/list")
+
+
+def run(name, title_lists):
+    titles = sum(len(t) for t in title_lists)
+    print(f"\n{name}: {len(title_lists)} title lists, {titles} titles")
+
+    extractor = KeywordExtractor()
+    tfidf = KeywordExtractor(corpus=KeywordCorpus())
+
+    count = len(title_lists)
+    timed("legacy get_common_words (loop)", lambda: [legacy_get_common_words(t) for t in title_lists], count)
+    timed("KeywordExtractor.extract (loop)", lambda: [extractor.extract(t) for t in title_lists], count)
+    timed("KeywordExtractor.extract_batch", lambda: extractor.extract_batch(title_lists), count)
+    timed("KeywordExtractor.extract_batch (TF-IDF)", lambda: tfidf.extract_batch(title_lists), count)
+
+    sample = title_lists[0]
+    print("legacy:", legacy_get_common_words(sample))
+    print("new:   ", extractor.extract(sample))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lists", type=int, default=5000)
+    args = parser.parse_args()
+
+    # ASCII-only titles take the fast path; mixed titles go through Unicode normalization
+    run("ascii titles", make_title_lists(args.lists, random.Random(7), [w for w in WORDS if w.isascii()]))
+    run("mixed-script titles", make_title_lists(args.lists, random.Random(7)))
+
+
+if __name__ == "__main__":
+    main()
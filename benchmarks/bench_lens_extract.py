@@ -0,0 +1,80 @@
+"""
+Lens result extraction: the old BeautifulSoup('html.parser') full-page parse vs. methods/lens_extract.py.
+
+Pass saved Lens pages (e.g. debug_lens_failed.html or lens_full_source.html from scrape_lens.py).
+Without any, a synthetic page is used: large inline scripts like the real page, plus result cards.
+
+Usage:
+    python benchmarks/bench_lens_extract.py [page.html ...] [--title-class Yt787] [--runs 20] [--threads 4]
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from methods.lens_extract import extract_results  # noqa: E402
+from fakes import lens_page  # noqa: E402
+
+
+def legacy_extract(html, title_class):
+    soup = BeautifulSoup(html, "html.parser")
+    results = []
+    for item in soup.select(f".{title_class}"):
+        title = item.get_text(strip=True)
+        parent_a = item.find_parent("a")
+        link = parent_a.get("href", "#") if parent_a else "#"
+        if title:
+            results.append({"title": title, "link": link, "source": "Google Lens (Scraped)", "thumbnail": None})
+    return results
+
+
+def timed(label, fn, runs):
+    fn()  # warm up
+    start = time.perf_counter()
+    for _ in range(runs):
+        fn()
+    per_run = (time.perf_counter() - start) / runs
+    print(f"  {label:<36} {per_run * 1000:>9.2f} ms/page")
+    return per_run
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("pages", nargs="*")
+    parser.add_argument("--title-class", default="Yt787")
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--threads", type=int, default=4)
+    args = parser.parse_args()
+
+    pages = []
+    for path in args.pages:
+        with open(path, encoding="utf-8") as f:
+            pages.append((path, f.read()))
+    if not pages:
+        pages.append(("synthetic", lens_page()))
+
+    for name, html in pages:
+        print(f"\n{name}: {len(html) / 1024:.0f} KB")
+        legacy, new = legacy_extract(html, args.title_class), extract_results(html, args.title_class)
+        same = [(r["title"], r["link"]) for r in legacy] == [(r["title"], r["link"]) for r in new]
+        print(f"  results: legacy={len(legacy)} new={len(new)} identical={same}")
+
+        legacy_s = timed("BeautifulSoup html.parser", lambda: legacy_extract(html, args.title_class), args.runs)
+        new_s = timed("lxml, result region only", lambda: extract_results(html, args.title_class), args.runs)
+        print(f"  speedup: {legacy_s / new_s:.1f}x")
+
+        # Concurrent extraction from several request threads
+        with ThreadPoolExecutor(max_workers=args.threads) as executor:
+            start = time.perf_counter()
+            list(executor.map(lambda _: extract_results(html, args.title_class), range(args.runs * args.threads)))
+            elapsed = time.perf_counter() - start
+        print(f"  {args.threads} threads: {args.runs * args.threads / elapsed:.0f} pages/s")
+
+
+if __name__ == "__main__":
+    main()
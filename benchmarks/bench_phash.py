@@ -0,0 +1,76 @@
+"""
+Lookup latency of the near-duplicate hash index versus index size.
+
+Usage:
+    python benchmarks/bench_phash.py [--distance 4] [--queries 2000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from methods.phash import HashIndex, dhash  # noqa: E402
+
+SIZES = [1_000, 10_000, 100_000, 250_000]
+
+
+def flip_bits(value, count, rng):
+    for bit in rng.sample(range(64), count):
+        value ^= 1 << bit
+    return value
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--distance", type=int, default=4, help="max Hamming distance of the index")
+    parser.add_argument("--queries", type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+
+    sample_path = os.path.join(os.path.dirname(__file__), "..", "image", "test_char.jpg")
+    if os.path.exists(sample_path):
+        with open(sample_path, "rb") as f:
+            data = f.read()
+        start = time.perf_counter()
+        for _ in range(20):
+            dhash(data)
+        print(f"dhash(image/test_char.jpg, {len(data)} bytes): {(time.perf_counter() - start) / 20 * 1000:.2f} ms")
+
+    print(f"\nmax_distance={args.distance}, {args.queries} queries per size")
+    print(f"{'size':>10} {'build s':>9} {'hit p50 us':>11} {'hit p99 us':>11} {'miss p50 us':>12} {'miss p99 us':>12}")
+    for size in SIZES:
+        index = HashIndex(max_distance=args.distance, max_entries=size)
+        hashes = [rng.getrandbits(64) for _ in range(size)]
+        start = time.perf_counter()
+        for i, h in enumerate(hashes):
+            index.add(h, i)
+        build = time.perf_counter() - start
+
+        hit_times, miss_times = [], []
+        for _ in range(args.queries):
+            query = flip_bits(rng.choice(hashes), rng.randint(0, args.distance), rng)
+            start = time.perf_counter()
+            found = index.lookup(query)
+            hit_times.append((time.perf_counter() - start) * 1e6)
+            assert found is not None
+
+            query = rng.getrandbits(64)
+            start = time.perf_counter()
+            index.lookup(query)
+            miss_times.append((time.perf_counter() - start) * 1e6)
+
+        print(f"{size:>10} {build:>9.2f} {percentile(hit_times, 50):>11.1f} {percentile(hit_times, 99):>11.1f}"
+              f" {percentile(miss_times, 50):>12.1f} {percentile(miss_times, 99):>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Encode cost vs. upload savings of the pre-upload normalization on the bundled image/ samples.
+
+Usage:
+    python benchmarks/bench_preprocess.py [--max-dimension 1600] [--quality 85] [--uplink-mbps 10]
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from methods.preprocess import normalize_image  # noqa: E402
+
+IMAGE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "image")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--max-dimension", type=int, default=1600)
+    parser.add_argument("--quality", type=int, default=85)
+    parser.add_argument("--min-bytes", type=int, default=300 * 1024)
+    parser.add_argument("--uplink-mbps", type=float, default=10.0, help="assumed upload bandwidth")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("paths", nargs="*", help="images to use (default: image/*)")
+    args = parser.parse_args()
+
+    paths = args.paths or sorted(glob.glob(os.path.join(IMAGE_DIR, "*.jpg")) + glob.glob(os.path.join(IMAGE_DIR, "*.png")))
+    bytes_per_ms = args.uplink_mbps * 1_000_000 / 8 / 1000
+
+    print(f"max_dimension={args.max_dimension} quality={args.quality} uplink={args.uplink_mbps} Mbit/s\n")
+    print(f"{'image':<40} {'outcome':<14} {'orig KB':>8} {'sent KB':>8} {'encode ms':>10} {'upload saved ms':>16} {'net ms':>8}")
+    total_in = total_out = total_encode = 0.0
+    for path in paths:
+        with open(path, "rb") as f:
+            data = f.read()
+
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            sent, info = normalize_image(data, args.max_dimension, args.quality, args.min_bytes)
+            timings.append((time.perf_counter() - start) * 1000)
+        encode_ms = sorted(timings)[len(timings) // 2]
+        saved_ms = (len(data) - len(sent)) / bytes_per_ms
+
+        total_in += len(data)
+        total_out += len(sent)
+        total_encode += encode_ms
+        print(f"{os.path.basename(path)[:40]:<40} {info['outcome']:<14} {len(data) / 1024:>8.1f} {len(sent) / 1024:>8.1f}"
+              f" {encode_ms:>10.1f} {saved_ms:>16.1f} {saved_ms - encode_ms:>8.1f}")
+
+    if paths:
+        saved_ms = (total_in - total_out) / bytes_per_ms
+        print(f"\nTotal: {total_in / 1024:.1f} KB -> {total_out / 1024:.1f} KB"
+              f" ({100 * (1 - total_out / total_in):.1f}% smaller), encode {total_encode:.1f} ms,"
+              f" upload time saved {saved_ms:.1f} ms, net {saved_ms - total_encode:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
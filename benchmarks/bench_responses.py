@@ -0,0 +1,134 @@
+"""
+/scan response encoding: serializer speed, body sizes and what a rerun costs the Streamlit client.
+
+Uses a SerpApi-shaped result (benchmarks/fakes.py's answer run through the real formatter,
+thumbnails rewritten to /thumb paths as the server sends them) and reports:
+
+  - serialization time of the result with Flask's jsonify, json and orjson,
+  - body size raw, gzip, brotli (if installed) and with fields=compact, for one result
+    and for a /scan/batch body of --batch results,
+  - a rerun with the same image against a local server.py: re-uploading it to POST /scan
+    (the old client) vs. GET /scan/<digest> with If-None-Match (a 304, nothing uploaded).
+    Upload time at --uplink-mbps is added on top of the local round trip.
+
+Usage:
+    python benchmarks/bench_responses.py [--repeat 2000] [--batch 100] [--uplink-mbps 10]
+"""
+import argparse
+import gzip
+import json
+import os
+import sys
+import threading
+import time
+
+import requests
+from werkzeug.serving import make_server
+
+from fakes import SERPAPI_RESPONSE
+from load_test import ROOT, SAMPLE_IMAGE
+
+sys.path.insert(0, ROOT)
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+import server  # noqa: E402
+from methods.cache import image_digest, make_cache_key  # noqa: E402
+from methods.responses import brotli, compress, dumps, orjson, select_fields  # noqa: E402
+from methods.serpapi import format_serpapi_results  # noqa: E402
+from methods.thumbnails import thumb_path  # noqa: E402
+from scan_service import result_cache  # noqa: E402
+
+
+def sample_result(n=0):
+    data = dict(SERPAPI_RESPONSE, visual_matches=[
+        # Roughly the length of the encrypted-tbn URLs SerpApi returns; n keeps batch results apart
+        dict(match, link=f"{match['link']}?image={n}",
+             thumbnail=f"https://encrypted-tbn{i % 4}.gstatic.com/images?q=tbn:{'A' * 80}{n:05d}{i}")
+        for i, match in enumerate(SERPAPI_RESPONSE["visual_matches"])
+    ])
+    result = format_serpapi_results(data)
+    result["visual_matches"] = [dict(m, thumbnail=thumb_path(m["thumbnail"])) for m in result["visual_matches"]]
+    return result
+
+
+def per_call_us(fn, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat * 1e6
+
+
+def sizes(data):
+    body = dumps(data)
+    row = {"raw": len(body), "gzip": len(compress(body, "gzip"))}
+    if brotli is not None:
+        row["br"] = len(compress(body, "br"))
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=2000)
+    parser.add_argument("--batch", type=int, default=100, help="results in the /scan/batch body")
+    parser.add_argument("--reruns", type=int, default=50)
+    parser.add_argument("--uplink-mbps", type=float, default=10.0, help="assumed client upload bandwidth")
+    parser.add_argument("--port", type=int, default=5090)
+    args = parser.parse_args()
+
+    result = sample_result()
+    batch = {"success": True, "count": args.batch, "cached": args.batch,
+             "results": [dict(sample_result(i), filename=f"image-{i}.jpg") for i in range(args.batch)]}
+
+    print(f"serializer, one result ({len(dumps(result))} bytes), mean of {args.repeat}")
+    with server.app.app_context():
+        print(f"  {'flask jsonify':<14} {per_call_us(lambda: server.jsonify(result).get_data(), args.repeat):>8.1f} us")
+    print(f"  {'json':<14} {per_call_us(lambda: json.dumps(result, sort_keys=True).encode(), args.repeat):>8.1f} us")
+    if orjson is not None:
+        print(f"  {'orjson':<14} {per_call_us(lambda: dumps(result), args.repeat):>8.1f} us")
+    print(f"  {'orjson + gzip':<14} {per_call_us(lambda: gzip.compress(dumps(result), 6, mtime=0), args.repeat):>8.1f} us")
+
+    print(f"\nbody size, bytes{'' if brotli else ' (brotli not installed)'}")
+    encodings = ["raw", "gzip"] + (["br"] if brotli else [])
+    print(f"  {'':<22}" + "".join(f"{e:>9}" for e in encodings))
+    for name, data in (("result", result), ("result compact", select_fields(result, "compact")),
+                       (f"batch of {args.batch}", batch), ("batch compact", select_fields(batch, "compact"))):
+        row = sizes(data)
+        print(f"  {name:<22}" + "".join(f"{row[e]:>9}" for e in encodings))
+
+    with open(SAMPLE_IMAGE, "rb") as f:
+        image = f.read()
+    digest = image_digest(image)
+    result_cache.set(make_cache_key(digest, "serpapi"), "serpapi", result)
+    httpd = make_server("127.0.0.1", args.port, server.app, threaded=True)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    scan_url = f"http://127.0.0.1:{args.port}/scan"
+    session = requests.Session()
+    try:
+        etag = session.post(scan_url, files={"image": image}, data={"method": "serpapi"}).headers["ETag"]
+
+        def upload():
+            response = session.post(scan_url, files={"image": image}, data={"method": "serpapi"})
+            return response.status_code, len(image), int(response.headers.get("Content-Length", 0))
+
+        def revalidate():
+            response = session.get(f"{scan_url}/{digest}", params={"method": "serpapi"},
+                                   headers={"If-None-Match": etag})
+            return response.status_code, 0, int(response.headers.get("Content-Length", 0))
+
+        print(f"\nrerun with the same {len(image) // 1024} KB image, mean of {args.reruns}"
+              f" (upload at {args.uplink_mbps:g} Mbit/s added)")
+        print(f"  {'':<26} {'status':>6} {'up B':>8} {'down B':>8} {'local ms':>9} {'est. ms':>8}")
+        for name, fn in (("POST /scan (re-upload)", upload), ("GET /scan/<digest> + ETag", revalidate)):
+            fn()
+            started = time.perf_counter()
+            for _ in range(args.reruns):
+                status, up, down = fn()
+            local_ms = (time.perf_counter() - started) / args.reruns * 1000
+            upload_ms = up * 8 / (args.uplink_mbps * 1e6) * 1000
+            print(f"  {name:<26} {status:>6} {up:>8} {down:>8} {local_ms:>9.2f} {local_ms + upload_ms:>8.1f}")
+    finally:
+        httpd.shutdown()
+
+
+if __name__ == "__main__":
+    main()
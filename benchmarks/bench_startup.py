@@ -0,0 +1,107 @@
+"""
+Server startup time and import memory with eager vs. lazy provider loading.
+
+Each run is a fresh interpreter that imports server.py (or async_server.py) and reports the
+time the import took, the process RSS afterwards and how many modules got loaded. Modes:
+
+    eager   PROVIDERS_PRELOAD=1: every provider imported at startup (the old behaviour)
+    lazy    the default: providers imported on first use
+    single  SCAN_METHODS=cloud_vision with PROVIDERS_PRELOAD=1: a one-method deployment
+
+In lazy mode the child also loads each provider afterwards, to show what the first request
+for that method pays instead.
+
+Usage:
+    python benchmarks/bench_startup.py [--runs 5] [--server flask|async]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from load_test import ROOT
+
+MODES = {
+    "eager": {"PROVIDERS_PRELOAD": "1"},
+    "lazy": {"PROVIDERS_PRELOAD": "0"},
+    "single": {"PROVIDERS_PRELOAD": "1", "SCAN_METHODS": "cloud_vision"},
+}
+
+MODULES = {"flask": "server", "async": "async_server"}
+
+_CHILD = """
+import json, resource, sys, time
+
+def rss_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+baseline_rss, baseline_modules = rss_mb(), len(sys.modules)
+started = time.perf_counter()
+import {module}
+import_seconds = time.perf_counter() - started
+out = {{
+    "import_seconds": import_seconds,
+    "rss_mb": rss_mb(),
+    "import_rss_mb": rss_mb() - baseline_rss,
+    "modules": len(sys.modules) - baseline_modules,
+}}
+if {first_use}:
+    from scan_service import providers
+    first_use = {{}}
+    for name in providers.enabled():
+        if not providers.get(name).loaded:
+            started = time.perf_counter()
+            providers.load(name)
+            first_use[name] = time.perf_counter() - started
+    out["first_use_seconds"] = first_use
+print(json.dumps(out))
+"""
+
+
+def measure(module, mode, first_use):
+    env = dict(os.environ, LOG_LEVEL="WARNING", SELENIUM_POOL_SIZE="0")
+    env.pop("SCAN_METHODS", None)
+    env.update(MODES[mode])
+    code = _CHILD.format(module=module, first_use=first_use)
+    output = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, check=True,
+                            capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--server", default="flask", choices=list(MODULES))
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=list(MODES))
+    args = parser.parse_args()
+    module = MODULES[args.server]
+
+    # Alternate modes run by run, so a warming disk cache does not favour whichever goes last
+    samples = {mode: [] for mode in args.modes}
+    for _ in range(args.runs):
+        for mode in args.modes:
+            samples[mode].append(measure(module, mode, first_use=mode == "lazy"))
+
+    print(f"import {module}, median of {args.runs} runs\n")
+    print(f"{'mode':<8} {'import ms':>10} {'RSS MB':>8} {'+RSS MB':>8} {'modules':>8}")
+    for mode, runs in samples.items():
+        def median(key):
+            return statistics.median(run[key] for run in runs)
+        print(f"{mode:<8} {median('import_seconds') * 1000:>10.0f} {median('rss_mb'):>8.1f}"
+              f" {median('import_rss_mb'):>8.1f} {median('modules'):>8.0f}")
+
+    if "lazy" in samples:
+        print("\nlazy: first request per method also pays for its import")
+        first_use = [run["first_use_seconds"] for run in samples["lazy"]]
+        for name in first_use[0]:
+            print(f"  {name:<13} {statistics.median(run[name] for run in first_use) * 1000:>6.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Peak server memory while N large uploads are in flight at once.
+
+Starts benchmarks/fakes.py and server.py, sends --uploads concurrent /scan requests with
+--size-mb images (method=serpapi, so every image is also uploaded to the fake ImgBB), and
+reports the server's peak RSS before and during the load. The fake ImgBB is given enough
+latency that all uploads overlap.
+
+--compare-ref runs the same load against another commit (checked out in a temporary git
+worktree) first, e.g. the commit before streaming uploads:
+    python benchmarks/bench_upload_memory.py --uploads 20 --size-mb 10 --compare-ref HEAD~1
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from harness import peak_rss_mb
+from load_test import ROOT, SERVERS, wait_until_up
+
+JPEG_HEADER = b"\xff\xd8\xff\xe0"
+
+
+def measure(root, args, fakes_url):
+    env = dict(
+        os.environ,
+        IMGBB_KEY="fake", SERPAPI_KEY="fake",
+        IMGBB_UPLOAD_URL=f"{fakes_url}/1/upload", SERPAPI_BACKEND=fakes_url,
+        CACHE_TTL_SERPAPI="0", PHASH_ENABLED="0", PREPROCESS_ENABLED="0",
+        MAX_UPLOAD_BYTES=str(args.size_mb * 1024 * 1024 + 1024 * 1024),
+    )
+    proc = subprocess.Popen(SERVERS["flask"](args.port), cwd=root, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        scan_url = f"http://127.0.0.1:{args.port}/scan"
+        wait_until_up(f"http://127.0.0.1:{args.port}/stats")
+        requests.post(scan_url, files={"image": JPEG_HEADER + uuid.uuid4().bytes}, data={"method": "serpapi"})
+        idle = peak_rss_mb(proc.pid)
+
+        size = args.size_mb * 1024 * 1024
+
+        def one(_):
+            # Random bytes so nothing compresses or dedupes; unique so ImgBB reuse never kicks in
+            body = JPEG_HEADER + os.urandom(size - len(JPEG_HEADER))
+            response = requests.post(scan_url, files={"image": ("big.jpg", body)}, data={"method": "serpapi"},
+                                     timeout=300)
+            return response.status_code
+
+        with ThreadPoolExecutor(max_workers=args.uploads) as executor:
+            statuses = list(executor.map(one, range(args.uploads)))
+        peak = peak_rss_mb(proc.pid)
+    finally:
+        proc.terminate()
+        proc.wait()
+
+    return {
+        "idle_rss_mb": idle,
+        "peak_rss_mb": peak,
+        "per_upload_mb": round((peak - idle) / args.uploads, 1) if peak and idle else None,
+        "ok": statuses.count(200),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--uploads", type=int, default=20)
+    parser.add_argument("--size-mb", type=int, default=10)
+    parser.add_argument("--imgbb-latency", type=float, default=3.0)
+    parser.add_argument("--compare-ref", default=None, help="git ref to measure as the baseline")
+    parser.add_argument("--fakes-port", type=int, default=8900)
+    parser.add_argument("--port", type=int, default=5055)
+    args = parser.parse_args()
+
+    fakes_url = f"http://127.0.0.1:{args.fakes_port}"
+    fakes = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "benchmarks", "fakes.py"), "--port", str(args.fakes_port),
+         "--imgbb-latency", str(args.imgbb_latency), "--serpapi-latency", "0.1"],
+        stdout=subprocess.DEVNULL,
+    )
+    worktree = None
+    results = {}
+    try:
+        wait_until_up(f"{fakes_url}/_stats")
+        if args.compare_ref:
+            worktree = tempfile.mkdtemp(prefix="bench-upload-")
+            subprocess.run(["git", "worktree", "add", "--detach", worktree, args.compare_ref],
+                           cwd=ROOT, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            results[args.compare_ref] = measure(worktree, args, fakes_url)
+        results["working tree"] = measure(ROOT, args, fakes_url)
+    finally:
+        fakes.terminate()
+        fakes.wait()
+        if worktree:
+            subprocess.run(["git", "worktree", "remove", "--force", worktree], cwd=ROOT,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            shutil.rmtree(worktree, ignore_errors=True)
+
+    print(f"\n{args.uploads} concurrent uploads of {args.size_mb} MB (method=serpapi)")
+    print(f"{'tree':<16} {'idle MB':>9} {'peak MB':>9} {'MB/upload':>10} {'ok':>5}")
+    for name, r in results.items():
+        print(f"{name:<16} {r['idle_rss_mb']!s:>9} {r['peak_rss_mb']!s:>9} {r['per_upload_mb']!s:>10} {r['ok']:>5}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,332 @@
+"""
+Local stand-ins for the external providers, so the backend can be load tested without spending quota.
+
+    POST /1/upload            ImgBB upload API
+    GET  /search              SerpApi (engine=google_lens)
+    POST /v1/images:annotate  Cloud Vision web_detection (REST)
+    GET  /uploadbyurl         a static Google Lens results page for the Selenium method
+                              (?redirect=1: a page that navigates there client-side first)
+    GET  /img/<name>          the "public" image URLs handed out by the fake ImgBB, and the
+                              SerpApi and Lens thumbnails (/img/thumb-<n>.jpg), as a real 240x180 JPEG
+    GET  /static/<name>       a web font and a tracking script the Lens page loads
+    GET  /redirect?to=<url>   a 302 to any URL, for the thumbnail proxy's redirect checks
+    GET  /_stats              calls, injected errors and throttled calls per provider
+
+Point the backend at it with:
+    IMGBB_UPLOAD_URL=http://127.0.0.1:8900/1/upload SERPAPI_BACKEND=http://127.0.0.1:8900
+    VISION_API_ENDPOINT=http://127.0.0.1:8900 LENS_UPLOAD_URL=http://127.0.0.1:8900/uploadbyurl
+
+Every provider has its own latency (plus optional random jitter) and error rate. Injected
+errors are what the real service returns when it is overloaded: 500 from ImgBB, 503 from
+SerpApi and Vision, and a page without results (e.g. a CAPTCHA) from Lens.
+
+--vision-weak 0.3 makes that share of Cloud Vision answers useless (no best guess, a couple of
+unrelated pages), the case method=auto escalates to the next provider for.
+
+A provider can also be given a quota (--serpapi-quota 5 = 5 calls per second). Calls over
+it are throttled the way the real service does it: 429 from ImgBB, SerpApi and Vision, and
+the "unusual traffic" CAPTCHA page from Lens.
+
+Usage:
+    python benchmarks/fakes.py [--port 8900] [--serpapi-latency 0.8] [--serpapi-errors 0.05] [--serpapi-quota 5]
+                               [--jitter 0.1] [--vision-weak 0.3]
+"""
+import argparse
+import io
+import itertools
+import json
+import random
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+PROVIDERS = ("imgbb", "serpapi", "vision", "lens")
+DEFAULT_LATENCY = {"imgbb": 0.2, "serpapi": 0.8, "vision": 0.5, "lens": 1.0}
+
+SERPAPI_RESPONSE = {
+    "knowledge_graph": {"title": "Charmander", "subtitle": "Pokémon"},
+    "visual_matches": [
+        {
+            "title": f"Pokemon Center Charmander Plush #{i}",
+            "link": f"https://example.com/charmander-{i}",
+            "source": "example.com",
+            "thumbnail": f"/img/thumb-{i}.jpg",  # made absolute per server, see FakeProviders
+        }
+        for i in range(20)
+    ],
+}
+
+VISION_RESPONSE = {
+    "webDetection": {
+        "bestGuessLabels": [{"label": "charmander plush"}],
+        "pagesWithMatchingImages": [
+            {"url": f"https://example.com/charmander-{i}", "pageTitle": f"Charmander Plush Pokemon Center #{i}"}
+            for i in range(15)
+        ],
+    }
+}
+
+# What Vision answers for a photo it cannot place
+VISION_WEAK_RESPONSE = {
+    "webDetection": {
+        "pagesWithMatchingImages": [
+            {"url": "https://example.com/stock-1", "pageTitle": "Orange Toy Stock Photo"},
+            {"url": "https://example.com/blog-2", "pageTitle": "My Desk Setup Tour"},
+        ],
+    }
+}
+
+
+def lens_page(results=60, script_kb=1500, title_class="Yt787", seed=7, asset_base=None):
+    """
+    A Lens-like results page: mostly large inline scripts, plus result cards. With asset_base,
+    the cards get real thumbnail images and the page loads a web font and a tracking script
+    from there, like the real page does.
+    """
+    rng = random.Random(seed)
+    filler = "".join(rng.choice("abcdefghijklmnopqrstuvwxyz0123456789,;:{}[]") for _ in range(1024))
+    scripts = "".join(f"<script nonce=\"x\">var _d{i}='{filler}';</script>" for i in range(script_kb))
+    image = (lambda i: f"{asset_base}/img/thumb-{i}.jpg") if asset_base else (lambda i: "data:image/png;base64,AAAA")
+    cards = "".join(
+        f'<div class="G19kAf"><a class="LBcIee" href="https://example.com/item-{i}">'
+        f'<div class="ksQYvb"><img src="{image(i)}"></div>'
+        f'<div class="UAiK1e">example.com</div>'
+        f'<span class="{title_class} JGD2rd">Pokemon Center Charmander Plush #{i}</span></a></div>'
+        for i in range(results)
+    )
+    assets = ""
+    if asset_base:
+        assets = (f"<style>@font-face{{font-family:GoogleSans;src:url({asset_base}/static/font.woff2)}}"
+                  "body{font-family:GoogleSans}</style>"
+                  f"<script async src=\"{asset_base}/static/gen_204.js\"></script>")
+    return (
+        f"<!doctype html><html><head><style>.{title_class}{{font-size:14px}}</style>" + assets + scripts +
+        "</head><body>"
+        "<div class=\"header\"><a href=\"/\">Google</a></div>"
+        f"<div class=\"results\">{cards}</div>" + scripts + "</body></html>"
+    )
+
+
+def sample_jpeg(width=240, height=180, seed=3):
+    from PIL import Image  # already a backend dependency
+
+    # Noise, so it weighs about as much as a real photo thumbnail instead of compressing to nothing
+    pixels = random.Random(seed).randbytes(width * height * 3)
+    out = io.BytesIO()
+    Image.frombytes("RGB", (width, height), pixels).save(out, format="JPEG", quality=75)
+    return out.getvalue()
+
+
+# An interstitial that sends the browser on to the results page from script, after driver.get() returned
+LENS_REDIRECT_PAGE = ("<!doctype html><html><body><p>Loading...</p><script>"
+                      "setTimeout(function () { location.replace('/uploadbyurl' + location.search.replace("
+                      "'redirect=1', 'redirect=0')); }, 300);</script></body></html>")
+
+LENS_BLOCKED_PAGE = "<html><body><div id=\"captcha-form\">Our systems have detected unusual traffic</div></body></html>"
+
+
+class FakeProviders:
+    def __init__(self, host="127.0.0.1", port=0, latency=None, error_rate=None, jitter=0.0, seed=None, quota=None,
+                 vision_weak=0.0):
+        self.latency = dict(DEFAULT_LATENCY, **(latency or {}))
+        self.error_rate = {name: 0.0 for name in PROVIDERS}
+        self.error_rate.update(error_rate or {})
+        self.quota = {name: 0 for name in PROVIDERS}  # calls per second, 0 = unlimited
+        self.quota.update(quota or {})
+        self.jitter = jitter
+        self.vision_weak = vision_weak
+        self.calls = {name: 0 for name in PROVIDERS + ("image", "asset")}
+        self.errors = {name: 0 for name in PROVIDERS}
+        self.throttled = {name: 0 for name in PROVIDERS}
+        self._recent = {name: deque() for name in PROVIDERS}  # call times within the last second
+        self.jpeg = sample_jpeg()
+        self.font = random.Random(seed).randbytes(48 * 1024)
+        self._rng = random.Random(seed)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        ThreadingHTTPServer.request_queue_size = 256  # default backlog of 5 drops connections under load
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self.base_url = f"http://{host}:{self.server.server_port}"
+        self.lens_html = lens_page(script_kb=300, asset_base=self.base_url).encode()
+        self.serpapi_response = dict(SERPAPI_RESPONSE, visual_matches=[
+            dict(match, thumbnail=self.base_url + match["thumbnail"]) for match in SERPAPI_RESPONSE["visual_matches"]
+        ])
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+
+    def count(self, name):
+        with self._lock:
+            self.calls[name] += 1
+
+    def respond_slowly(self, name):
+        """
+        Sleeps for the provider's latency and returns "error" if this call should fail,
+        "throttled" (right away) if it is over the provider's quota, or None.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self.calls[name] += 1
+            if self.quota[name]:
+                recent = self._recent[name]
+                while recent and now - recent[0] >= 1:
+                    recent.popleft()
+                if len(recent) >= self.quota[name]:
+                    self.throttled[name] += 1
+                    return "throttled"
+                recent.append(now)
+            delay = self.latency[name] + self._rng.uniform(0, self.jitter)
+            failed = self._rng.random() < self.error_rate[name]
+            if failed:
+                self.errors[name] += 1
+        time.sleep(delay)
+        return "error" if failed else None
+
+    def stats(self):
+        with self._lock:
+            return {"calls": dict(self.calls), "errors": dict(self.errors), "throttled": dict(self.throttled)}
+
+    def _handler(self):
+        fakes = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def send_body(self, status, data, content_type):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def send_json(self, status, body):
+                self.send_body(status, json.dumps(body).encode(), "application/json")
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = self.rfile.read(length)
+                path = urlparse(self.path).path
+                if path == "/1/upload":
+                    outcome = fakes.respond_slowly("imgbb")
+                    if outcome == "throttled":
+                        return self.send_json(429, {"success": False, "status": 429, "error": {"message": "Rate limit"}})
+                    if outcome:
+                        return self.send_json(500, {"success": False, "status": 500, "error": {"message": "Fake outage"}})
+                    image_id = next(fakes._ids)
+                    return self.send_json(200, {
+                        "success": True,
+                        "status": 200,
+                        "data": {"url": f"{fakes.base_url}/img/{image_id}.jpg", "expiration": "0"},
+                    })
+                if path == "/v1/images:annotate":
+                    outcome = fakes.respond_slowly("vision")
+                    if outcome == "throttled":
+                        return self.send_json(429, {"error": {"code": 429, "message": "Quota exceeded", "status": "RESOURCE_EXHAUSTED"}})
+                    if outcome:
+                        return self.send_json(503, {"error": {"code": 503, "message": "Fake outage", "status": "UNAVAILABLE"}})
+                    try:
+                        images = len(json.loads(body).get("requests", [])) or 1
+                    except ValueError:
+                        return self.send_json(400, {"error": {"code": 400, "message": "Bad JSON", "status": "INVALID_ARGUMENT"}})
+                    with fakes._lock:
+                        responses = [VISION_WEAK_RESPONSE if fakes._rng.random() < fakes.vision_weak else VISION_RESPONSE
+                                     for _ in range(images)]
+                    return self.send_json(200, {"responses": responses})
+                self.send_json(404, {"error": "not found"})
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path == "/search":
+                    params = parse_qs(url.query)
+                    outcome = fakes.respond_slowly("serpapi")
+                    if outcome == "throttled":
+                        return self.send_json(429, {"error": "Your searches per second limit has been exceeded"})
+                    if outcome:
+                        return self.send_json(503, {"error": "Fake outage"})
+                    if params.get("engine") != ["google_lens"] or not params.get("url"):
+                        return self.send_json(400, {"error": "Missing engine or url"})
+                    return self.send_json(200, fakes.serpapi_response)
+                if url.path == "/uploadbyurl":
+                    if parse_qs(url.query).get("redirect") == ["1"]:
+                        return self.send_body(200, LENS_REDIRECT_PAGE.encode(), "text/html; charset=utf-8")
+                    if fakes.respond_slowly("lens"):
+                        return self.send_body(200, LENS_BLOCKED_PAGE.encode(), "text/html; charset=utf-8")
+                    return self.send_body(200, fakes.lens_html, "text/html; charset=utf-8")
+                if url.path.startswith("/img/"):
+                    fakes.count("image")
+                    return self.send_body(200, fakes.jpeg, "image/jpeg")
+                if url.path == "/static/font.woff2":
+                    fakes.count("asset")
+                    return self.send_body(200, fakes.font, "font/woff2")
+                if url.path == "/static/gen_204.js":
+                    fakes.count("asset")
+                    return self.send_body(200, b"void 0;", "text/javascript")
+                if url.path == "/redirect":
+                    self.send_response(302)
+                    self.send_header("Location", parse_qs(url.query).get("to", ["/"])[0])
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                if url.path == "/_stats":
+                    return self.send_json(200, fakes.stats())
+                self.send_json(404, {"error": "not found"})
+
+        return Handler
+
+
+def add_arguments(parser):
+    """Adds --<provider>-latency / --<provider>-errors / --<provider>-quota / --jitter to an argparse parser."""
+    for name in PROVIDERS:
+        parser.add_argument(f"--{name}-latency", type=float, default=DEFAULT_LATENCY[name],
+                            help=f"seconds per {name} call")
+        parser.add_argument(f"--{name}-errors", type=float, default=0.0,
+                            help=f"fraction of {name} calls that fail")
+        parser.add_argument(f"--{name}-quota", type=int, default=0,
+                            help=f"{name} calls per second before it throttles (0 = unlimited)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random extra latency, up to this many seconds")
+    parser.add_argument("--vision-weak", type=float, default=0.0,
+                        help="fraction of Vision answers with no best guess and unrelated pages")
+
+
+def command_line(args):
+    """The arguments added by add_arguments, to pass on to a fakes.py subprocess."""
+    argv = ["--jitter", str(args.jitter), "--vision-weak", str(args.vision_weak)]
+    for name in PROVIDERS:
+        argv += [f"--{name}-latency", str(getattr(args, f"{name}_latency")),
+                 f"--{name}-errors", str(getattr(args, f"{name}_errors")),
+                 f"--{name}-quota", str(getattr(args, f"{name}_quota"))]
+    return argv
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--seed", type=int, default=None)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    fakes = FakeProviders(
+        args.host, args.port,
+        latency={name: getattr(args, f"{name}_latency") for name in PROVIDERS},
+        error_rate={name: getattr(args, f"{name}_errors") for name in PROVIDERS},
+        jitter=args.jitter, seed=args.seed,
+        quota={name: getattr(args, f"{name}_quota") for name in PROVIDERS},
+        vision_weak=args.vision_weak,
+    )
+    print(f"Fake providers listening on {fakes.base_url}", flush=True)
+    fakes.server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+"""
+Offline load test of /scan per method, against local stand-ins for every provider (benchmarks/fakes.py).
+
+For each method a fresh server.py is started (so peak RSS is per method) with the result cache
+and near-duplicate lookup disabled, and requests are sent at a fixed concurrency. Images are
+taken from image/ in turn, each made unique so ImgBB reuse does not skip the upload.
+
+Requests can also be listed in a JSONL file, one per line:
+    {"method": "serpapi", "image": "image/test_char.jpg"}
+    {"method": "ensemble", "image": "image/test_char.jpg", "fields": {"deadline": "5"}}
+
+Results (p50/p95/p99 latency, throughput, errors, peak RSS, provider calls) are printed and
+written as JSON. Pass an earlier file with --baseline to print the change per method.
+
+Usage:
+    python benchmarks/harness.py [--methods serpapi cloud_vision] [--requests 200] [--concurrency 16]
+                                 [--payloads payloads.jsonl] [--output run.json] [--baseline previous.json]
+                                 [--serpapi-latency 0.8] [--serpapi-errors 0.05] [--jitter 0.1] ...
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import fakes as fakes_cli
+from load_test import ROOT, SERVERS, wait_until_up
+
+IMAGE_DIR = os.path.join(ROOT, "image")
+METHODS = ("serpapi", "cloud_vision", "selenium", "ensemble", "auto")
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def peak_rss_mb(pid):
+    """Peak resident set size of a process (Linux only, None elsewhere)."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def load_images(directory):
+    images = []
+    for name in sorted(os.listdir(directory)):
+        if name.lower().endswith((".jpg", ".jpeg", ".png", ".webp")):
+            with open(os.path.join(directory, name), "rb") as f:
+                images.append((name, f.read()))
+    if not images:
+        raise SystemExit(f"No images found in {directory}")
+    return images
+
+
+def load_payloads(path):
+    """Returns {method: [(image name, bytes, extra form fields)]} from a JSONL file."""
+    payloads = defaultdict(list)
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            image_path = entry["image"]
+            if not os.path.isabs(image_path):
+                image_path = os.path.join(ROOT, image_path)
+            with open(image_path, "rb") as image_file:
+                payloads[entry["method"]].append(
+                    (os.path.basename(image_path), image_file.read(), entry.get("fields", {})))
+    return payloads
+
+
+def run_load(scan_url, method, payloads, total, concurrency):
+    local = threading.local()
+    next_payload = itertools.cycle(payloads).__next__
+    payload_lock = threading.Lock()
+
+    def one(_):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        with payload_lock:
+            name, image, fields = next_payload()
+        # Trailing bytes keep the image decodable but make every upload unique
+        body = image + uuid.uuid4().bytes
+        start = time.perf_counter()
+        try:
+            response = session.post(scan_url, files={"image": (name, body)},
+                                    data=dict(fields, method=method), timeout=300)
+            status = response.status_code
+        except requests.RequestException:
+            status = "connection_error"
+        return time.perf_counter() - start, status
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        samples = list(executor.map(one, range(total)))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(s for s, status in samples if status == 200)
+    statuses = Counter(str(status) for _, status in samples)
+    ms = lambda seconds: round(seconds * 1000, 1) if seconds is not None else None  # noqa: E731
+    return {
+        "requests": total,
+        "ok": len(latencies),
+        "errors": total - len(latencies),
+        "status_codes": dict(statuses),
+        "seconds": round(elapsed, 2),
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        "p50_ms": ms(percentile(latencies, 50)),
+        "p95_ms": ms(percentile(latencies, 95)),
+        "p99_ms": ms(percentile(latencies, 99)),
+        "max_ms": ms(latencies[-1] if latencies else None),
+    }
+
+
+def fake_stats(fakes_url):
+    try:
+        return requests.get(f"{fakes_url}/_stats", timeout=5).json()
+    except requests.RequestException:
+        return None
+
+
+def print_table(results):
+    print(f"\n{'method':<14} {'ok':>6} {'err':>5} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'rss MB':>8}")
+    for method, r in results.items():
+        print(f"{method:<14} {r['ok']:>6} {r['errors']:>5} {r['throughput_rps']:>8} {r['p50_ms']!s:>9}"
+              f" {r['p95_ms']!s:>9} {r['p99_ms']!s:>9} {r['peak_rss_mb']!s:>8}")
+
+
+def print_comparison(results, baseline_path):
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)["results"]
+
+    def change(new, old):
+        if new is None or not old:
+            return "n/a"
+        return f"{(new - old) / old * 100:+.1f}%"
+
+    print(f"\nvs. {baseline_path}")
+    print(f"{'method':<14} {'rps':>9} {'p50':>9} {'p95':>9} {'p99':>9} {'rss':>9}")
+    for method, r in results.items():
+        old = baseline.get(method)
+        if old is None:
+            print(f"{method:<14} (not in baseline)")
+            continue
+        print(f"{method:<14} {change(r['throughput_rps'], old['throughput_rps']):>9}"
+              f" {change(r['p50_ms'], old['p50_ms']):>9} {change(r['p95_ms'], old['p95_ms']):>9}"
+              f" {change(r['p99_ms'], old['p99_ms']):>9} {change(r['peak_rss_mb'], old['peak_rss_mb']):>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--methods", nargs="+", default=["serpapi", "cloud_vision"], choices=METHODS)
+    parser.add_argument("--payloads", help="JSONL file of {method, image, fields}; overrides --methods")
+    parser.add_argument("--images", default=IMAGE_DIR)
+    parser.add_argument("--requests", type=int, default=200, help="requests per method")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--server", default="flask", choices=list(SERVERS))
+    parser.add_argument("--output", default=None, help="JSON results file (default: benchmarks/results/<time>.json)")
+    parser.add_argument("--baseline", default=None, help="earlier JSON results to compare against")
+    parser.add_argument("--fakes-port", type=int, default=8900)
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--seed", type=int, default=1)
+    fakes_cli.add_arguments(parser)
+    args = parser.parse_args()
+
+    if args.payloads:
+        payloads = load_payloads(args.payloads)
+    else:
+        images = load_images(args.images)
+        payloads = {method: [(name, data, {}) for name, data in images] for method in args.methods}
+
+    fakes_url = f"http://127.0.0.1:{args.fakes_port}"
+    fakes = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "benchmarks", "fakes.py"), "--port", str(args.fakes_port),
+         "--seed", str(args.seed)] + fakes_cli.command_line(args),
+        stdout=subprocess.DEVNULL,
+    )
+    env = dict(
+        os.environ,
+        IMGBB_KEY="fake", SERPAPI_KEY="fake",
+        IMGBB_UPLOAD_URL=f"{fakes_url}/1/upload", SERPAPI_BACKEND=fakes_url,
+        VISION_API_ENDPOINT=fakes_url, LENS_UPLOAD_URL=f"{fakes_url}/uploadbyurl",
+        CACHE_TTL_CLOUD_VISION="0", CACHE_TTL_SERPAPI="0", CACHE_TTL_SELENIUM="0", PHASH_ENABLED="0",
+    )
+
+    results = {}
+    try:
+        wait_until_up(f"{fakes_url}/_stats")
+        for method, method_payloads in payloads.items():
+            print(f"{method}: {args.requests} requests at concurrency {args.concurrency}...", flush=True)
+            before = fake_stats(fakes_url)
+            proc = subprocess.Popen(SERVERS[args.server](args.port), cwd=ROOT, env=env,
+                                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                wait_until_up(f"http://127.0.0.1:{args.port}/stats")
+                result = run_load(f"http://127.0.0.1:{args.port}/scan", method, method_payloads,
+                                  args.requests, args.concurrency)
+                result["peak_rss_mb"] = peak_rss_mb(proc.pid)
+            finally:
+                proc.terminate()
+                proc.wait()
+            after = fake_stats(fakes_url)
+            if before and after:
+                result["provider_calls"] = {k: after["calls"][k] - before["calls"][k] for k in after["calls"]}
+                result["provider_errors"] = {k: after["errors"][k] - before["errors"][k] for k in after["errors"]}
+                result["provider_throttled"] = {k: after["throttled"][k] - before["throttled"][k]
+                                                for k in after["throttled"]}
+            results[method] = result
+    finally:
+        fakes.terminate()
+        fakes.wait()
+
+    report = {
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "host": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "config": {
+            "server": args.server,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "payloads": args.payloads,
+            "fakes": {name: {"latency": getattr(args, f"{name}_latency"), "errors": getattr(args, f"{name}_errors"),
+                             "quota": getattr(args, f"{name}_quota")}
+                      for name in fakes_cli.PROVIDERS},
+            "jitter": args.jitter,
+        },
+        "results": results,
+    }
+
+    output = args.output or os.path.join(ROOT, "benchmarks", "results", time.strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    print_table(results)
+    print(f"\nSaved to {output}")
+    if args.baseline:
+        print_comparison(results, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Requests/sec of the Flask server vs. the async server against local provider stand-ins.
+
+Both servers are started as subprocesses pointed at benchmarks/fakes.py, with the result
+cache disabled and a unique image per request so every scan reaches the providers.
+
+Usage:
+    python benchmarks/load_test.py [--requests 200] [--concurrency 32]
+                                   [--method serpapi|cloud_vision|selenium]
+
+selenium needs a local Chrome; it loads the static Lens page from the fakes.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import fakes as fakes_cli
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+SAMPLE_IMAGE = os.path.join(ROOT, "image", "test_char.jpg")
+
+SERVERS = {
+    "flask": lambda port: [sys.executable, "-c", f"import server; server.app.run(host='127.0.0.1', port={port}, threaded=True)"],
+    "async": lambda port: [sys.executable, "-m", "hypercorn", "async_server:app", "--bind", f"127.0.0.1:{port}"],
+}
+
+
+def wait_until_up(url, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up")
+
+
+def run_load(scan_url, method, total, concurrency, image):
+    local = threading.local()
+
+    def one(_):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        # Bytes after the JPEG end marker keep it decodable but make every upload unique
+        body = image + uuid.uuid4().bytes
+        start = time.perf_counter()
+        response = session.post(scan_url, files={"image": body}, data={"method": method}, timeout=120)
+        return time.perf_counter() - start, response.status_code
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        samples = list(executor.map(one, range(total)))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(s for s, _ in samples)
+    errors = sum(1 for _, status in samples if status != 200)
+    return {
+        "requests": total,
+        "errors": errors,
+        "seconds": round(elapsed, 2),
+        "rps": round(total / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--method", default="serpapi", choices=["serpapi", "cloud_vision", "selenium"])
+    fakes_cli.add_arguments(parser)
+    parser.add_argument("--servers", nargs="+", default=list(SERVERS), choices=list(SERVERS))
+    parser.add_argument("--fakes-port", type=int, default=8900)
+    parser.add_argument("--port", type=int, default=5055)
+    args = parser.parse_args()
+
+    with open(SAMPLE_IMAGE, "rb") as f:
+        image = f.read()
+
+    fakes_url = f"http://127.0.0.1:{args.fakes_port}"
+    fakes = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "benchmarks", "fakes.py"), "--port", str(args.fakes_port)]
+        + fakes_cli.command_line(args),
+        stdout=subprocess.DEVNULL,
+    )
+    # The providers' rate limits would cap both servers at the same rps; lift them unless set
+    env = {f"RATE_LIMIT_{name.upper()}": "0" for name in fakes_cli.PROVIDERS}
+    env.update(
+        os.environ,
+        IMGBB_KEY="fake", SERPAPI_KEY="fake",
+        IMGBB_UPLOAD_URL=f"{fakes_url}/1/upload", SERPAPI_BACKEND=fakes_url,
+        VISION_API_ENDPOINT=fakes_url, LENS_UPLOAD_URL=f"{fakes_url}/uploadbyurl",
+        CACHE_TTL_CLOUD_VISION="0", CACHE_TTL_SERPAPI="0", CACHE_TTL_SELENIUM="0", PHASH_ENABLED="0",
+        # Selenium stays at its pool size: each scan holds a Chrome
+        ASYNC_LIMIT_SERPAPI=str(args.concurrency), ASYNC_LIMIT_CLOUD_VISION=str(args.concurrency),
+    )
+
+    results = {}
+    try:
+        wait_until_up(f"{fakes_url}/img/ping")
+        for name in args.servers:
+            proc = subprocess.Popen(SERVERS[name](args.port), cwd=ROOT, env=env,
+                                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                wait_until_up(f"http://127.0.0.1:{args.port}/stats")
+                results[name] = run_load(f"http://127.0.0.1:{args.port}/scan", args.method,
+                                         args.requests, args.concurrency, image)
+            finally:
+                proc.terminate()
+                proc.wait()
+    finally:
+        fakes.terminate()
+        fakes.wait()
+
+    latencies = {"serpapi": ("imgbb", "serpapi"), "cloud_vision": ("vision",), "selenium": ("imgbb", "lens")}
+    print(f"\nmethod={args.method} requests={args.requests} concurrency={args.concurrency} ("
+          + ", ".join(f"{name} {getattr(args, name + '_latency')}s" for name in latencies[args.method]) + ")")
+    print(f"{'server':<8} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'errors':>7}")
+    for name, r in results.items():
+        print(f"{name:<8} {r['rps']:>8} {r['p50_ms']:>9} {r['p95_ms']:>9} {r['errors']:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""
+Lens scraping broker: one process that owns a fixed budget of Chrome browsers and scrapes
+Google Lens for every backend worker (see methods/broker.py). Start it next to the
+backends and point them at it with LENS_BROKER_URL=http://127.0.0.1:5100.
+
+    POST /scrape   {"image_url", "caller", "priority"?, "timeout"?, "request_id"?}
+                   -> {"results", "title_class", "page_stats"}
+    GET  /stats    queue, per-caller counts, browsers and the "lens" guard
+    GET  /health
+
+Errors come back as {"error", "kind", "retry_after"?}: 503 for "busy" (queue full),
+"throttled" (CAPTCHA page) and "unavailable" (circuit open), 504 for "timeout" and
+502 for "failed".
+
+Run with:
+    python lens_broker.py [--port 5100] [--browsers 2] [--static]
+
+--static fetches the results page with plain HTTP instead of Chrome. That only works for a
+static page such as the one benchmarks/fakes.py serves; it is there to test the broker itself
+(scheduling, fairness, timeouts) on a machine without Chrome.
+"""
+import argparse
+import logging
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+
+# Load .env before the method modules read their settings at import time
+load_dotenv()
+
+import requests
+from flask import Flask, jsonify, request
+
+from methods.broker import BrokerBusy, FairScheduler, parse_weights
+from methods.driver_pool import DriverPool, PoolTimeout
+from methods.ratelimit import ProviderThrottled, ProviderUnavailable, get_guard, guard_stats
+from methods.telemetry import configure_logging, request_context
+
+configure_logging()
+log = logging.getLogger(__name__)
+
+# --- BROKER CONFIG ---
+BROKER_HOST = os.environ.get("BROKER_HOST", "127.0.0.1")
+BROKER_PORT = int(os.environ.get("BROKER_PORT", 5100))
+BROKER_BROWSERS = int(os.environ.get("BROKER_BROWSERS", 2))  # browsers, and so scrapes at once
+BROKER_BROWSER_MAX_USES = int(os.environ.get("BROKER_BROWSER_MAX_USES", 20))
+BROKER_MAX_QUEUE = int(os.environ.get("BROKER_MAX_QUEUE", 100))
+BROKER_MAX_QUEUE_PER_CALLER = int(os.environ.get("BROKER_MAX_QUEUE_PER_CALLER", 0))  # 0 = no per-caller cap
+BROKER_MAX_TIMEOUT = float(os.environ.get("BROKER_MAX_TIMEOUT", 120))  # cap on a job's requested timeout
+# Share of browser time per caller ("interactive:4,bulk:1"; unlisted callers weigh 1) and
+# default priority per caller ("interactive:1,bulk:-1"; higher runs first, unlisted are 0)
+BROKER_WEIGHTS = parse_weights(os.environ.get("BROKER_WEIGHTS"))
+BROKER_PRIORITIES = parse_weights(os.environ.get("BROKER_PRIORITIES"), cast=int)
+
+app = Flask(__name__)
+scheduler = FairScheduler(BROKER_WEIGHTS, BROKER_PRIORITIES, BROKER_MAX_QUEUE, BROKER_MAX_QUEUE_PER_CALLER)
+browser_pool = None
+mode = None
+busy_workers = 0
+busy_lock = threading.Lock()
+
+
+def chrome_scraper(browsers):
+    global browser_pool
+    from methods.selenium_lens import HEADLESS, create_driver, scrape_lens
+
+    browser_pool = DriverPool(
+        factory=lambda: create_driver(headless=HEADLESS),
+        size=browsers,
+        max_uses=BROKER_BROWSER_MAX_USES,
+        acquire_timeout=float(os.environ.get("SELENIUM_POOL_TIMEOUT", 30)),
+    )
+    threading.Thread(target=browser_pool.start, daemon=True).start()
+    return lambda image_url: scrape_lens(image_url, browser_pool)
+
+
+def static_scraper():
+    from methods.lens_extract import is_blocked_page, lens_extractor
+
+    lens_url = os.environ.get("LENS_UPLOAD_URL", "https://lens.google.com/uploadbyurl")
+    session = requests.Session()
+
+    def scrape(image_url):
+        page_stats = {"profile": "static"}
+        with get_guard("lens").call():
+            started = time.monotonic()
+            response = session.get(lens_url, params={"url": image_url}, timeout=30)
+            response.raise_for_status()
+            page_stats["time_to_ready_seconds"] = round(time.monotonic() - started, 3)
+            page_stats["bytes_transferred"] = len(response.content)
+            if is_blocked_page(response.text, response.url):
+                raise ProviderThrottled("lens", "Google served a CAPTCHA page")
+            results, title_class, version = lens_extractor.extract(response.text)
+        page_stats["selector_version"] = version
+        return results, title_class, page_stats
+
+    return scrape
+
+
+def worker(scrape):
+    global busy_workers
+    while True:
+        job = scheduler.take()
+        if job is None:
+            return
+        with busy_lock:
+            busy_workers += 1
+        # Logs carry the id of the backend request the job came from
+        with request_context(job.request_id):
+            try:
+                job.finish(result=scrape(job.image_url))
+            except Exception as e:
+                log.warning(f"Scrape for {job.caller} failed: {e}")
+                job.finish(error=e)
+            finally:
+                with busy_lock:
+                    busy_workers -= 1
+
+
+def error_response(kind, message, status_code, retry_after=None):
+    body = {"error": message, "kind": kind}
+    if retry_after:
+        body["retry_after"] = round(retry_after, 1)
+    response = jsonify(body)
+    response.status_code = status_code
+    return response
+
+
+@app.route('/scrape', methods=['POST'])
+def scrape():
+    body = request.get_json(silent=True) or {}
+    image_url = body.get("image_url")
+    if not image_url:
+        return error_response("bad_request", "image_url is required", 400)
+    caller = str(body.get("caller") or request.remote_addr)
+    try:
+        priority = None if body.get("priority") is None else int(body["priority"])
+    except (TypeError, ValueError, OverflowError):
+        return error_response("bad_request", "priority must be an integer", 400)
+    try:
+        timeout = float(body.get("timeout") or BROKER_MAX_TIMEOUT)
+    except (TypeError, ValueError):
+        return error_response("bad_request", "timeout must be a number of seconds", 400)
+    if not timeout > 0:  # also NaN
+        return error_response("bad_request", "timeout must be a positive number of seconds", 400)
+    timeout = min(timeout, BROKER_MAX_TIMEOUT)
+
+    try:
+        job = scheduler.submit(image_url, caller, priority, timeout, body.get("request_id"))
+    except BrokerBusy as e:
+        return error_response("busy", str(e), 503, retry_after=1)
+
+    if not job.done.wait(timeout):
+        # Still queued: take() drops it once it comes up. Running: it finishes and is discarded.
+        return error_response("timeout", f"scrape not finished within {timeout:.0f}s", 504)
+
+    error = job.error
+    if isinstance(error, ProviderThrottled):
+        return error_response("throttled", str(error), 503, error.retry_after)
+    if isinstance(error, ProviderUnavailable):
+        return error_response("unavailable", str(error), 503, error.retry_after)
+    if isinstance(error, PoolTimeout):
+        return error_response("unavailable", str(error), 503, retry_after=1)
+    if isinstance(error, TimeoutError):
+        return error_response("timeout", str(error), 504)
+    if error is not None:
+        return error_response("failed", str(error), 502)
+
+    results, title_class, page_stats = job.result
+    page_stats = dict(page_stats, queue_seconds=round(job.started_at - job.queued_at, 3))
+    return jsonify({"results": results, "title_class": title_class, "page_stats": page_stats})
+
+
+@app.route('/stats', methods=['GET'])
+def stats():
+    data = scheduler.stats()
+    data["mode"] = mode
+    data["busy_workers"] = busy_workers
+    data["browsers"] = browser_pool.stats() if browser_pool else None
+    data["lens"] = guard_stats()["lens"]
+    return jsonify(data)
+
+
+@app.route('/health', methods=['GET'])
+def health():
+    return jsonify({"status": "ok", "mode": mode})
+
+
+def main():
+    global mode
+    parser = argparse.ArgumentParser(description="Lens scraping broker shared by the backend workers.")
+    parser.add_argument("--host", default=BROKER_HOST)
+    parser.add_argument("--port", type=int, default=BROKER_PORT)
+    parser.add_argument("--browsers", type=int, default=BROKER_BROWSERS, help="browser budget (scrapes at once)")
+    parser.add_argument("--static", action="store_true",
+                        help="fetch pages over plain HTTP instead of Chrome (static test pages only)")
+    args = parser.parse_args()
+
+    mode = "static" if args.static else "chrome"
+    scrape_fn = static_scraper() if args.static else chrome_scraper(args.browsers)
+    for i in range(args.browsers):
+        threading.Thread(target=worker, args=(scrape_fn,), name=f"broker-{i}", daemon=True).start()
+    log.info(f"Lens broker on {args.host}:{args.port}, {args.browsers} {mode} workers")
+    app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+"""
+Confidence scoring and tier ordering for method=auto.
+
+method=auto tries the providers one at a time, cheapest first, and stops at the first
+result that looks confident enough. confidence() scores a result from 0 to 1 using
+three signals:
+  - a best guess is present (Vision's best_guess_labels, SerpApi's knowledge graph),
+  - the visual matches agree with each other: the largest share of titles that contain
+    one of the top keywords, and whether the best guess mentions one,
+  - how many visual matches there are.
+Best guesses made up from the result's own keywords (the Lens scraper's) would agree with
+those keywords by construction, so for those results the guess signals are left out and
+the other two are scaled up to the full range.
+TierLearner keeps per-provider success rates and latencies and reorders the tiers so
+that the provider with the lowest expected cost of a confident answer goes first: call
+time plus the provider's price per call (weighted into seconds), over its success rate.
+"""
+import threading
+
+from methods.keywords import default_extractor
+
+# Weights of the three signals; they add up to 1
+GUESS_WEIGHT = 0.35
+AGREEMENT_WEIGHT = 0.40
+MATCHES_WEIGHT = 0.25
+# This many visual matches count as full marks for the match signal
+FULL_MATCHES = 8
+# Only the top few keywords are checked against the titles and the best guess
+AGREEMENT_KEYWORDS = 3
+
+
+def _guess_terms(best_guesses):
+    terms = set()
+    for guess in best_guesses:
+        terms.update(default_extractor.tokenize([guess]))
+    return terms
+
+
+def provider_guesses(result):
+    """The best guesses the provider itself made, or None when they are derived from the keywords."""
+    # Lens results cached before best_guess_source was added carry the method name only
+    if result.get("best_guess_source") == "keywords" or result.get("method") == "Selenium Scraping":
+        return None
+    return [g for g in result.get("best_guesses", []) if g and g.strip()]
+
+
+def confidence(result):
+    """Returns (score between 0 and 1, the signals it was made of)."""
+    if not result or not result.get("success"):
+        return 0.0, {}
+
+    best_guesses = provider_guesses(result)
+    titles = [m.get("title") for m in result.get("visual_matches", []) if m.get("title")]
+    keywords = [k["word"] for k in result.get("common_keywords", [])[:AGREEMENT_KEYWORDS]]
+
+    matches = min(1.0, len(result.get("visual_matches", [])) / FULL_MATCHES)
+
+    title_agreement = 0.0
+    if titles and keywords:
+        title_terms = [set(default_extractor.tokenize([title])) for title in titles]
+        for word in keywords:
+            hits = sum(1 for terms in title_terms if word in terms)
+            # A word from a single title is not agreement, whatever the share
+            if hits >= 2:
+                title_agreement = max(title_agreement, hits / len(titles))
+
+    if best_guesses is None:
+        # No guess of the provider's own: titles and matches only, over the weight they have
+        agreement = title_agreement
+        score = (AGREEMENT_WEIGHT * agreement + MATCHES_WEIGHT * matches) / (AGREEMENT_WEIGHT + MATCHES_WEIGHT)
+        has_guess = None
+    else:
+        has_guess = 1.0 if best_guesses else 0.0
+        guess_agreement = 1.0 if keywords and _guess_terms(best_guesses) & set(keywords) else 0.0
+        agreement = 0.7 * title_agreement + 0.3 * guess_agreement
+        score = GUESS_WEIGHT * has_guess + AGREEMENT_WEIGHT * agreement + MATCHES_WEIGHT * matches
+    signals = {
+        "best_guess": has_guess,
+        "agreement": round(agreement, 3),
+        "matches": round(matches, 3),
+    }
+    return round(score, 3), signals
+
+
+class _TierRecord:
+    def __init__(self):
+        self.attempts = 0
+        self.confident = 0
+        self.seconds = None  # moving average of the provider call time
+
+    def success_rate(self):
+        # Laplace-smoothed, so a single bad scan does not sink a provider
+        return (self.confident + 1) / (self.attempts + 2)
+
+    def cost_per_success(self, cost, cost_weight):
+        """Expected seconds (call time plus price, weighted into seconds) per confident answer."""
+        return (self.seconds + cost_weight * cost) / self.success_rate()
+
+
+class TierLearner:
+    """
+    Per-provider outcomes of method=auto scans, learned from provider calls (cache hits
+    say nothing about a provider's speed and are not counted).
+
+    order() starts from the configured order. Providers with at least min_samples calls
+    are sorted among themselves by expected cost per confident answer: (average call time
+    + cost_weight * the provider's price per call) / success rate. costs are per call in
+    any unit (e.g. cents), and cost_weight is how many seconds of latency one unit is worth.
+    Providers still below min_samples keep their configured position.
+    """
+
+    def __init__(self, methods, min_samples=20, smoothing=0.1, learn=True, costs=None, cost_weight=1.0):
+        self.methods = list(methods)
+        self.costs = {method: (costs or {}).get(method, 0.0) for method in self.methods}
+        self.cost_weight = cost_weight
+        self.min_samples = min_samples
+        self.smoothing = smoothing
+        self.learn = learn
+        self._lock = threading.Lock()
+        self._records = {method: _TierRecord() for method in self.methods}
+        self._counters = {"scans": 0, "escalations": 0, "unconfident": 0}
+
+    def record(self, method, seconds, confident):
+        with self._lock:
+            record = self._records[method]
+            record.attempts += 1
+            record.confident += 1 if confident else 0
+            if record.seconds is None:
+                record.seconds = seconds
+            else:
+                record.seconds += self.smoothing * (seconds - record.seconds)
+
+    def record_scan(self, tiers_run, confident):
+        with self._lock:
+            self._counters["scans"] += 1
+            self._counters["escalations"] += max(0, tiers_run - 1)
+            self._counters["unconfident"] += 0 if confident else 1
+
+    def order(self):
+        with self._lock:
+            if not self.learn:
+                return list(self.methods)
+            learned = [m for m in self.methods
+                       if self._records[m].attempts >= self.min_samples and self._records[m].seconds is not None]
+            ranked = iter(sorted(learned, key=lambda m: self._records[m].cost_per_success(
+                self.costs[m], self.cost_weight)))
+            return [next(ranked) if m in learned else m for m in self.methods]
+
+    def stats(self):
+        order = self.order()
+        with self._lock:
+            return {
+                "order": order,
+                "cost_weight": self.cost_weight,
+                **self._counters,
+                "tiers": {
+                    method: {
+                        "attempts": record.attempts,
+                        "confident": record.confident,
+                        "success_rate": round(record.confident / record.attempts, 3) if record.attempts else None,
+                        "avg_seconds": round(record.seconds, 3) if record.seconds is not None else None,
+                        "cost": self.costs[method],
+                        "cost_per_success": (round(record.cost_per_success(self.costs[method], self.cost_weight), 3)
+                                             if record.seconds is not None else None),
+                    }
+                    for method, record in self._records.items()
+                },
+            }
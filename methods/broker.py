@@ -0,0 +1,275 @@
+"""
+Lens scraping broker: job scheduling (used by lens_broker.py) and the backend's client.
+
+The broker is one process that owns a fixed number of Chrome browsers and scrapes Lens
+for every backend worker, so browser memory no longer grows with workers x concurrency.
+Backends send the uploaded image's URL over HTTP (LENS_BROKER_URL); analyze_with_selenium
+in this module then replaces the in-process one in methods/selenium_lens.py.
+
+Jobs are scheduled by priority first (higher runs first), then fairly between callers:
+each caller (a backend worker, the bulk CLI, ...) gets browser time in proportion to
+its weight, however many jobs it has queued.
+"""
+import itertools
+import logging
+import os
+import socket
+import threading
+import time
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from methods.imgbb import upload_to_imgbb
+from methods.lens_extract import format_lens_result
+from methods.ratelimit import ProviderThrottled, ProviderUnavailable
+from methods.telemetry import current_request_id, span
+
+log = logging.getLogger(__name__)
+
+# --- BROKER CLIENT CONFIG ---
+LENS_BROKER_URL = os.environ.get("LENS_BROKER_URL")  # e.g. http://127.0.0.1:5100
+# Who this process is to the broker's fairness; by default every worker process is its own caller
+LENS_BROKER_CALLER = os.environ.get("LENS_BROKER_CALLER") or f"{socket.gethostname()}-{os.getpid()}"
+LENS_BROKER_PRIORITY = os.environ.get("LENS_BROKER_PRIORITY")  # unset: the broker's default for the caller
+LENS_BROKER_TIMEOUT = float(os.environ.get("LENS_BROKER_TIMEOUT", 60))  # queueing + scraping
+LENS_BROKER_CONNECT_TIMEOUT = float(os.environ.get("LENS_BROKER_CONNECT_TIMEOUT", 2))
+
+
+def parse_weights(value, cast=float):
+    """'interactive:4,bulk:1' -> {"interactive": 4.0, "bulk": 1.0}"""
+    weights = {}
+    for item in (value or "").split(","):
+        if ":" in item:
+            name, number = item.rsplit(":", 1)
+            weights[name.strip()] = cast(number)
+    return weights
+
+
+class BrokerBusy(Exception):
+    """The broker's queue (or the caller's share of it) is full."""
+
+
+class Job:
+    def __init__(self, image_url, caller, priority, deadline, request_id=None):
+        self.image_url = image_url
+        self.caller = caller
+        self.priority = priority
+        self.deadline = deadline
+        self.request_id = request_id
+        self.queued_at = time.monotonic()
+        self.started_at = None
+        self.done = threading.Event()
+        self.result = None  # (results, title class, page_stats)
+        self.error = None
+
+    def expired(self, now=None):
+        return (now or time.monotonic()) >= self.deadline
+
+    def finish(self, result=None, error=None):
+        self.result, self.error = result, error
+        self.done.set()
+
+
+class FairScheduler:
+    """
+    Queue of scrape jobs: strict priority between levels, weighted fair queueing between
+    callers within a level. Each caller has a virtual clock that advances by 1/weight per
+    job served; the caller with the earliest clock goes next. A caller that was idle starts
+    from the current clock, so it cannot save up credit and then crowd everyone else out.
+    """
+
+    def __init__(self, weights=None, priorities=None, max_queue=100, max_queue_per_caller=0):
+        self.weights = weights or {}
+        self.priorities = priorities or {}
+        self.max_queue = max_queue
+        self.max_queue_per_caller = max_queue_per_caller
+        self._cond = threading.Condition()
+        self._queues = {}  # priority -> {caller: deque of jobs}
+        self._clock = {}  # caller -> virtual time
+        self._now = 0.0  # virtual time of the last job handed out
+        self._queued = 0
+        self._closed = False
+        self._order = itertools.count()  # breaks ties between callers with the same clock
+        self._first_seen = {}
+        self._callers = {}  # caller -> counters
+
+    def default_priority(self, caller):
+        return self.priorities.get(caller, 0)
+
+    def submit(self, image_url, caller, priority=None, timeout=60.0, request_id=None):
+        priority = self.default_priority(caller) if priority is None else priority
+        job = Job(image_url, caller, priority, time.monotonic() + timeout, request_id)
+        with self._cond:
+            counters = self._caller(caller)
+            if self._queued >= self.max_queue:
+                counters["rejected"] += 1
+                raise BrokerBusy(f"broker queue full ({self._queued} jobs)")
+            if self.max_queue_per_caller and counters["queued"] >= self.max_queue_per_caller:
+                counters["rejected"] += 1
+                raise BrokerBusy(f"{caller} already has {counters['queued']} jobs queued")
+            callers = self._queues.setdefault(priority, {})
+            if caller not in callers or not callers[caller]:
+                # Back in the queue after being idle: no credit for the time away
+                self._clock[caller] = max(self._clock.get(caller, 0.0), self._now)
+            callers.setdefault(caller, deque()).append(job)
+            self._queued += 1
+            counters["queued"] += 1
+            counters["submitted"] += 1
+            self._cond.notify()
+        return job
+
+    def take(self, timeout=None):
+        """The next job to run, or None after timeout (or once closed). Expired jobs are failed here."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                job = self._pop()
+                if job is not None:
+                    if job.expired():
+                        self._caller(job.caller)["expired"] += 1
+                        job.finish(error=TimeoutError("expired while queued"))
+                        continue
+                    job.started_at = time.monotonic()
+                    counters = self._caller(job.caller)
+                    counters["started"] += 1
+                    counters["wait_seconds_total"] += job.started_at - job.queued_at
+                    return job
+                if self._closed:
+                    return None
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+
+    def _pop(self):
+        for priority in sorted(self._queues, reverse=True):
+            callers = self._queues[priority]
+            waiting = [caller for caller, jobs in callers.items() if jobs]
+            if not waiting:
+                continue
+            caller = min(waiting, key=lambda c: (self._clock[c], self._first_seen[c]))
+            job = callers[caller].popleft()
+            self._now = self._clock[caller]
+            self._clock[caller] += 1.0 / max(self.weights.get(caller, 1.0), 1e-6)
+            self._queued -= 1
+            self._caller(caller)["queued"] -= 1
+            return job
+        return None
+
+    def _caller(self, caller):
+        counters = self._callers.get(caller)
+        if counters is None:
+            self._first_seen[caller] = next(self._order)
+            counters = self._callers[caller] = {"submitted": 0, "queued": 0, "started": 0, "expired": 0,
+                                                "rejected": 0, "wait_seconds_total": 0.0}
+        return counters
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            callers = {}
+            for caller, counters in self._callers.items():
+                stats = dict(counters, weight=self.weights.get(caller, 1.0), priority=self.default_priority(caller))
+                stats["wait_seconds_avg"] = (round(counters["wait_seconds_total"] / counters["started"], 3)
+                                             if counters["started"] else None)
+                stats["wait_seconds_total"] = round(counters["wait_seconds_total"], 3)
+                callers[caller] = stats
+            return {"queued": self._queued, "max_queue": self.max_queue, "callers": callers}
+
+
+# --- Client ---
+
+class BrokerClient:
+    """Sends scrape jobs to the broker over a pooled HTTP session, with timeouts on both ends."""
+
+    def __init__(self, url, caller=LENS_BROKER_CALLER, priority=LENS_BROKER_PRIORITY, timeout=LENS_BROKER_TIMEOUT,
+                 connect_timeout=LENS_BROKER_CONNECT_TIMEOUT, pool_size=16):
+        self.url = url.rstrip("/")
+        self.caller = caller
+        self.priority = None if priority in (None, "") else int(priority)
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._lock = threading.Lock()
+        self._counters = {"jobs": 0, "ok": 0, "busy": 0, "timeouts": 0, "errors": 0, "unreachable": 0}
+
+    def scrape(self, image_url):
+        """Returns (results, title class, page_stats). Raises ProviderUnavailable when the broker can't take it."""
+        body = {"image_url": image_url, "caller": self.caller, "timeout": self.timeout,
+                "request_id": current_request_id()}
+        if self.priority is not None:
+            body["priority"] = self.priority
+        self._count("jobs")
+        try:
+            # The broker answers by the job's own deadline; the extra seconds cover the trip there and back
+            response = self.session.post(f"{self.url}/scrape", json=body,
+                                         timeout=(self.connect_timeout, self.timeout + 5))
+        except requests.Timeout as e:
+            self._count("timeouts")
+            raise ProviderUnavailable("lens", f"broker did not answer within {self.timeout:.0f}s") from e
+        except requests.RequestException as e:
+            self._count("unreachable")
+            raise ProviderUnavailable("lens", f"broker unreachable: {e}", retry_after=5) from e
+
+        try:
+            data = response.json()
+        except ValueError:
+            data = {"error": response.text[:200]}
+        if response.status_code == 200:
+            self._count("ok")
+            return data["results"], data["title_class"], data.get("page_stats") or {}
+
+        error = data.get("error", f"HTTP {response.status_code}")
+        retry_after = data.get("retry_after")
+        kind = data.get("kind")
+        if kind == "throttled":
+            self._count("errors")
+            raise ProviderThrottled("lens", error, retry_after=retry_after)
+        if kind in ("busy", "unavailable"):
+            self._count("busy")
+            raise ProviderUnavailable("lens", error, retry_after=retry_after or 1)
+        if kind == "timeout":
+            self._count("timeouts")
+            raise ProviderUnavailable("lens", error)
+        self._count("errors")
+        raise Exception(f"Selenium Error: {error}")
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, url=self.url, caller=self.caller)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = BrokerClient(LENS_BROKER_URL)
+    return _client
+
+
+def analyze_with_selenium(image_bytes, imgbb_key, pool=None):
+    """methods.selenium_lens.analyze_with_selenium, with the browser work done by the broker."""
+    with span("upload"):
+        public_url = upload_to_imgbb(image_bytes, imgbb_key)
+    log.info(f"Sending Lens scrape to broker for URL: {public_url}")
+    with span("broker"):
+        results, used_class, page_stats = get_client().scrape(public_url)
+    return format_lens_result(results, used_class, page_stats)
@@ -0,0 +1,293 @@
+"""
+Resumable bulk scanning of a directory or a JSONL manifest of images (`python scrape_lens.py bulk`).
+
+Images are scanned by a thread or process pool through the same pipeline as the server
+(cache, preprocessing, providers), and one JSON line per image is appended to the output
+file as soon as it finishes. The output file is also the checkpoint: on restart, images it
+already lists as "ok" are skipped and failed ones are tried again.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".gif", ".bmp")
+METHODS = ("cloud_vision", "serpapi", "selenium", "ensemble", "auto")
+
+# Throughput for the ETA is measured over this many seconds of recent progress
+RATE_WINDOW = 60
+
+
+# --- Inputs ---
+
+def list_images(source):
+    """Image paths from a directory (recursively, sorted) or a JSONL manifest."""
+    if os.path.isdir(source):
+        paths = []
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            paths.extend(os.path.join(root, name) for name in sorted(files)
+                         if name.lower().endswith(IMAGE_EXTENSIONS))
+        return paths
+    return read_manifest(source)
+
+
+def read_manifest(path):
+    """
+    One image per line, either a JSON string or an object with a "path" (or "image") key.
+    Relative paths are resolved against the manifest's directory.
+    """
+    base = os.path.dirname(os.path.abspath(path))
+    paths = []
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            image_path = entry if isinstance(entry, str) else entry.get("path") or entry.get("image")
+            if not image_path:
+                raise ValueError(f"{path}:{number}: no image path")
+            paths.append(image_path if os.path.isabs(image_path) else os.path.join(base, image_path))
+    return paths
+
+
+# --- Checkpoint ---
+
+def load_finished(output_path):
+    """
+    Paths already scanned successfully according to an earlier run's output. A line cut off
+    by a crash is removed from the file, so the next line is appended cleanly.
+    """
+    finished = set()
+    if not os.path.exists(output_path):
+        return finished
+    with open(output_path, "rb") as f:
+        data = f.read()
+    end = data.rfind(b"\n") + 1
+    if end < len(data):
+        os.truncate(output_path, end)
+    for line in data[:end].splitlines():
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        if record.get("status") == "ok":
+            finished.add(record["path"])
+        else:
+            finished.discard(record.get("path"))
+    return finished
+
+
+# --- Worker ---
+
+_service = None
+
+
+def _load_service():
+    # Imported on first use, so a process pool's workers each build their own cache and pools
+    global _service
+    if _service is None:
+        import scan_service
+        _service = scan_service
+    return _service
+
+
+def scan_file(method, path):
+    """Scans one image file. Never raises: failures become an "error" record."""
+    service = _load_service()
+    from methods.cache import image_digest
+    from methods.telemetry import request_context
+
+    started = time.monotonic()
+    record = {"path": path, "method": method}
+    with request_context():
+        try:
+            with open(path, "rb") as f:
+                image_bytes = f.read()
+            record["digest"] = image_digest(image_bytes)
+            if method == "ensemble":
+                result, cache_status = service.scan_ensemble(image_bytes), "ENSEMBLE"
+            elif method == "auto":
+                result, cache_status = service.scan_auto(image_bytes)
+            else:
+                result, cache_status, _ = service.scan(method, image_bytes)
+            if result.get("success") is False:
+                record.update(status="error", error=result.get("error", "scan failed"))
+            else:
+                record.update(status="ok", cache=cache_status, result=result)
+        except Exception as e:
+            record.update(status="error", error=f"{type(e).__name__}: {e}")
+    record["seconds"] = round(time.monotonic() - started, 3)
+    record["finished_at"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+    return record
+
+
+# --- Progress ---
+
+def _format_duration(seconds):
+    if seconds is None:
+        return "--:--"
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    return f"{hours}:{rest // 60:02d}:{rest % 60:02d}" if hours else f"{rest // 60:02d}:{rest % 60:02d}"
+
+
+class Progress:
+    """Done/total, throughput over the last RATE_WINDOW seconds and ETA, written to stderr."""
+
+    def __init__(self, total, skipped, interval=2.0, stream=sys.stderr):
+        self.total = total
+        self.skipped = skipped
+        self.done = self.ok = self.errors = self.cached = 0
+        self.interval = interval
+        self.stream = stream
+        self.tty = stream.isatty()
+        self.started = time.monotonic()
+        self.samples = deque([(self.started, 0)])
+        self.last_print = 0.0
+
+    def record(self, record):
+        self.done += 1
+        if record["status"] == "ok":
+            self.ok += 1
+            if record.get("cache") in ("HIT", "NEAR"):
+                self.cached += 1
+        else:
+            self.errors += 1
+
+    def rate(self):
+        now = time.monotonic()
+        self.samples.append((now, self.done))
+        while len(self.samples) > 2 and now - self.samples[1][0] > RATE_WINDOW:
+            self.samples.popleft()
+        since, done_then = self.samples[0]
+        return (self.done - done_then) / (now - since) if now > since else 0.0
+
+    def line(self):
+        rate = self.rate()
+        remaining = self.total - self.skipped - self.done
+        eta = remaining / rate if rate > 0 else None
+        position = self.skipped + self.done
+        percent = position / self.total * 100 if self.total else 100.0
+        return (f"{position}/{self.total} ({percent:.1f}%)  ok={self.ok} errors={self.errors} cached={self.cached}"
+                f"  {rate:.2f} img/s  elapsed {_format_duration(time.monotonic() - self.started)}"
+                f"  ETA {_format_duration(eta)}")
+
+    def show(self, force=False):
+        now = time.monotonic()
+        if not force and now - self.last_print < self.interval:
+            return
+        self.last_print = now
+        if self.tty:
+            self.stream.write("\r\033[K" + self.line())
+        else:
+            self.stream.write(self.line() + "\n")
+        self.stream.flush()
+
+    def finish(self):
+        if self.tty:
+            self.show(force=True)
+            self.stream.write("\n")
+        elapsed = time.monotonic() - self.started
+        overall = self.done / elapsed if elapsed > 0 else 0.0
+        self.stream.write(f"Scanned {self.done} images in {_format_duration(elapsed)} ({overall:.2f} img/s):"
+                          f" {self.ok} ok, {self.errors} failed, {self.skipped} already done\n")
+        self.stream.flush()
+
+
+# --- Runner ---
+
+def make_executor(workers, processes):
+    if processes:
+        # spawn: a forked child would inherit this process's threads' locks mid-flight
+        return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=_load_service)
+    return ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bulk")
+
+
+def run(paths, method, output_path, workers=4, processes=False, fsync_interval=5.0, progress=None):
+    """
+    Scans every path not already finished in output_path, appending a record per image.
+    Keeps at most 2 * workers images in flight, so a 50k-image run never queues them all.
+    Returns the Progress with the final counts.
+    """
+    finished = load_finished(output_path)
+    todo = [path for path in paths if path not in finished]
+    progress = progress or Progress(len(paths), len(paths) - len(todo))
+    if not todo:
+        return progress
+
+    if not processes:
+        _load_service()  # once, before worker threads race to import it
+
+    pending = iter(todo)
+    in_flight = set()
+    last_sync = time.monotonic()
+    with open(output_path, "a", encoding="utf-8") as out, make_executor(workers, processes) as executor:
+        try:
+            while True:
+                while len(in_flight) < workers * 2:
+                    path = next(pending, None)
+                    if path is None:
+                        break
+                    in_flight.add(executor.submit(scan_file, method, path))
+                if not in_flight:
+                    break
+
+                done, in_flight = wait(in_flight, timeout=progress.interval, return_when=FIRST_COMPLETED)
+                for future in done:
+                    record = future.result()
+                    out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    progress.record(record)
+                out.flush()
+                if time.monotonic() - last_sync >= fsync_interval:
+                    os.fsync(out.fileno())
+                    last_sync = time.monotonic()
+                progress.show()
+        except KeyboardInterrupt:
+            for future in in_flight:
+                future.cancel()
+            progress.stream.write("\nInterrupted; finished images are saved. Run again to resume.\n")
+            raise
+        finally:
+            out.flush()
+            os.fsync(out.fileno())
+    return progress
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="scrape_lens.py bulk",
+        description="Scan a directory or JSONL manifest of images, resumably, into a JSONL file.")
+    parser.add_argument("source", help="directory of images, or a JSONL manifest of image paths")
+    parser.add_argument("--method", default="cloud_vision", choices=METHODS)
+    parser.add_argument("--output", default="bulk_results.jsonl",
+                        help="JSONL results file; also the checkpoint that a rerun resumes from")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--processes", action="store_true", help="use worker processes instead of threads")
+    parser.add_argument("--progress-interval", type=float, default=2.0, help="seconds between progress lines")
+    args = parser.parse_args(argv)
+
+    # The progress line is the main output; keep INFO logs out of it unless asked for
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+    paths = list_images(args.source)
+    if not paths:
+        print(f"No images found in {args.source}", file=sys.stderr)
+        return 1
+
+    finished = load_finished(args.output)
+    skipped = sum(1 for path in paths if path in finished)
+    print(f"{len(paths)} images, {skipped} already in {args.output}; method={args.method}, "
+          f"{args.workers} {'processes' if args.processes else 'threads'}", file=sys.stderr)
+    progress = Progress(len(paths), skipped, interval=args.progress_interval)
+    try:
+        run(paths, args.method, args.output, workers=args.workers, processes=args.processes, progress=progress)
+    except KeyboardInterrupt:
+        return 130
+    progress.finish()
+    return 1 if progress.errors else 0
@@ -0,0 +1,166 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def image_digest(image_bytes):
+    """Content digest used to identify an uploaded image."""
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+def make_cache_key(digest, method):
+    return f"{method}:{digest}"
+
+
+class ResultCache:
+    """
+    Two-tier cache for scan results.
+
+    Tier 1 is an in-memory LRU bounded by entry count and approximate byte size.
+    Tier 2 is an optional SQLite file that survives restarts, bounded by total bytes.
+    Every entry carries an expiry computed from the per-method TTL.
+    """
+
+    def __init__(self, max_entries=256, max_bytes=32 * 1024 * 1024, db_path=None,
+                 disk_max_bytes=256 * 1024 * 1024, ttls=None, default_ttl=3600):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.disk_max_bytes = disk_max_bytes
+        self.ttls = dict(ttls or {})
+        self.default_ttl = default_ttl
+
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # key -> (expires_at, size, payload)
+        self._memory_bytes = 0
+        self._counters = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "expired": 0,
+            "stores": 0,
+            "evictions": 0,
+            "disk_evictions": 0,
+        }
+
+        self._db = None
+        if db_path:
+            directory = os.path.dirname(db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                " key TEXT PRIMARY KEY,"
+                " payload TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " expires_at REAL NOT NULL,"
+                " last_access REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_results_access ON results(last_access)")
+            self._db.commit()
+
+    def ttl_for(self, method):
+        return self.ttls.get(method, self.default_ttl)
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                expires_at, size, payload = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self._counters["memory_hits"] += 1
+                    return json.loads(payload)
+                self._drop_memory(key)
+                self._counters["expired"] += 1
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT payload, size, expires_at FROM results WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    payload, size, expires_at = row
+                    if expires_at > now:
+                        self._db.execute("UPDATE results SET last_access = ? WHERE key = ?", (now, key))
+                        self._db.commit()
+                        self._put_memory(key, expires_at, size, payload)
+                        self._counters["disk_hits"] += 1
+                        return json.loads(payload)
+                    self._db.execute("DELETE FROM results WHERE key = ?", (key,))
+                    self._db.commit()
+                    self._counters["expired"] += 1
+
+            self._counters["misses"] += 1
+            return None
+
+    def set(self, key, method, result):
+        ttl = self.ttl_for(method)
+        if ttl <= 0:
+            return
+        payload = json.dumps(result)
+        size = len(payload)
+        now = time.time()
+        expires_at = now + ttl
+
+        with self._lock:
+            self._put_memory(key, expires_at, size, payload)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO results (key, payload, size, expires_at, last_access)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    (key, payload, size, expires_at, now),
+                )
+                self._evict_disk(now)
+                self._db.commit()
+            self._counters["stores"] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats["memory_entries"] = len(self._memory)
+            stats["memory_bytes"] = self._memory_bytes
+            if self._db is not None:
+                count, total = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+                stats["disk_entries"] = count
+                stats["disk_bytes"] = total
+        hits = stats["memory_hits"] + stats["disk_hits"]
+        lookups = hits + stats["misses"]
+        stats["hit_ratio"] = round(hits / lookups, 4) if lookups else 0.0
+        return stats
+
+    # --- internals (caller holds self._lock) ---
+
+    def _put_memory(self, key, expires_at, size, payload):
+        if size > self.max_bytes:
+            return
+        if key in self._memory:
+            self._drop_memory(key)
+        self._memory[key] = (expires_at, size, payload)
+        self._memory_bytes += size
+        while self._memory and (len(self._memory) > self.max_entries or self._memory_bytes > self.max_bytes):
+            oldest = next(iter(self._memory))
+            self._drop_memory(oldest)
+            self._counters["evictions"] += 1
+
+    def _drop_memory(self, key):
+        _, size, _ = self._memory.pop(key)
+        self._memory_bytes -= size
+
+    def _evict_disk(self, now):
+        self._db.execute("DELETE FROM results WHERE expires_at <= ?", (now,))
+        (total,) = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()
+        if total <= self.disk_max_bytes:
+            return
+        rows = self._db.execute("SELECT key, size FROM results ORDER BY last_access ASC").fetchall()
+        for key, size in rows:
+            if total <= self.disk_max_bytes:
+                break
+            self._db.execute("DELETE FROM results WHERE key = ?", (key,))
+            total -= size
+            self._counters["disk_evictions"] += 1
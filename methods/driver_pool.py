@@ -0,0 +1,217 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+log = logging.getLogger(__name__)
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class BrokenDriver(Exception):
+    """Raised inside a lease when the browser itself failed: the pool drops it instead of reusing it."""
+
+
+class _PooledDriver:
+    def __init__(self, driver):
+        self.driver = driver
+        self.uses = 0
+        self.created_at = time.time()
+
+
+class DriverPool:
+    """
+    Bounded pool of long-lived Chrome drivers.
+
+    Browsers are pre-warmed by start(), leased one request at a time, health-checked
+    on the way out and in, scrubbed of cookies/storage between leases and recycled
+    after max_uses, when they stop responding or when the lease ends with BrokenDriver.
+    When every browser is busy,
+    lease() waits up to acquire_timeout seconds before raising PoolTimeout.
+    """
+
+    # Origins whose storage is wiped between leases.
+    RESET_ORIGINS = ("https://lens.google.com", "https://www.google.com")
+
+    def __init__(self, factory, size=2, max_uses=20, acquire_timeout=30.0):
+        self.factory = factory
+        self.size = size
+        self.max_uses = max_uses
+        self.acquire_timeout = acquire_timeout
+
+        self._cond = threading.Condition()
+        self._idle = []
+        self._total = 0  # idle + leased + being created
+        self._closed = False
+        self._counters = {
+            "leases": 0,
+            "created": 0,
+            "recycled": 0,
+            "crashed": 0,
+            "timeouts": 0,
+            "waiting": 0,
+            "wait_seconds_total": 0.0,
+            "wait_seconds_max": 0.0,
+        }
+
+    def start(self):
+        """Launch browsers until the pool is full. Safe to call from a background thread."""
+        threads = []
+        for _ in range(self.size):
+            with self._cond:
+                if self._total >= self.size:
+                    break
+                self._total += 1
+            t = threading.Thread(target=self._create_idle, daemon=True)
+            t.start()
+            threads.append(t)
+        for t in threads:
+            t.join()
+
+    @contextmanager
+    def lease(self, timeout=None):
+        timeout = self.acquire_timeout if timeout is None else timeout
+        pooled = self._acquire(timeout)
+        healthy = True
+        try:
+            yield pooled.driver
+        except BrokenDriver:
+            healthy = False
+            raise
+        except Exception:
+            healthy = self._is_alive(pooled.driver)
+            raise
+        finally:
+            self._release(pooled, healthy)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._total -= len(idle)
+            self._cond.notify_all()
+        for pooled in idle:
+            self._quit(pooled.driver)
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._counters)
+            stats["size"] = self.size
+            stats["total"] = self._total
+            stats["idle"] = len(self._idle)
+            stats["in_use"] = self._total - len(self._idle)
+        stats["wait_seconds_avg"] = round(stats["wait_seconds_total"] / stats["leases"], 4) if stats["leases"] else 0.0
+        return stats
+
+    # --- internals ---
+
+    def _acquire(self, timeout):
+        started = time.monotonic()
+        deadline = started + timeout
+        while True:
+            create = False
+            with self._cond:
+                self._counters["waiting"] += 1
+                try:
+                    while not self._idle and self._total >= self.size and not self._closed:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._counters["timeouts"] += 1
+                            raise PoolTimeout(f"No browser available within {timeout:.1f}s (pool size {self.size})")
+                        self._cond.wait(remaining)
+                finally:
+                    self._counters["waiting"] -= 1
+
+                if self._closed:
+                    raise PoolTimeout("Driver pool is closed")
+                if self._idle:
+                    pooled = self._idle.pop()
+                else:
+                    self._total += 1
+                    create = True
+
+            if create:
+                try:
+                    pooled = _PooledDriver(self.factory())
+                except Exception:
+                    self._discard_slot()
+                    raise
+                self._count("created")
+            elif not self._is_alive(pooled.driver):
+                self._count("crashed")
+                self._quit(pooled.driver)
+                self._discard_slot()
+                continue
+
+            waited = time.monotonic() - started
+            with self._cond:
+                self._counters["leases"] += 1
+                self._counters["wait_seconds_total"] += waited
+                self._counters["wait_seconds_max"] = max(self._counters["wait_seconds_max"], waited)
+            pooled.uses += 1
+            return pooled
+
+    def _release(self, pooled, healthy):
+        if healthy and pooled.uses < self.max_uses and not self._closed:
+            healthy = self._reset(pooled.driver)
+            if healthy:
+                with self._cond:
+                    self._idle.append(pooled)
+                    self._cond.notify()
+                return
+
+        if not healthy:
+            self._count("crashed")
+        else:
+            self._count("recycled")
+        self._quit(pooled.driver)
+        self._discard_slot()
+
+    def _create_idle(self):
+        try:
+            pooled = _PooledDriver(self.factory())
+        except Exception as e:
+            log.error(f"Driver pool: failed to launch browser: {e}")
+            self._discard_slot()
+            return
+        self._count("created")
+        with self._cond:
+            self._idle.append(pooled)
+            self._cond.notify()
+
+    def _discard_slot(self):
+        with self._cond:
+            self._total -= 1
+            self._cond.notify()
+
+    def _count(self, name):
+        with self._cond:
+            self._counters[name] += 1
+
+    def _reset(self, driver):
+        try:
+            driver.delete_all_cookies()
+            for origin in self.RESET_ORIGINS:
+                driver.execute_cdp_cmd("Storage.clearDataForOrigin", {"origin": origin, "storageTypes": "all"})
+            driver.get("about:blank")
+            return True
+        except Exception as e:
+            log.warning(f"Driver pool: reset failed, recycling browser: {e}")
+            return False
+
+    @staticmethod
+    def _is_alive(driver):
+        try:
+            driver.current_url
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _quit(driver):
+        try:
+            driver.quit()
+        except Exception:
+            pass
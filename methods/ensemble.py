@@ -0,0 +1,45 @@
+from methods.keywords import extract_keywords
+
+MAX_VISUAL_MATCHES = 20
+
+
+def _match_key(match):
+    link = match.get("link")
+    # Scraped results often have no real link; fall back to the title for those
+    if link and link != "#":
+        return ("link", link.rstrip("/"))
+    return ("title", (match.get("title") or "").strip().lower())
+
+
+def merge_results(results, provider_status):
+    """
+    Merges per-provider results (in priority order) into one response in the usual shape.
+    results is a list of (method, result) for providers that finished in time;
+    provider_status is reported back as-is so the client can see who made the deadline.
+    """
+    best_guesses, seen_guesses = [], set()
+    visual_matches, seen_matches = [], set()
+
+    for _, result in results:
+        for guess in result.get("best_guesses", []):
+            key = guess.strip().lower()
+            if key and key not in seen_guesses:
+                seen_guesses.add(key)
+                best_guesses.append(guess)
+
+        for match in result.get("visual_matches", []):
+            key = _match_key(match)
+            if key not in seen_matches:
+                seen_matches.add(key)
+                visual_matches.append(match)
+
+    return {
+        "success": bool(results),
+        "method": "Ensemble",
+        "best_guesses": best_guesses,
+        "visual_matches": visual_matches[:MAX_VISUAL_MATCHES],
+        # The providers' own scans already added these titles to the TF-IDF corpus
+        "common_keywords": extract_keywords([m['title'] for m in visual_matches if m.get('title')],
+                                            update_corpus=False),
+        "providers": provider_status,
+    }
@@ -1,41 +1,97 @@
+import asyncio
+import contextvars
+import logging
 import os
-from collections import Counter
-import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+from google.api_core.exceptions import TooManyRequests
+from google.auth.credentials import AnonymousCredentials
 from google.cloud import vision
+from methods.keywords import extract_keywords, extract_keywords_batch
+from methods.ratelimit import ProviderThrottled, get_guard
+from methods.telemetry import span
 
-def get_common_words(titles):
-    if not titles:
-        return []
-    STOP_WORDS = {
-        'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by',
-        'is', 'are', 'was', 'were', 'be', 'been', 'buy', 'sell', 'shop', 'online', 'store',
-        'price', 'best', 'review', 'images', 'photos', 'video', 'youtube', 'com', 'www', 'http',
-        'https', 'reddit', 'ebay', 'amazon', 'pinterest', 'twitter', 'facebook', 'instagram',
-        'stuffed', 'animal', 'toy', 'plush', 'soft', 'doll', 'figure', 'figurine', 'new', 'used',
-        'sale', 'free', 'shipping', 'official', 'licensed', 'authentic', 'japan', 'center', 'collection'
-    }
-    all_text = " ".join(titles)
-    cleaned_text = re.sub(r'[^a-zA-Z0-9\s]', '', all_text.lower())
-    words = cleaned_text.split()
-    meaningful_words = [w for w in words if w not in STOP_WORDS and len(w) > 2]
-    word_counts = Counter(meaningful_words)
-    return [{"word": word, "count": count} for word, count in word_counts.most_common(5)]
+log = logging.getLogger(__name__)
 
-def analyze_with_google_cloud(image_bytes, credentials_path):
-    os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = credentials_path
-    client = vision.ImageAnnotatorClient()
-    image = vision.Image(content=image_bytes)
-    
-    print("Method 1: Sending to Google Cloud Vision API...")
-    response = client.web_detection(image=image)
+# Cloud Vision accepts at most 16 images per BatchAnnotateImages call
+BATCH_MAX_IMAGES = 16
+# Keep each batch comfortably under the API's request payload limit
+BATCH_MAX_BYTES = 8 * 1024 * 1024
 
-    if response.error.message:
-        raise Exception(response.error.message)
+# Point the client at a local stand-in (e.g. benchmarks/fakes.py) instead of Google, over REST
+VISION_API_ENDPOINT = os.environ.get("VISION_API_ENDPOINT")
 
-    # Transform to common format
+_client = None
+_client_lock = threading.Lock()
+
+def get_client(credentials_path):
+    """Process-wide ImageAnnotatorClient, so the gRPC channel is set up only once."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                if VISION_API_ENDPOINT:
+                    _client = vision.ImageAnnotatorClient(
+                        transport="rest",
+                        credentials=AnonymousCredentials(),
+                        client_options={"api_endpoint": VISION_API_ENDPOINT},
+                    )
+                else:
+                    os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = credentials_path
+                    _client = vision.ImageAnnotatorClient()
+    return _client
+
+_async_client = None
+# Threads for the sync REST client when the async client cannot reach VISION_API_ENDPOINT
+# (asyncio's default executor has only cpu_count + 4 of them)
+_rest_executor = None
+
+def get_async_client(credentials_path):
+    """
+    Process-wide ImageAnnotatorAsyncClient for the async server (create it inside the event loop).
+    None when VISION_API_ENDPOINT is set but this google-cloud-vision has no asyncio REST transport.
+    """
+    global _async_client, _rest_executor
+    if _async_client is None:
+        if VISION_API_ENDPOINT:
+            try:
+                _async_client = vision.ImageAnnotatorAsyncClient(
+                    transport="rest_asyncio",
+                    credentials=AnonymousCredentials(),
+                    client_options={"api_endpoint": VISION_API_ENDPOINT},
+                )
+            except KeyError:  # only the gRPC transport is async here, and the stand-in speaks REST
+                log.warning("No asyncio REST transport for Cloud Vision; using the REST client in a thread")
+                _rest_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="vision-rest")
+                _async_client = False
+        else:
+            os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = credentials_path
+            _async_client = vision.ImageAnnotatorAsyncClient()
+    return _async_client or None
+
+@contextmanager
+def vision_call():
+    """One call through the "vision" rate limiter; quota errors count as throttling."""
+    with get_guard("vision").call():
+        try:
+            yield
+        except TooManyRequests as e:  # includes RESOURCE_EXHAUSTED (quota)
+            raise ProviderThrottled("vision", e.message) from e
+
+@asynccontextmanager
+async def vision_call_async():
+    async with get_guard("vision").call_async():
+        try:
+            yield
+        except TooManyRequests as e:  # includes RESOURCE_EXHAUSTED (quota)
+            raise ProviderThrottled("vision", e.message) from e
+
+def _transform_web_detection(web_detection):
+    """Returns (result in the common format without keywords, all matching page titles)."""
     visual_matches = []
-    if response.web_detection.pages_with_matching_images:
-        for page in response.web_detection.pages_with_matching_images:
+    if web_detection.pages_with_matching_images:
+        for page in web_detection.pages_with_matching_images:
              visual_matches.append({
                 "title": page.page_title,
                 "link": page.url,
@@ -43,12 +99,107 @@ def analyze_with_google_cloud(image_bytes, credentials_path):
                 "thumbnail": None
             })
 
-    best_guesses = [label.label for label in response.web_detection.best_guess_labels]
+    best_guesses = [label.label for label in web_detection.best_guess_labels]
     
-    return {
+    result = {
         "success": True,
         "method": "Google Cloud Vision",
         "best_guesses": best_guesses,
         "visual_matches": visual_matches[:10],
-        "common_keywords": get_common_words([m['title'] for m in visual_matches])
     }
+    return result, [m['title'] for m in visual_matches]
+
+def format_web_detection(web_detection):
+    # Transform to common format
+    result, titles = _transform_web_detection(web_detection)
+    with span("keywords"):
+        result["common_keywords"] = extract_keywords(titles)
+    return result
+
+def analyze_with_google_cloud(image_bytes, credentials_path):
+    client = get_client(credentials_path)
+    image = vision.Image(content=image_bytes)
+    
+    log.info("Method 1: Sending to Google Cloud Vision API...")
+    with vision_call(), span("provider"):
+        response = client.web_detection(image=image)
+
+    if response.error.message:
+        raise Exception(response.error.message)
+
+    return format_web_detection(response.web_detection)
+
+async def analyze_with_google_cloud_async(image_bytes, credentials_path):
+    client = get_async_client(credentials_path)
+    if client is None:
+        return await asyncio.get_running_loop().run_in_executor(
+            _rest_executor, contextvars.copy_context().run, analyze_with_google_cloud, image_bytes, credentials_path)
+    feature = vision.Feature(type_=vision.Feature.Type.WEB_DETECTION)
+    request = vision.AnnotateImageRequest(image=vision.Image(content=image_bytes), features=[feature])
+
+    log.info("Method 1: Sending to Google Cloud Vision API (async)...")
+    async with vision_call_async():
+        with span("provider"):
+            response = await client.batch_annotate_images(requests=[request])
+    image_response = response.responses[0]
+
+    if image_response.error.message:
+        raise Exception(image_response.error.message)
+
+    return format_web_detection(image_response.web_detection)
+
+def chunk_images(images, max_images=BATCH_MAX_IMAGES, max_bytes=BATCH_MAX_BYTES):
+    """Splits images into batches bounded by image count and total payload size."""
+    batch, batch_bytes = [], 0
+    for image_bytes in images:
+        if batch and (len(batch) >= max_images or batch_bytes + len(image_bytes) > max_bytes):
+            yield batch
+            batch, batch_bytes = [], 0
+        batch.append(image_bytes)
+        batch_bytes += len(image_bytes)
+    if batch:
+        yield batch
+
+def _annotate_batch(client, batch):
+    feature = vision.Feature(type_=vision.Feature.Type.WEB_DETECTION)
+    annotate_requests = [
+        vision.AnnotateImageRequest(image=vision.Image(content=image_bytes), features=[feature])
+        for image_bytes in batch
+    ]
+    with vision_call():
+        response = client.batch_annotate_images(requests=annotate_requests)
+
+    results = []  # (result, titles) pairs; keywords are added by the caller in one batch
+    for image_response in response.responses:
+        if image_response.error.message:
+            results.append(({"success": False, "error": image_response.error.message}, None))
+        else:
+            results.append(_transform_web_detection(image_response.web_detection))
+    return results
+
+def analyze_batch_with_google_cloud(images, credentials_path, max_workers=4):
+    """
+    Runs web detection on many images using batch_annotate_images.
+    Batches are sent concurrently; results come back in the same order as images.
+    A failed batch marks each of its images as failed instead of failing the whole call.
+    """
+    client = get_client(credentials_path)
+    batches = list(chunk_images(images))
+    log.info(f"Method 1: Sending {len(images)} images to Google Cloud Vision API in {len(batches)} batches...")
+
+    pairs = []
+    with span("provider"), ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(_annotate_batch, client, batch) for batch in batches]
+        for batch, future in zip(batches, futures):
+            try:
+                pairs.extend(future.result())
+            except Exception as e:
+                pairs.extend(({"success": False, "error": str(e)}, None) for _ in batch)
+
+    # Score keywords for every image in a single call
+    succeeded = [(result, titles) for result, titles in pairs if titles is not None]
+    with span("keywords"):
+        keywords = extract_keywords_batch([titles for _, titles in succeeded])
+    for (result, _), image_keywords in zip(succeeded, keywords):
+        result["common_keywords"] = image_keywords
+    return [result for result, _ in pairs]
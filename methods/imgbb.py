@@ -0,0 +1,275 @@
+import asyncio
+import hashlib
+import os
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from methods.ratelimit import get_guard
+
+IMGBB_UPLOAD_URL = os.environ.get("IMGBB_UPLOAD_URL", "https://api.imgbb.com/1/upload")
+# Seconds until ImgBB deletes the upload (60 - 15552000). 0 keeps ImgBB's default of never expiring.
+IMGBB_EXPIRATION = int(os.environ.get("IMGBB_EXPIRATION", 0))
+
+# Don't hand out a URL that is about to expire while the provider is still fetching it
+EXPIRY_SAFETY_MARGIN = 120
+
+
+class ImgBBError(Exception):
+    pass
+
+
+class MultipartBody:
+    """
+    multipart/form-data body with a single file field, streamed in chunks straight out of the
+    image buffer (memoryview slices), so the image is never copied into a second full-size body.
+    Can be iterated any number of times, which retries rely on.
+    """
+
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, field, data, filename="image"):
+        boundary = uuid.uuid4().hex
+        self.content_type = f"multipart/form-data; boundary={boundary}"
+        self._parts = (
+            (f"--{boundary}\r\n"
+             f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+             "Content-Type: application/octet-stream\r\n\r\n").encode(),
+            memoryview(data).cast("B"),
+            f"\r\n--{boundary}--\r\n".encode(),
+        )
+
+    def __len__(self):
+        return sum(len(part) for part in self._parts)
+
+    def __iter__(self):
+        for part in self._parts:
+            for offset in range(0, len(part), self.CHUNK_SIZE):
+                yield part[offset:offset + self.CHUNK_SIZE]
+
+    async def aiter_chunks(self):
+        # httpx's AsyncClient only streams async iterables (and wants bytes, not memoryviews)
+        for chunk in self:
+            yield bytes(chunk)
+
+    def headers(self):
+        return {"Content-Type": self.content_type, "Content-Length": str(len(self))}
+
+
+class ImgBBUploader:
+    """
+    ImgBB client shared by every method that needs a public image URL.
+
+    Uses one pooled keep-alive session, retries transient failures with exponential
+    backoff, and remembers content-hash -> URL so an image is only uploaded once for
+    as long as ImgBB keeps it. Every attempt goes through the "imgbb" rate limiter and
+    circuit breaker (methods/ratelimit.py).
+    """
+
+    RETRY_STATUS = {429, 500, 502, 503, 504}
+
+    def __init__(self, upload_url=IMGBB_UPLOAD_URL, expiration=IMGBB_EXPIRATION, timeout=(5, 30),
+                 retries=3, backoff=0.5, pool_size=16, max_cached_urls=10_000):
+        self.upload_url = upload_url
+        self.expiration = expiration
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_cached_urls = max_cached_urls
+        self.guard = get_guard("imgbb")
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._lock = threading.Lock()
+        self._urls = OrderedDict()  # sha256 -> (url, expires_at or None)
+        self._counters = {
+            "uploads": 0,
+            "reused": 0,
+            "retries": 0,
+            "failures": 0,
+            "bytes_uploaded": 0,
+            "latency_seconds_total": 0.0,
+            "latency_seconds_max": 0.0,
+        }
+
+    def upload(self, image_bytes, api_key):
+        """Returns a public URL for image_bytes, uploading only if we don't already have a live one."""
+        digest = hashlib.sha256(image_bytes).hexdigest()
+        cached = self._cached_url(digest)
+        if cached:
+            return cached
+
+        started = time.monotonic()
+        url, expiration = self._post_with_retries(image_bytes, api_key)
+        self._remember(digest, url, expiration, len(image_bytes), time.monotonic() - started)
+        return url
+
+    async def upload_async(self, http_client, image_bytes, api_key):
+        """upload() for the async server, sending through a shared httpx.AsyncClient."""
+        digest = hashlib.sha256(image_bytes).hexdigest()
+        cached = self._cached_url(digest)
+        if cached:
+            return cached
+
+        started = time.monotonic()
+        url, expiration = await self._post_with_retries_async(http_client, image_bytes, api_key)
+        self._remember(digest, url, expiration, len(image_bytes), time.monotonic() - started)
+        return url
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats["cached_urls"] = len(self._urls)
+        stats["latency_seconds_avg"] = round(stats["latency_seconds_total"] / stats["uploads"], 4) if stats["uploads"] else 0.0
+        return stats
+
+    def _cached_url(self, digest):
+        with self._lock:
+            entry = self._urls.get(digest)
+            if entry is None:
+                return None
+            url, expires_at = entry
+            if expires_at is not None and expires_at - time.time() < EXPIRY_SAFETY_MARGIN:
+                del self._urls[digest]
+                return None
+            self._urls.move_to_end(digest)
+            self._counters["reused"] += 1
+            return url
+
+    def _remember(self, digest, url, expiration, size, elapsed):
+        expires_at = time.time() + expiration if expiration else None
+        with self._lock:
+            self._urls[digest] = (url, expires_at)
+            self._urls.move_to_end(digest)
+            while len(self._urls) > self.max_cached_urls:
+                self._urls.popitem(last=False)
+            self._counters["uploads"] += 1
+            self._counters["bytes_uploaded"] += size
+            self._counters["latency_seconds_total"] += elapsed
+            self._counters["latency_seconds_max"] = max(self._counters["latency_seconds_max"], elapsed)
+
+    def _params(self, api_key):
+        params = {"key": api_key}
+        if self.expiration:
+            params["expiration"] = self.expiration
+        return params
+
+    def _backoff_delay(self, attempt):
+        with self._lock:
+            self._counters["retries"] += 1
+        return self.backoff * (2 ** (attempt - 1)) * (1 + random.random() * 0.25)
+
+    @staticmethod
+    def _outcome(status_code):
+        # For the rate limiter: 429 slows ImgBB down, 5xx counts towards opening its circuit
+        if status_code == 429:
+            return "throttled"
+        return "error" if status_code >= 500 else "ok"
+
+    def _parse_response(self, status_code, text, json_body):
+        """Returns (url, expiration), None if the status is worth retrying, or raises ImgBBError."""
+        if status_code in self.RETRY_STATUS:
+            return None
+        if status_code != 200:
+            self._count_failure()
+            raise ImgBBError(f"ImgBB Upload Failed: {text}")
+
+        data = json_body()
+        if not data.get("success"):
+            self._count_failure()
+            raise ImgBBError(f"ImgBB Upload Failed: {data}")
+        expiration = int(data["data"].get("expiration") or 0)
+        return data["data"]["url"], expiration
+
+    def _post_with_retries(self, image_bytes, api_key):
+        body = MultipartBody("image", image_bytes)
+        last_error = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(self._backoff_delay(attempt))
+            probe = self.guard.acquire()
+            try:
+                response = self.session.post(
+                    self.upload_url, params=self._params(api_key), data=body, headers=body.headers(),
+                    timeout=self.timeout)
+            except requests.RequestException as e:
+                self.guard.record("error", probe)
+                last_error = f"ImgBB Upload Exception: {e}"
+                continue
+            except BaseException:
+                self.guard.record(None, probe)
+                raise
+            self.guard.record(self._outcome(response.status_code), probe)
+
+            parsed = self._parse_response(response.status_code, response.text, response.json)
+            if parsed:
+                return parsed
+            last_error = f"ImgBB Upload HTTP Error: {response.status_code}"
+
+        self._count_failure()
+        raise ImgBBError(last_error or "ImgBB Upload Failed")
+
+    async def _post_with_retries_async(self, http_client, image_bytes, api_key):
+        import httpx  # only needed by the async server
+
+        body = MultipartBody("image", image_bytes)
+        last_error = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                await asyncio.sleep(self._backoff_delay(attempt))
+            probe = await self.guard.acquire_async()
+            try:
+                response = await http_client.post(
+                    self.upload_url, params=self._params(api_key), content=body.aiter_chunks(), headers=body.headers(),
+                    timeout=httpx.Timeout(self.timeout[1], connect=self.timeout[0]))
+            except httpx.HTTPError as e:
+                self.guard.record("error", probe)
+                last_error = f"ImgBB Upload Exception: {e}"
+                continue
+            except BaseException:
+                self.guard.record(None, probe)
+                raise
+            self.guard.record(self._outcome(response.status_code), probe)
+
+            parsed = self._parse_response(response.status_code, response.text, response.json)
+            if parsed:
+                return parsed
+            last_error = f"ImgBB Upload HTTP Error: {response.status_code}"
+
+        self._count_failure()
+        raise ImgBBError(last_error or "ImgBB Upload Failed")
+
+    def _count_failure(self):
+        with self._lock:
+            self._counters["failures"] += 1
+
+
+_uploader = None
+_uploader_lock = threading.Lock()
+
+
+def get_uploader():
+    global _uploader
+    if _uploader is None:
+        with _uploader_lock:
+            if _uploader is None:
+                _uploader = ImgBBUploader()
+    return _uploader
+
+
+def upload_to_imgbb(image_bytes, api_key):
+    """Uploads image_bytes with the shared uploader and returns its public URL (raises ImgBBError)."""
+    return get_uploader().upload(image_bytes, api_key)
+
+
+async def upload_to_imgbb_async(http_client, image_bytes, api_key):
+    """Async variant of upload_to_imgbb; shares the URL cache and stats with it."""
+    return await get_uploader().upload_async(http_client, image_bytes, api_key)
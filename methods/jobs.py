@@ -0,0 +1,189 @@
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, wait
+
+TERMINAL_STATUSES = ("done", "failed", "timeout")
+
+
+class QueueFull(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, method, payload):
+        self.id = uuid.uuid4().hex
+        self.method = method
+        self.payload = payload
+        self.status = "queued"
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.error = None
+
+    def to_dict(self):
+        data = {
+            "job_id": self.id,
+            "method": self.method,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+        if self.status == "done":
+            data["result"] = self.result
+        elif self.error:
+            data["error"] = self.error
+        return data
+
+
+class JobManager:
+    """
+    Runs slow scans in the background so HTTP requests can return immediately.
+
+    submit() enqueues a job (bounded queue, raises QueueFull when saturated), a fixed set
+    of worker threads call runner(method, **payload), and clients read the outcome with
+    get() or block on wait() for long-polling. Each runner call gets its own thread; the worker
+    waits for it at most job_timeout seconds, then reports the job as "timeout" and moves on
+    to the next one. The late result is dropped, and the call is counted as "hung" until it
+    returns. Hung calls still count against `workers`: while that many calls are alive, no
+    new job is started (the queue fills up and submit() raises QueueFull). Finished jobs are kept for `retention` seconds, and at most max_retained of them
+    are kept; they are evicted every evict_interval seconds, whether or not new jobs come in.
+    """
+
+    def __init__(self, runner, workers=2, max_queue=100, job_timeout=120, retention=600, max_retained=1000,
+                 evict_interval=30):
+        self.runner = runner
+        self.workers = workers
+        self.job_timeout = job_timeout
+        self.retention = retention
+        self.max_retained = max_retained
+        self.evict_interval = evict_interval
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._jobs = OrderedDict()  # job id -> Job, in submission order
+        self._cond = threading.Condition()
+        self._counters = {"submitted": 0, "rejected": 0, "done": 0, "failed": 0, "timeout": 0, "evicted": 0}
+        self._hung = set()  # runner calls of timed-out jobs that have not returned yet
+        self._live_calls = 0  # runner calls started and not returned, hung ones included
+
+        self._workers = [
+            threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True) for i in range(workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+        threading.Thread(target=self._evict_periodically, name="job-evictor", daemon=True).start()
+
+    def submit(self, method, **payload):
+        job = Job(method, payload)
+        with self._cond:
+            self._evict()
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                self._counters["rejected"] += 1
+                raise QueueFull(f"Job queue is full ({self._queue.maxsize} jobs waiting)")
+            self._jobs[job.id] = job
+            self._counters["submitted"] += 1
+        return job
+
+    def get(self, job_id):
+        with self._cond:
+            return self._jobs.get(job_id)
+
+    def wait(self, job_id, timeout):
+        """Blocks until the job reaches a terminal status or timeout seconds pass (long-poll)."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                job = self._jobs.get(job_id)
+                if job is None:
+                    return None
+                remaining = deadline - time.monotonic()
+                if job.status in TERMINAL_STATUSES or remaining <= 0:
+                    return job
+                self._cond.wait(remaining)
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._counters)
+            stats["queued"] = self._queue.qsize()
+            stats["running"] = sum(1 for job in self._jobs.values() if job.status == "running")
+            stats["retained"] = len(self._jobs)
+            stats["hung"] = len(self._hung)
+            stats["live_calls"] = self._live_calls
+        return stats
+
+    # --- internals ---
+
+    def _work(self):
+        while True:
+            with self._cond:
+                # A hung call still holds a browser or a connection; wait until one returns
+                while self._live_calls >= self.workers:
+                    self._cond.wait()
+            job = self._queue.get()
+            with self._cond:
+                job.status = "running"
+                job.started_at = time.time()
+                self._cond.notify_all()
+            call = self._start_call(job)
+            done, _ = wait([call], timeout=self.job_timeout)
+
+            with self._cond:
+                job.payload = None  # release the image bytes
+                job.finished_at = time.time()
+                if not done:
+                    job.status = "timeout"
+                    job.error = f"Job exceeded {self.job_timeout}s"
+                    if not call.done():  # else it returned just now and has already been counted off
+                        self._hung.add(call)
+                elif call.exception() is None:
+                    job.status, job.result = "done", call.result()
+                else:
+                    job.status, job.error = "failed", str(call.exception())
+                self._counters[job.status] += 1
+                self._cond.notify_all()
+
+    def _start_call(self, job):
+        # A provider call that hangs holds this thread, not the worker
+        call = Future()
+        method, payload = job.method, job.payload
+        with self._cond:
+            self._live_calls += 1
+        call.add_done_callback(self._call_returned)
+
+        def run():
+            try:
+                call.set_result(self.runner(method, **payload))
+            except Exception as e:
+                call.set_exception(e)
+
+        threading.Thread(target=run, name=f"job-call-{job.id[:8]}", daemon=True).start()
+        return call
+
+    def _call_returned(self, call):
+        with self._cond:
+            self._live_calls -= 1
+            self._hung.discard(call)
+            self._cond.notify_all()
+
+    def _evict_periodically(self):
+        while True:
+            time.sleep(self.evict_interval)
+            with self._cond:
+                self._evict()
+
+    def _evict(self):
+        # caller holds self._cond
+        now = time.time()
+        finished = [job for job in self._jobs.values() if job.status in TERMINAL_STATUSES]
+        overflow = len(finished) - self.max_retained
+        for job in finished:
+            if now - job.finished_at > self.retention or overflow > 0:
+                del self._jobs[job.id]
+                overflow -= 1
+                self._counters["evicted"] += 1
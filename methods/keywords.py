@@ -0,0 +1,206 @@
+import itertools
+import math
+from operator import itemgetter
+import os
+import re
+import string
+import threading
+import unicodedata
+from collections import Counter
+
+DEFAULT_STOP_WORDS = frozenset({
+    'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by',
+    'is', 'are', 'was', 'were', 'be', 'been', 'buy', 'sell', 'shop', 'online', 'store',
+    'price', 'best', 'review', 'images', 'photos', 'video', 'youtube', 'com', 'www', 'http',
+    'https', 'reddit', 'ebay', 'amazon', 'pinterest', 'twitter', 'facebook', 'instagram',
+    'stuffed', 'animal', 'toy', 'plush', 'soft', 'doll', 'figure', 'figurine', 'new', 'used',
+    'sale', 'free', 'shipping', 'official', 'licensed', 'authentic', 'japan', 'center', 'collection'
+})
+
+# Runs of letters/digits in any script (\w minus underscore)
+_TOKEN_RE = re.compile(r"[^\W_]+")
+# Scripts without spaces between words, where short tokens still carry meaning
+_CJK_RE = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff66-\uff9f]")
+
+# Pure-ASCII titles (the common case) skip Unicode handling: punctuation -> space, then split
+_ASCII_PUNCTUATION = str.maketrans({c: " " for c in string.punctuation})
+
+
+def _accent_table():
+    # Precomposed Latin letters -> base letters, e.g. 'é' -> 'e'. Only Latin blocks are covered,
+    # so Japanese (han)dakuten and other scripts are left alone.
+    table = {}
+    for codepoint in itertools.chain(range(0x00C0, 0x0250), range(0x1E00, 0x1F00)):
+        char = chr(codepoint)
+        base = "".join(c for c in unicodedata.normalize("NFKD", char) if not unicodedata.combining(c))
+        if base and base != char:
+            table[codepoint] = base
+    return table
+
+
+_STRIP_ACCENTS = _accent_table()
+# str.translate with a dict looks up every character; a regex only stops at the accented ones
+_ACCENTED_RE = re.compile("[" + "".join(re.escape(chr(c)) for c in sorted(_STRIP_ACCENTS)) + "]")
+
+
+def _strip_accent(match):
+    return _STRIP_ACCENTS[ord(match.group())]
+
+
+def normalize(text):
+    """
+    Folds full-width/compatibility characters, Latin accents and case, so that
+    'ＰＯＫＥＭＯＮ', 'Pokémon' and 'pokemon' all count as the same word.
+    """
+    return _ACCENTED_RE.sub(_strip_accent, unicodedata.normalize("NFKC", text)).casefold()
+
+
+# Separates title lists in the joined text of a batch; matched as its own token by _BATCH_TOKEN_RE
+_LIST_BREAK = "\x00"
+_BATCH_TOKEN_RE = re.compile(r"[^\W_]+|\x00")
+
+
+def load_stop_words(path=None, extra=None):
+    stop_words = set(DEFAULT_STOP_WORDS)
+    if path:
+        with open(path, encoding="utf-8") as f:
+            stop_words.update(normalize(line.strip()) for line in f if line.strip() and not line.startswith("#"))
+    if extra:
+        stop_words.update(normalize(w.strip()) for w in extra if w.strip())
+    return frozenset(stop_words)
+
+
+class KeywordCorpus:
+    """Document frequencies over past title lists, updated incrementally for TF-IDF scoring."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.documents = 0
+        self.document_frequency = Counter()
+
+    def add(self, terms):
+        """Adds one document given its set of distinct terms."""
+        with self._lock:
+            self.documents += 1
+            self.document_frequency.update(terms)
+
+    def add_many(self, term_sets):
+        with self._lock:
+            for terms in term_sets:
+                self.documents += 1
+                self.document_frequency.update(terms)
+
+    def idf(self, term):
+        # Smoothed idf; unseen terms get the highest weight
+        return math.log((1 + self.documents) / (1 + self.document_frequency.get(term, 0))) + 1
+
+
+class KeywordExtractor:
+    """
+    Picks the most telling words out of a list of result titles.
+
+    With a corpus, words are ranked by TF-IDF against past scans, so words that show up
+    in every result set (e.g. 'pokemon' on a Pokémon shop) sink below the specific ones.
+    Without one they are ranked by raw count, like before.
+    """
+
+    def __init__(self, stop_words=DEFAULT_STOP_WORDS, min_length=3, top_n=5, corpus=None):
+        self.stop_words = frozenset(stop_words)
+        self.min_length = min_length
+        self.top_n = top_n
+        self.corpus = corpus
+
+    def tokenize(self, titles):
+        ascii_titles, other_titles = [], []
+        for title in titles:
+            if title:
+                (ascii_titles if title.isascii() else other_titles).append(title)
+
+        tokens = " ".join(ascii_titles).lower().translate(_ASCII_PUNCTUATION).split()
+        if other_titles:
+            tokens += _TOKEN_RE.findall(normalize(" ".join(other_titles)))
+        return [w for w in tokens if self._keep(w)]
+
+    def _keep(self, word):
+        return word not in self.stop_words and (
+            len(word) >= self.min_length or (not word.isascii() and _CJK_RE.search(word) is not None))
+
+    def _count_lists(self, title_lists):
+        """
+        Word counts for each list of titles. Lowercasing, punctuation and Unicode normalization
+        run once over the text of all lists joined together, and stop words and short words
+        are dropped from the distinct words rather than checked token by token.
+        """
+        ascii_texts, other_texts = [], []
+        for titles in title_lists:
+            ascii_titles, other_titles = [], []
+            for title in titles or ():
+                if title:
+                    (ascii_titles if title.isascii() else other_titles).append(title)
+            ascii_texts.append(" ".join(ascii_titles).replace(_LIST_BREAK, " "))
+            other_texts.append(" ".join(other_titles).replace(_LIST_BREAK, " "))
+
+        # Pure-ASCII titles (the common case) skip Unicode handling: punctuation -> space, then split
+        ascii_text = _LIST_BREAK.join(ascii_texts).lower().translate(_ASCII_PUNCTUATION)
+        counts_list = [Counter(chunk.split()) for chunk in ascii_text.split(_LIST_BREAK)]
+
+        if any(other_texts):
+            tokens = _BATCH_TOKEN_RE.findall(normalize(_LIST_BREAK.join(other_texts)))
+            start = 0
+            for counts in counts_list:
+                try:
+                    end = tokens.index(_LIST_BREAK, start)
+                except ValueError:
+                    end = len(tokens)
+                if end > start:
+                    counts.update(tokens[start:end])
+                start = end + 1
+
+        keep = self._keep
+        # Dict order is first occurrence, as with counting the filtered tokens
+        return [{w: c for w, c in counts.items() if keep(w)} for counts in counts_list]
+
+    def extract(self, titles, top_n=None, update_corpus=True):
+        """Returns [{"word", "count"}] (plus "score" when TF-IDF is on) for the top words in titles."""
+        if not titles:
+            return []
+        return self.extract_batch([titles], top_n, update_corpus)[0]
+
+    def extract_batch(self, title_lists, top_n=None, update_corpus=True):
+        """extract() for many title lists at once: one tokenizing pass and one corpus update."""
+        counts_list = self._count_lists(title_lists)
+        if update_corpus and self.corpus is not None:
+            self.corpus.add_many(counts.keys() for titles, counts in zip(title_lists, counts_list) if titles)
+        n = top_n or self.top_n
+        return [self._rank(counts, n) if titles else [] for titles, counts in zip(title_lists, counts_list)]
+
+    def _rank(self, counts, top_n):
+        if self.corpus is None:
+            # Same order as counts.most_common(top_n), without its Python-level heap
+            top = sorted(counts.items(), key=itemgetter(1), reverse=True)[:top_n]
+            return [{"word": word, "count": count} for word, count in top]
+        idf = self.corpus.idf
+        scored = sorted(((count * idf(word), count, word) for word, count in counts.items()), reverse=True)
+        return [{"word": word, "count": count, "score": round(score, 3)} for score, count, word in scored[:top_n]]
+
+
+# --- Default extractor, configured from the environment ---
+# KEYWORD_STOP_WORDS_FILE: extra stop words, one per line
+# KEYWORD_EXTRA_STOP_WORDS: extra stop words, comma separated
+# KEYWORD_TFIDF=1: rank by TF-IDF against the titles of past scans
+default_extractor = KeywordExtractor(
+    stop_words=load_stop_words(
+        os.environ.get("KEYWORD_STOP_WORDS_FILE"),
+        os.environ.get("KEYWORD_EXTRA_STOP_WORDS", "").split(","),
+    ),
+    min_length=int(os.environ.get("KEYWORD_MIN_LENGTH", 3)),
+    corpus=KeywordCorpus() if os.environ.get("KEYWORD_TFIDF", "0") == "1" else None,
+)
+
+
+def extract_keywords(titles, top_n=5, update_corpus=True):
+    return default_extractor.extract(titles, top_n, update_corpus)
+
+
+def extract_keywords_batch(title_lists, top_n=5):
+    return default_extractor.extract_batch(title_lists, top_n)
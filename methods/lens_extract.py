@@ -0,0 +1,338 @@
+"""
+Pulls visual matches out of a Google Lens results page.
+
+Google renames the CSS class on result titles from time to time. The class currently in use
+is kept in a SelectorRegistry: a small versioned JSON file on disk, shared by every worker
+process. When a page yields no results, recalibration runs on a background thread and the
+registry is updated for the next request, so a scan never waits on it.
+"""
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import lxml.html
+
+from methods.keywords import extract_keywords
+from methods.telemetry import span
+
+log = logging.getLogger(__name__)
+
+try:
+    import fcntl  # cross-process file locks (not available on Windows)
+except ImportError:
+    fcntl = None
+
+DEFAULT_TITLE_CLASS = "Yt787"
+
+# Where the learned selector is stored; shared by all workers pointing at the same file
+REGISTRY_PATH = os.environ.get("LENS_SELECTOR_REGISTRY", "cache/lens_selectors.json")
+# Page saved for inspection whenever extraction comes back empty
+FAILED_PAGE_PATH = os.environ.get("LENS_FAILED_PAGE_PATH", "debug_lens_failed.html")
+
+# Titles are only looked for in the part of the page between the first and last element
+# carrying the class; this is how far back we look for the <a> that wraps the first one.
+_ANCHOR_LOOKBACK = 4000
+
+# Google's "unusual traffic" interstitial (served at /sorry/... instead of the results)
+_BLOCKED_PAGE_RE = re.compile(r"""id=["']captcha-form["']|detected unusual traffic""")
+
+_TITLE_XPATH = "//*[contains(concat(' ', normalize-space(@class), ' '), $cls)]"
+_CALIBRATION_TAGS = ("div", "span", "h3", "a")
+
+
+class SelectorRegistry:
+    """
+    The title class currently in use plus a version number, persisted as JSON.
+
+    current() is cheap: the file is only re-read when its mtime changes, which is how
+    an update made by another process is picked up. update() is a compare-and-set on the
+    version, done under a thread lock plus an flock on "<path>.lock", so two workers that
+    recalibrate at the same time do not overwrite each other.
+    """
+
+    def __init__(self, path=REGISTRY_PATH, default_class=DEFAULT_TITLE_CLASS):
+        self.path = path
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._state = {"version": 0, "title_class": default_class, "updated_at": None, "history": []}
+
+    def current(self):
+        """Returns (version, title_class)."""
+        with self._lock:
+            self._reload()
+            return self._state["version"], self._state["title_class"]
+
+    def update(self, title_class, expected_version):
+        """
+        Stores title_class if the registry is still at expected_version.
+        Returns the (version, title_class) in effect afterwards.
+        """
+        with self._lock, self._file_lock():
+            self._reload(force=True)
+            state = self._state
+            if state["version"] == expected_version and state["title_class"] != title_class:
+                history = state["history"] + [{"title_class": state["title_class"], "version": state["version"]}]
+                self._state = {
+                    "version": state["version"] + 1,
+                    "title_class": title_class,
+                    "updated_at": time.time(),
+                    "history": history[-10:],
+                }
+                self._write()
+            return self._state["version"], self._state["title_class"]
+
+    def stats(self):
+        with self._lock:
+            self._reload()
+            return {
+                "path": self.path,
+                "version": self._state["version"],
+                "title_class": self._state["title_class"],
+                "updated_at": self._state["updated_at"],
+            }
+
+    # --- internals (caller holds self._lock) ---
+
+    def _reload(self, force=False):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if not force and mtime == self._mtime:
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError) as e:
+            log.warning(f"Selector registry: could not read {self.path} ({e}), keeping '{self._state['title_class']}'")
+            return
+        if state.get("title_class"):
+            self._state.update(state)
+        self._mtime = mtime
+
+    def _write(self):
+        # Write to a temp file and rename, so readers never see a half-written file
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".lens_selectors.")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(self._state, f, indent=2)
+        os.replace(tmp_path, self.path)
+        self._mtime = os.stat(self.path).st_mtime_ns
+
+    def _file_lock(self):
+        return _FileLock(self.path + ".lock")
+
+
+class _FileLock:
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._file = open(self.path, "a")
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+
+
+def _class_attr_re(title_class):
+    return re.compile(r"""class\s*=\s*["'][^"']*\b%s\b""" % re.escape(title_class))
+
+
+def _result_region(html, title_class):
+    """
+    Returns the slice of html holding every element with title_class (plus the <a> around
+    the first one), or None if the class does not appear at all. Lens pages are mostly
+    inline scripts, so this is much smaller than the page.
+    """
+    matches = list(_class_attr_re(title_class).finditer(html))
+    if not matches:
+        return None
+    first, last = matches[0].start(), matches[-1].end()
+
+    start = html.rfind("<", 0, first)
+    anchor = html.rfind("<a ", max(0, start - _ANCHOR_LOOKBACK), start)
+    if anchor != -1:
+        start = anchor
+
+    end = html.find("</a>", last)
+    end = len(html) if end == -1 else end + len("</a>")
+    return html[start:end]
+
+
+def is_blocked_page(html, url=None):
+    """True if Google answered with a CAPTCHA / unusual-traffic page instead of results."""
+    if url and "/sorry/" in url:
+        return True
+    return _BLOCKED_PAGE_RE.search(html) is not None
+
+
+def extract_results(html, title_class):
+    """Returns the visual matches found under title_class, in the same shape as before."""
+    region = _result_region(html, title_class)
+    if region is None:
+        return []
+
+    root = lxml.html.fragment_fromstring(region, create_parent="div")
+    results = []
+    for element in root.xpath(_TITLE_XPATH, cls=f" {title_class} "):
+        title = "".join(text.strip() for text in element.itertext())
+        if not title:
+            continue
+        anchor = next(element.iterancestors("a"), None)
+        link = anchor.get("href", "#") if anchor is not None else "#"
+        results.append({
+            "title": title,
+            "link": link,
+            "source": "Google Lens (Scraped)",
+            "thumbnail": None
+        })
+    return results
+
+
+def detect_title_class(html, expected_text):
+    """
+    Finds the elements whose text contains expected_text (case-insensitive)
+    and returns the most common class name among them.
+    """
+    root = lxml.html.fromstring(html)
+    needle = expected_text.casefold()
+
+    class_counts = Counter()
+    for text in root.xpath("//body//text()"):
+        if not text.is_text or needle not in text.casefold():
+            continue
+        parent = text.getparent()
+        if parent is not None and parent.tag in _CALIBRATION_TAGS:
+            class_counts.update(parent.get("class", "").split())
+
+    if not class_counts:
+        return None
+    return class_counts.most_common(1)[0][0]
+
+
+def format_lens_result(results, title_class, page_stats):
+    """The /scan result for scraped Lens matches, wherever the browser ran."""
+    with span("keywords"):
+        keywords = extract_keywords([m['title'] for m in results])
+
+    return {
+        "success": True,
+        "method": "Selenium Scraping",
+        # Lens pages have no best guess of their own; these are the top keywords of the titles
+        "best_guesses": [k['word'] for k in keywords[:2]] if keywords else [],
+        "best_guess_source": "keywords",
+        "visual_matches": results,
+        "common_keywords": keywords,
+        "debug_info": f"Class used: {title_class}",
+        "page_ready": page_stats or None
+    }
+
+
+class LensExtractor:
+    """
+    Extracts results with the registry's current class. An empty page schedules a single
+    background recalibration per registry version instead of re-parsing in the request.
+    """
+
+    def __init__(self, registry, failed_page_path=FAILED_PAGE_PATH):
+        self.registry = registry
+        self.failed_page_path = failed_page_path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="lens-calibrate")
+        self._lock = threading.Lock()
+        self._pending_versions = set()
+        self._counters = {"pages": 0, "empty_pages": 0, "recalibrations": 0,
+                          "recalibrations_changed": 0, "recalibrations_failed": 0}
+        self._parse_seconds = 0.0
+
+    def title_class(self):
+        return self.registry.current()[1]
+
+    def extract(self, html, expected_text=None):
+        """Returns (results, title_class, registry_version)."""
+        version, title_class = self.registry.current()
+        start = time.perf_counter()
+        results = extract_results(html, title_class)
+        elapsed = time.perf_counter() - start
+
+        with self._lock:
+            self._counters["pages"] += 1
+            self._parse_seconds += elapsed
+            if not results:
+                self._counters["empty_pages"] += 1
+
+        if not results and expected_text:
+            log.warning(f"No elements found with class '{title_class}'. Scheduling recalibration...")
+            self.schedule_recalibration(html, expected_text, version)
+        return results, title_class, version
+
+    def schedule_recalibration(self, html, expected_text, version):
+        with self._lock:
+            if version in self._pending_versions:
+                return None
+            self._pending_versions.add(version)
+            self._counters["recalibrations"] += 1
+        return self._executor.submit(self._recalibrate, html, expected_text, version)
+
+    def close(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            pages = stats["pages"]
+            stats["avg_parse_ms"] = round(self._parse_seconds / pages * 1000, 3) if pages else None
+            stats["recalibrations_pending"] = len(self._pending_versions)
+        stats["registry"] = self.registry.stats()
+        return stats
+
+    def _recalibrate(self, html, expected_text, version):
+        try:
+            # Save HTML for inspection
+            if self.failed_page_path:
+                try:
+                    with open(self.failed_page_path, "w", encoding="utf-8") as f:
+                        f.write(html)
+                except OSError as e:
+                    log.warning(f"Could not save {self.failed_page_path}: {e}")
+
+            log.info(f"Attempting to auto-detect class using expected text: '{expected_text}'")
+            new_class = detect_title_class(html, expected_text)
+            if not new_class:
+                log.warning(f"Expected text '{expected_text}' NOT FOUND in page source.")
+                with self._lock:
+                    self._counters["recalibrations_failed"] += 1
+                return None
+
+            new_version, current_class = self.registry.update(new_class, version)
+            if new_version != version:
+                log.info(f"Calibration Successful! Title class is now '{current_class}' (v{new_version})")
+                with self._lock:
+                    self._counters["recalibrations_changed"] += 1
+            return current_class
+        except Exception as e:
+            log.exception(f"Recalibration Error: {e}")
+            with self._lock:
+                self._counters["recalibrations_failed"] += 1
+            return None
+        finally:
+            with self._lock:
+                self._pending_versions.discard(version)
+
+
+selector_registry = SelectorRegistry()
+lens_extractor = LensExtractor(selector_registry)
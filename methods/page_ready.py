@@ -0,0 +1,100 @@
+import os
+import threading
+import time
+from collections import Counter, deque
+
+from selenium.common.exceptions import TimeoutException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+
+# Ceiling for how long we wait for Lens to render (replaces the old fixed 5s sleep)
+READY_TIMEOUT = float(os.environ.get("LENS_READY_TIMEOUT", 10))
+# How long the DOM must stay unchanged before we consider the page settled
+QUIET_PERIOD = float(os.environ.get("LENS_QUIET_PERIOD", 1.0))
+
+# Installs a MutationObserver that timestamps the latest DOM change.
+_INSTALL_OBSERVER_JS = """
+if (!window.__readyObserver) {
+    window.__lastMutation = performance.now();
+    window.__readyObserver = new MutationObserver(function () {
+        window.__lastMutation = performance.now();
+    });
+    window.__readyObserver.observe(document, {childList: true, subtree: true, attributes: true, characterData: true});
+}
+"""
+
+# Milliseconds since the latest DOM change, or null while the document is still loading. The
+# observer is installed again first if it is gone: a redirect or client-side navigation after
+# driver.get() replaces the window, and without it the page would never count as quiet.
+_QUIET_MS_JS = _INSTALL_OBSERVER_JS + """
+if (document.readyState !== 'complete') { return null; }
+return performance.now() - window.__lastMutation;
+"""
+
+
+class ReadinessLog:
+    """Rolling record of time-to-ready per request, so the timeouts can be tuned."""
+
+    def __init__(self, maxlen=500):
+        self._lock = threading.Lock()
+        self._samples = deque(maxlen=maxlen)  # (seconds, reason)
+
+    def record(self, seconds, reason):
+        with self._lock:
+            self._samples.append((seconds, reason))
+
+    def stats(self):
+        with self._lock:
+            samples = list(self._samples)
+        if not samples:
+            return {"count": 0}
+        durations = sorted(s for s, _ in samples)
+
+        def pct(p):
+            return round(durations[min(len(durations) - 1, int(len(durations) * p / 100))], 3)
+
+        return {
+            "count": len(samples),
+            "p50_seconds": pct(50),
+            "p95_seconds": pct(95),
+            "max_seconds": round(durations[-1], 3),
+            "reasons": dict(Counter(r for _, r in samples)),
+        }
+
+
+readiness_log = ReadinessLog()
+
+
+def wait_for_results(driver, result_selector, timeout=None, quiet_period=None, poll_frequency=0.1):
+    """
+    Blocks until the page is ready to be parsed, whichever comes first:
+      - "results":   an element matching result_selector (CSS) is present
+      - "quiescent": the document is loaded and the DOM has not mutated for quiet_period seconds
+      - "timeout":   the timeout ceiling was hit
+    Returns (reason, seconds_waited) and records it in readiness_log.
+    """
+    timeout = READY_TIMEOUT if timeout is None else timeout
+    quiet_ms = (QUIET_PERIOD if quiet_period is None else quiet_period) * 1000
+    started = time.monotonic()
+
+    try:
+        driver.execute_script(_INSTALL_OBSERVER_JS)
+    except Exception:
+        pass  # Still usable: the selector check does not need the observer
+
+    def ready(d):
+        if result_selector and d.find_elements(By.CSS_SELECTOR, result_selector):
+            return "results"
+        idle_ms = d.execute_script(_QUIET_MS_JS)
+        if idle_ms is not None and idle_ms >= quiet_ms:
+            return "quiescent"
+        return False
+
+    try:
+        reason = WebDriverWait(driver, timeout, poll_frequency=poll_frequency).until(ready)
+    except TimeoutException:
+        reason = "timeout"
+
+    elapsed = time.monotonic() - started
+    readiness_log.record(elapsed, reason)
+    return reason, elapsed
@@ -0,0 +1,124 @@
+import io
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+HASH_BITS = 64
+
+# Below this spread of grey levels (over the downscaled image) a picture is treated as flat:
+# solid colours all hash to 0, so they would otherwise "match" each other.
+MIN_PIXEL_STD = 2.0
+
+# Weights used to pack a row of 64 booleans into a single integer in one dot product.
+_BIT_WEIGHTS = (1 << np.arange(HASH_BITS - 1, -1, -1, dtype=np.uint64)).astype(np.uint64)
+
+
+if hasattr(int, "bit_count"):
+    def _popcount(value):
+        return value.bit_count()
+else:  # Python < 3.10
+    def _popcount(value):
+        return bin(value).count("1")
+
+
+def hamming_distance(a, b):
+    return _popcount(a ^ b)
+
+
+def dhash(image_bytes, hash_size=8):
+    """
+    64-bit difference hash of an image.
+    Returns None if the bytes cannot be decoded as an image, or if the image is too flat
+    (e.g. a solid colour) for its hash to tell it apart from other flat images.
+    """
+    try:
+        img = Image.open(io.BytesIO(image_bytes))
+        # For JPEGs this lets the decoder skip most of the DCT work on large camera shots.
+        img.draft("L", (hash_size * 8, hash_size * 8))
+        img = img.convert("L").resize((hash_size + 1, hash_size), Image.Resampling.BILINEAR)
+    except Exception:
+        return None
+
+    pixels = np.asarray(img, dtype=np.int16)
+    if pixels.std() < MIN_PIXEL_STD:
+        return None
+    bits = (pixels[:, 1:] > pixels[:, :-1]).ravel().astype(np.uint64)
+    return int(bits @ _BIT_WEIGHTS)
+
+
+class HashIndex:
+    """
+    Multi-index Hamming lookup for 64-bit perceptual hashes.
+
+    The hash is split into max_distance + 1 chunks. By the pigeonhole principle any
+    stored hash within max_distance of the query matches it exactly on at least one
+    chunk, so only those buckets have to be verified instead of the whole index.
+    """
+
+    def __init__(self, max_distance=4, max_entries=200_000):
+        self.max_distance = max_distance
+        self.max_entries = max_entries
+
+        num_chunks = max_distance + 1
+        base, extra = divmod(HASH_BITS, num_chunks)
+        self._chunks = []  # (shift, mask) per chunk
+        shift = HASH_BITS
+        for i in range(num_chunks):
+            width = base + (1 if i < extra else 0)
+            shift -= width
+            self._chunks.append((shift, (1 << width) - 1))
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # value -> hash, insertion ordered for FIFO eviction
+        self._buckets = [dict() for _ in self._chunks]  # chunk value -> set of stored values
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, hash_value, value):
+        with self._lock:
+            if value in self._entries:
+                self._remove(value)
+            self._entries[value] = hash_value
+            for (shift, mask), buckets in zip(self._chunks, self._buckets):
+                buckets.setdefault((hash_value >> shift) & mask, set()).add(value)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def discard(self, value):
+        with self._lock:
+            if value in self._entries:
+                self._remove(value)
+
+    def lookup(self, hash_value, max_distance=None):
+        """Returns (distance, value) of the closest stored hash, or None if none is close enough."""
+        limit = self.max_distance if max_distance is None else min(max_distance, self.max_distance)
+        best = None
+        with self._lock:
+            seen = set()
+            for (shift, mask), buckets in zip(self._chunks, self._buckets):
+                candidates = buckets.get((hash_value >> shift) & mask)
+                if not candidates:
+                    continue
+                for value in candidates:
+                    if value in seen:
+                        continue
+                    seen.add(value)
+                    distance = _popcount(self._entries[value] ^ hash_value)
+                    if distance <= limit and (best is None or distance < best[0]):
+                        best = (distance, value)
+                        if distance == 0:
+                            return best
+        return best
+
+    def _remove(self, value):
+        hash_value = self._entries.pop(value)
+        for (shift, mask), buckets in zip(self._chunks, self._buckets):
+            key = (hash_value >> shift) & mask
+            bucket = buckets.get(key)
+            if bucket is not None:
+                bucket.discard(value)
+                if not bucket:
+                    del buckets[key]
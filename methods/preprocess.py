@@ -0,0 +1,82 @@
+import io
+import logging
+import threading
+
+from PIL import Image, ImageOps
+
+log = logging.getLogger(__name__)
+
+
+class PreprocessStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {
+            "images": 0,
+            "reencoded": 0,
+            "fast_path": 0,
+            "kept_original": 0,
+            "errors": 0,
+            "bytes_in": 0,
+            "bytes_out": 0,
+        }
+
+    def record(self, outcome, bytes_in, bytes_out):
+        with self._lock:
+            self._counters["images"] += 1
+            self._counters[outcome] += 1
+            self._counters["bytes_in"] += bytes_in
+            self._counters["bytes_out"] += bytes_out
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+        stats["bytes_saved"] = stats["bytes_in"] - stats["bytes_out"]
+        return stats
+
+
+preprocess_stats = PreprocessStats()
+
+
+def normalize_image(image_bytes, max_dimension=1600, quality=85, min_bytes=300 * 1024):
+    """
+    Shrinks an upload before it goes over the wire:
+    applies the EXIF orientation, downscales to max_dimension, drops EXIF/ICC metadata
+    and re-encodes as JPEG at the given quality.
+
+    Images smaller than min_bytes that already fit max_dimension are passed through untouched
+    (fast path), and the original is kept whenever re-encoding would not make it smaller.
+    Returns (bytes_to_send, info) where info has the outcome and original/sent byte counts.
+    """
+    original_size = len(image_bytes)
+
+    def done(outcome, data):
+        preprocess_stats.record(outcome, original_size, len(data))
+        return data, {"outcome": outcome, "original_bytes": original_size, "sent_bytes": len(data)}
+
+    try:
+        img = Image.open(io.BytesIO(image_bytes))
+        if original_size < min_bytes and max(img.size) <= max_dimension:
+            return done("fast_path", image_bytes)
+
+        # Let the JPEG decoder downscale by a power of two while decoding
+        img.draft("RGB", (max_dimension, max_dimension))
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
+
+        if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+            background = Image.new("RGB", img.size, (255, 255, 255))
+            background.paste(img, mask=img.convert("RGBA").split()[-1])
+            img = background
+        elif img.mode != "RGB":
+            img = img.convert("RGB")
+
+        out = io.BytesIO()
+        img.save(out, format="JPEG", quality=quality)  # no exif= argument, so metadata is dropped
+        data = out.getvalue()
+    except Exception as e:
+        log.warning(f"Preprocess skipped: {e}")
+        return done("errors", image_bytes)
+
+    if len(data) >= original_size:
+        return done("kept_original", image_bytes)
+    return done("reencoded", data)
@@ -0,0 +1,119 @@
+"""
+Registry of scan methods (providers) and lazy loading of their modules.
+
+A provider's module, and with it its heavy dependencies (google-cloud-vision, serpapi,
+selenium and undetected_chromedriver), is imported the first time the method is used,
+not when the server starts. SCAN_METHODS limits which methods a deployment offers;
+the others are never imported. PROVIDERS_PRELOAD=1 imports the enabled ones at startup
+instead, so the first request does not pay for the import.
+"""
+import importlib
+import logging
+import os
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+# --- PROVIDER CONFIG ---
+ALL_METHODS = ("cloud_vision", "serpapi", "selenium")
+SCAN_METHODS = [m.strip() for m in os.environ.get("SCAN_METHODS", ",".join(ALL_METHODS)).split(",") if m.strip()]
+PROVIDERS_PRELOAD = os.environ.get("PROVIDERS_PRELOAD", "0") == "1"
+
+
+class Provider:
+    """
+    One scan method: the module that implements it, the API keys it needs (environment
+    variable names) and run(module, image_bytes), which calls into that module.
+    """
+
+    def __init__(self, name, module, run, keys=(), enabled=True):
+        self.name = name
+        self.module_name = module
+        self.run = run
+        self.keys = tuple(keys)
+        self.enabled = enabled
+        self._module = None
+        self._lock = threading.Lock()
+        self.import_seconds = None
+        self.loaded_at = None
+        self.error = None
+
+    @property
+    def loaded(self):
+        return self._module is not None
+
+    def load(self):
+        """Imports the provider's module once; later calls return it without locking."""
+        module = self._module
+        if module is not None:
+            return module
+        with self._lock:
+            if self._module is None:
+                started = time.perf_counter()
+                try:
+                    module = importlib.import_module(self.module_name)
+                except Exception as e:
+                    self.error = f"{type(e).__name__}: {e}"
+                    raise
+                self.import_seconds = time.perf_counter() - started
+                self.loaded_at = time.time()
+                self.error = None
+                self._module = module
+                log.info(f"Loaded provider {self.name} ({self.module_name}) in {self.import_seconds:.2f}s")
+            return self._module
+
+    def missing_keys(self):
+        return [key for key in self.keys if not os.environ.get(key)]
+
+    def __call__(self, image_bytes):
+        return self.run(self.load(), image_bytes)
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "loaded": self.loaded,
+            "import_seconds": round(self.import_seconds, 3) if self.import_seconds is not None else None,
+            "loaded_at": self.loaded_at,
+            "missing_keys": self.missing_keys(),
+            "error": self.error,
+        }
+
+
+class ProviderRegistry:
+    def __init__(self, enabled=SCAN_METHODS):
+        self.enabled_names = list(enabled)
+        self._providers = {}
+
+    def register(self, name, module, run, keys=()):
+        provider = Provider(name, module, run, keys, enabled=name in self.enabled_names)
+        self._providers[name] = provider
+        return provider
+
+    def get(self, name):
+        """The provider for a method name, or None if there is no such method."""
+        return self._providers.get(name)
+
+    def is_enabled(self, name):
+        provider = self._providers.get(name)
+        return provider is not None and provider.enabled
+
+    def enabled(self):
+        return [name for name, provider in self._providers.items() if provider.enabled]
+
+    def loaded(self):
+        return [name for name, provider in self._providers.items() if provider.loaded]
+
+    def load(self, name):
+        return self._providers[name].load()
+
+    def preload(self):
+        """Imports every enabled provider now; a provider that fails to import is logged and skipped."""
+        for name in self.enabled():
+            try:
+                self.load(name)
+            except Exception as e:
+                log.error(f"Could not load provider {name}: {e}")
+
+    def stats(self):
+        return {name: provider.stats() for name, provider in self._providers.items()}
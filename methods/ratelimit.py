@@ -0,0 +1,290 @@
+"""
+Per-provider rate limiting, adaptive backoff and circuit breaking.
+
+Every call to ImgBB, SerpApi, Cloud Vision or Google Lens first takes a token from that
+provider's bucket. When a provider pushes back (HTTP 429, a CAPTCHA page) its rate is
+halved and new calls pause for an exponentially growing backoff; successful calls raise
+the rate back step by step. After BREAKER_FAILURES errors in a row the provider's
+circuit opens and calls fail at once with ProviderUnavailable instead of piling up, until
+a single probe call succeeds. Callers that would wait longer than RATE_MAX_WAIT for a
+token, or arrive when RATE_MAX_QUEUE are already waiting, are turned away the same way.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+
+log = logging.getLogger(__name__)
+
+PROVIDERS = ("imgbb", "serpapi", "vision", "lens")
+
+# --- RATE LIMIT CONFIG ---
+# Requests per second per provider (0 = no limit; backoff and the breaker still apply).
+# Bursts up to one second's worth (RATE_BURST_<PROVIDER>) are let through at once.
+DEFAULT_RATES = {"imgbb": 10, "serpapi": 10, "vision": 30, "lens": 1}
+RATE_MAX_WAIT = float(os.environ.get("RATE_MAX_WAIT", 10))  # longest a call may wait for a token
+RATE_MAX_QUEUE = int(os.environ.get("RATE_MAX_QUEUE", 100))  # callers waiting per provider
+THROTTLE_BACKOFF = float(os.environ.get("THROTTLE_BACKOFF", 1))  # first pause after a 429/CAPTCHA
+THROTTLE_MAX_BACKOFF = float(os.environ.get("THROTTLE_MAX_BACKOFF", 60))
+BREAKER_FAILURES = int(os.environ.get("BREAKER_FAILURES", 5))
+BREAKER_RESET = float(os.environ.get("BREAKER_RESET", 30))  # seconds open before a probe
+BREAKER_MAX_RESET = float(os.environ.get("BREAKER_MAX_RESET", 300))
+
+# After a slowdown, each successful call gives back this fraction of the configured rate
+RECOVERY_STEP = 0.1
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class ProviderUnavailable(Exception):
+    """The provider is not being called right now (circuit open, or too busy to wait for)."""
+
+    def __init__(self, provider, message, retry_after=None):
+        super().__init__(f"{provider}: {message}")
+        self.provider = provider
+        self.retry_after = retry_after
+
+
+class ProviderThrottled(ProviderUnavailable):
+    """Raised by provider code when the provider pushed back (HTTP 429, CAPTCHA page)."""
+
+
+class ProviderGuard:
+    def __init__(self, name, rate=0, burst=None, max_wait=RATE_MAX_WAIT, max_queue=RATE_MAX_QUEUE,
+                 backoff=THROTTLE_BACKOFF, max_backoff=THROTTLE_MAX_BACKOFF,
+                 failure_threshold=BREAKER_FAILURES, reset_timeout=BREAKER_RESET, max_reset_timeout=BREAKER_MAX_RESET):
+        self.name = name
+        self.rate = rate
+        self.burst = burst or max(1, rate)
+        self.max_wait = max_wait
+        self.max_queue = max_queue
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+
+        self._cond = threading.Condition()
+        self._current_rate = rate
+        self._min_rate = rate / 32 if rate else 0.1
+        self._tokens = float(self.burst)
+        self._refilled_at = time.monotonic()
+        self._paused_until = 0.0
+        self._throttle_streak = 0
+        self._state = CLOSED
+        self._open_until = 0.0
+        self._next_reset_timeout = reset_timeout
+        self._consecutive_failures = 0
+        self._probe_in_flight = False
+        self._granted = deque()  # when calls were let through in the last second
+        self._waiting = 0
+        self._in_flight = 0
+        self._counters = {"ok": 0, "throttled": 0, "error": 0, "shed": 0, "rejected_open": 0}
+
+    @classmethod
+    def from_env(cls, name):
+        key = name.upper()
+        rate = float(os.environ.get(f"RATE_LIMIT_{key}", DEFAULT_RATES.get(name, 0)))
+        burst = float(os.environ.get(f"RATE_BURST_{key}", 0)) or None
+        return cls(name, rate=rate, burst=burst)
+
+    # --- Acquiring ---
+
+    def acquire(self):
+        """
+        Blocks until the call may go ahead and returns a ticket for record(). Raises
+        ProviderUnavailable right away when the circuit is open or the wait would be too long.
+        """
+        deadline = time.monotonic() + self.max_wait
+        with self._cond:
+            self._enter_queue()
+            try:
+                while True:
+                    now = time.monotonic()
+                    delay, probe = self._try_acquire(now)
+                    if delay <= 0:
+                        self._in_flight += 1
+                        return probe
+                    self._check_wait(now, delay, deadline)
+                    self._cond.wait(delay)
+            finally:
+                self._waiting -= 1
+
+    async def acquire_async(self):
+        """acquire() for the event loop: waits with asyncio.sleep instead of blocking the thread."""
+        deadline = time.monotonic() + self.max_wait
+        with self._cond:
+            self._enter_queue()
+        try:
+            while True:
+                with self._cond:
+                    now = time.monotonic()
+                    delay, probe = self._try_acquire(now)
+                    if delay <= 0:
+                        self._in_flight += 1
+                        return probe
+                    self._check_wait(now, delay, deadline)
+                # Wake up now and then, in case a throttle signal changed the schedule
+                await asyncio.sleep(min(delay, 0.25))
+        finally:
+            with self._cond:
+                self._waiting -= 1
+
+    def _enter_queue(self):
+        if self._waiting >= self.max_queue:
+            self._counters["shed"] += 1
+            raise ProviderUnavailable(self.name, f"too many calls waiting ({self._waiting})", retry_after=1)
+        self._waiting += 1
+
+    def _check_wait(self, now, delay, deadline):
+        if now + delay > deadline:
+            self._counters["shed"] += 1
+            raise ProviderUnavailable(self.name, f"rate limited, next slot in {delay:.1f}s", retry_after=delay)
+
+    def _try_acquire(self, now):
+        """Returns (seconds to wait, is half-open probe). Caller holds the lock."""
+        if self._state == OPEN:
+            if now < self._open_until:
+                self._counters["rejected_open"] += 1
+                raise ProviderUnavailable(self.name, "circuit open", retry_after=self._open_until - now)
+            self._state = HALF_OPEN
+            log.info(f"{self.name}: circuit half-open, sending a probe")
+        if self._state == HALF_OPEN:
+            if self._probe_in_flight:
+                self._counters["rejected_open"] += 1
+                raise ProviderUnavailable(self.name, "circuit half-open, probe in flight", retry_after=1)
+            self._probe_in_flight = True
+            return 0.0, True
+
+        if now < self._paused_until:
+            return self._paused_until - now, False
+        if self._current_rate:
+            self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self._current_rate)
+            self._refilled_at = now
+            if self._tokens < 1:
+                return (1 - self._tokens) / self._current_rate, False
+            self._tokens -= 1
+        self._granted.append(now)
+        while now - self._granted[0] > 1:
+            self._granted.popleft()
+        return 0.0, False
+
+    # --- Recording outcomes ---
+
+    def record(self, outcome, probe=False):
+        """
+        Reports how an acquired call went: "ok", "throttled", "error", or None when it ended
+        for a reason that says nothing about the provider's health.
+        """
+        now = time.monotonic()
+        with self._cond:
+            self._in_flight -= 1
+            if probe:
+                self._probe_in_flight = False
+            if outcome:
+                self._counters[outcome] += 1
+            if outcome == "ok":
+                self._on_success()
+            elif outcome in ("throttled", "error"):
+                self._on_failure(now, throttled=outcome == "throttled")
+            self._cond.notify_all()
+
+    def _on_success(self):
+        self._consecutive_failures = 0
+        self._throttle_streak = 0
+        if self._state != CLOSED:
+            log.info(f"{self.name}: circuit closed")
+            self._state = CLOSED
+            self._next_reset_timeout = self.reset_timeout
+        if self._current_rate and self._current_rate != self.rate:
+            step = (self.rate or self._current_rate) * RECOVERY_STEP
+            self._current_rate = min(self.rate or float("inf"), self._current_rate + step)
+
+    def _on_failure(self, now, throttled):
+        # Throttling is handled by slowing down; only errors (or a failed probe) open the circuit
+        if throttled:
+            self._slow_down(now)
+        else:
+            self._consecutive_failures += 1
+        if self._state == HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+            self._state = OPEN
+            self._open_until = now + self._next_reset_timeout
+            log.warning(f"{self.name}: circuit open for {self._next_reset_timeout:.1f}s"
+                        f" after {self._consecutive_failures} failures")
+            self._next_reset_timeout = min(self.max_reset_timeout, self._next_reset_timeout * 2)
+
+    def _slow_down(self, now):
+        # Calls already in flight when the first 429 came back report more of them; slow down once per pause
+        if now < self._paused_until:
+            return
+        self._throttle_streak += 1
+        pause = min(self.max_backoff, self.backoff * 2 ** (self._throttle_streak - 1))
+        self._paused_until = now + pause
+        # Without a configured limit, start from what got through in the last second
+        rate = self._current_rate or len(self._granted)
+        self._current_rate = max(self._min_rate, rate / 2)
+        # Start refilling from empty once the pause is over, not with a burst
+        self._tokens = 0.0
+        self._refilled_at = self._paused_until
+        log.warning(f"{self.name}: throttled by provider, pausing {pause:.1f}s, rate now {self._current_rate:.2f}/s")
+
+    @staticmethod
+    def _outcome(error):
+        if error is None:
+            return "ok"
+        if isinstance(error, ProviderThrottled):
+            return "throttled"
+        if isinstance(error, ProviderUnavailable):
+            return None  # another provider's guard turned the call away
+        return "error"
+
+    @contextmanager
+    def call(self):
+        """acquire() + record(): an exception inside the block counts as a failed call."""
+        probe = self.acquire()
+        try:
+            yield
+        except BaseException as e:
+            self.record(self._outcome(e) if isinstance(e, Exception) else None, probe)
+            raise
+        self.record("ok", probe)
+
+    @asynccontextmanager
+    async def call_async(self):
+        probe = await self.acquire_async()
+        try:
+            yield
+        except BaseException as e:
+            self.record(self._outcome(e) if isinstance(e, Exception) else None, probe)
+            raise
+        self.record("ok", probe)
+
+    def stats(self):
+        now = time.monotonic()
+        with self._cond:
+            return {
+                "state": self._state,
+                "circuit_open": self._state != CLOSED,
+                "open_for_seconds": round(max(0.0, self._open_until - now), 1) if self._state == OPEN else 0.0,
+                "rate_limit": self.rate,
+                "current_rate": round(self._current_rate, 3),
+                "paused_for_seconds": round(max(0.0, self._paused_until - now), 1),
+                "consecutive_failures": self._consecutive_failures,
+                "waiting": self._waiting,
+                "in_flight": self._in_flight,
+                "calls": dict(self._counters),
+            }
+
+
+guards = {name: ProviderGuard.from_env(name) for name in PROVIDERS}
+
+
+def get_guard(name):
+    return guards[name]
+
+
+def guard_stats():
+    return {name: guard.stats() for name, guard in guards.items()}
@@ -0,0 +1,176 @@
+"""
+Encoding of scan responses: serializer, content-hash ETags, compression and compact fields.
+
+Bodies are serialized with orjson when it is installed (the json module otherwise), with
+sorted keys like Flask's jsonify, so the same result always gives the same bytes. The ETag
+is a hash of those bytes: a client holding a result sends it back as If-None-Match and
+gets an empty 304 instead of the body. Together with GET /scan/<digest> this lets a client
+that already scanned an image revalidate its copy without uploading the image again.
+
+Bodies of RESPONSE_COMPRESS_MIN_BYTES or more are compressed with the first encoding in
+RESPONSE_ENCODINGS the client accepts; brotli is only offered when the brotli package is
+installed. The ETag is weak (W/"..."): it names the content, whatever the encoding.
+
+fields=compact leaves out the diagnostic fields (debug_info, page_ready, providers, tiers,
+...) and keeps only the title and link of each visual match. The shape is a subset of the
+full one, so code reading full results reads compact ones too.
+"""
+import gzip
+import hashlib
+import json
+import os
+import threading
+
+try:
+    import orjson  # several times faster than json on result-sized payloads
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# --- RESPONSE CONFIG ---
+RESPONSE_COMPRESS_MIN_BYTES = int(os.environ.get("RESPONSE_COMPRESS_MIN_BYTES", 1024))  # smaller bodies go as is
+RESPONSE_ENCODINGS = [e.strip() for e in os.environ.get("RESPONSE_ENCODINGS", "br,gzip").split(",") if e.strip()]
+RESPONSE_GZIP_LEVEL = int(os.environ.get("RESPONSE_GZIP_LEVEL", 6))
+RESPONSE_BROTLI_QUALITY = int(os.environ.get("RESPONSE_BROTLI_QUALITY", 5))
+
+# What fields=compact keeps: these top-level fields, and these fields of each visual match
+COMPACT_FIELDS = ("success", "error", "method", "filename", "best_guesses", "visual_matches", "common_keywords",
+                  "confidence")
+COMPACT_MATCH_FIELDS = ("title", "link")
+
+
+def dumps(data):
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+def compact(result):
+    out = {field: result[field] for field in COMPACT_FIELDS if field in result}
+    if out.get("visual_matches"):
+        out["visual_matches"] = [{field: match.get(field) for field in COMPACT_MATCH_FIELDS}
+                                 for match in out["visual_matches"]]
+    return out
+
+
+def select_fields(data, fields=None):
+    """data as the client asked for it (fields=compact or the full thing); data is never modified."""
+    if fields != "compact":
+        return data
+    if "results" in data:
+        # A /scan/batch body: compact each result, keep the counts
+        return dict(data, results=[compact(result) for result in data["results"]])
+    return compact(data)
+
+
+def etag(body):
+    return 'W/"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match, tag):
+    """If-None-Match comparison (weak: the W/ prefix is ignored on both sides)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = tag[2:] if tag.startswith("W/") else tag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if (candidate[2:] if candidate.startswith("W/") else candidate) == opaque:
+            return True
+    return False
+
+
+def available_encodings():
+    return [e for e in RESPONSE_ENCODINGS if e == "gzip" or (e == "br" and brotli is not None)]
+
+
+def choose_encoding(accept_encoding):
+    """The first of our encodings the client accepts (q > 0), or None to send the body as is."""
+    accepted = {}
+    for item in (accept_encoding or "").split(","):
+        name, _, params = item.partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        if name.strip():
+            accepted[name.strip().lower()] = quality
+    for encoding in available_encodings():
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+def compress(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=RESPONSE_BROTLI_QUALITY)
+    # mtime=0 keeps the output the same for the same body
+    return gzip.compress(body, compresslevel=RESPONSE_GZIP_LEVEL, mtime=0)
+
+
+class ResponseStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {
+            "responses": 0,
+            "not_modified": 0,
+            "compact": 0,
+            "digest_hits": 0,
+            "digest_misses": 0,
+            "bytes_raw": 0,
+            "bytes_sent": 0,
+        }
+        self._encodings = {}
+
+    def count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def record(self, encoding, bytes_raw, bytes_sent, not_modified=False, compact=False):
+        with self._lock:
+            self._counters["responses"] += 1
+            self._counters["not_modified"] += 1 if not_modified else 0
+            self._counters["compact"] += 1 if compact else 0
+            self._counters["bytes_raw"] += bytes_raw
+            self._counters["bytes_sent"] += bytes_sent
+            if encoding:
+                self._encodings[encoding] = self._encodings.get(encoding, 0) + 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters, encodings=dict(self._encodings))
+        stats["bytes_saved"] = stats["bytes_raw"] - stats["bytes_sent"]
+        stats["serializer"] = "orjson" if orjson is not None else "json"
+        stats["available_encodings"] = available_encodings()
+        return stats
+
+
+response_stats = ResponseStats()
+
+
+def encode(data, accept_encoding=None, if_none_match=None, fields=None):
+    """
+    Serializes data for a response. Returns (status, body, headers): 304 with an empty body
+    when If-None-Match already names this content, 200 otherwise.
+    """
+    body = dumps(select_fields(data, fields))
+    tag = etag(body)
+    headers = {"ETag": tag, "Vary": "Accept-Encoding", "Cache-Control": "no-cache"}
+    if etag_matches(if_none_match, tag):
+        response_stats.record(None, len(body), 0, not_modified=True, compact=fields == "compact")
+        return 304, b"", headers
+
+    raw_size = len(body)
+    encoding = choose_encoding(accept_encoding) if raw_size >= RESPONSE_COMPRESS_MIN_BYTES else None
+    if encoding:
+        body = compress(body, encoding)
+        headers["Content-Encoding"] = encoding
+    response_stats.record(encoding, raw_size, len(body), compact=fields == "compact")
+    return 200, body, headers
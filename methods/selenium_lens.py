@@ -1,184 +1,225 @@
+import json
+import logging
 import os
 import time
 import urllib.parse
-import requests
-from bs4 import BeautifulSoup
 import undetected_chromedriver as uc
-from collections import Counter
-import re
 from dotenv import load_dotenv
+from selenium.common.exceptions import WebDriverException
+from methods.driver_pool import BrokenDriver
+from methods.page_ready import wait_for_results
+from methods.imgbb import upload_to_imgbb, ImgBBError
+from methods.lens_extract import format_lens_result, is_blocked_page, lens_extractor
+from methods.ratelimit import ProviderThrottled, get_guard
+from methods.telemetry import span
 
-# We store the "found" class here to persist it across requests (if the server stays alive)
-DETECTED_TITLE_CLASS = "Yt787" 
-
-def get_common_words(titles):
-    if not titles:
-        return []
-    STOP_WORDS = {
-        'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by',
-        'is', 'are', 'was', 'were', 'be', 'been', 'buy', 'sell', 'shop', 'online', 'store',
-        'price', 'best', 'review', 'images', 'photos', 'video', 'youtube', 'com', 'www', 'http',
-        'https', 'reddit', 'ebay', 'amazon', 'pinterest', 'twitter', 'facebook', 'instagram',
-        'stuffed', 'animal', 'toy', 'plush', 'soft', 'doll', 'figure', 'figurine', 'new', 'used',
-        'sale', 'free', 'shipping', 'official', 'licensed', 'authentic', 'japan', 'center', 'collection'
-    }
-    all_text = " ".join(titles)
-    cleaned_text = re.sub(r'[^a-zA-Z0-9\s]', '', all_text.lower())
-    words = cleaned_text.split()
-    meaningful_words = [w for w in words if w not in STOP_WORDS and len(w) > 2]
-    word_counts = Counter(meaningful_words)
-    return [{"word": word, "count": count} for word, count in word_counts.most_common(5)]
-
-def analyze_with_selenium(image_bytes, imgbb_key):
+log = logging.getLogger(__name__)
+
+# Lens "search by image URL" page; can point at a local stand-in for load testing
+LENS_UPLOAD_URL = os.environ.get("LENS_UPLOAD_URL", "https://lens.google.com/uploadbyurl")
+
+# Headless Chrome gets blocked by Google more often; keep the visible window unless told otherwise
+HEADLESS = os.environ.get("SELENIUM_HEADLESS", "0") == "1"
+
+# --- BROWSER PROFILE CONFIG ---
+# "lean" blocks what we never read from the results page (images, fonts, media, trackers),
+# turns off the GPU and extensions and uses a smaller window. "default" is the original setup.
+SELENIUM_PROFILE = os.environ.get("SELENIUM_PROFILE", "default")
+LEAN_WINDOW_SIZE = os.environ.get("SELENIUM_LEAN_WINDOW_SIZE", "1024,768")
+# URL patterns for CDP Network.setBlockedURLs ("*" is a wildcard); extend with SELENIUM_BLOCKED_URLS
+LEAN_BLOCKED_URLS = [
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.avif", "*.svg", "*.ico",
+    "*.woff", "*.woff2", "*.ttf", "*.otf",
+    "*.mp4", "*.webm", "*.mp3",
+    "*encrypted-tbn*", "*googleusercontent.com/*",  # result thumbnails
+    "*/gen_204*", "*/client_204*", "*/log?*", "*google-analytics.com*", "*googletagmanager.com*",
+    "*doubleclick.net*",
+] + [p.strip() for p in os.environ.get("SELENIUM_BLOCKED_URLS", "").split(",") if p.strip()]
+# Chrome's performance log (how requests and bytes transferred are measured) costs CPU and memory
+# on every page; the lean profile always keeps it, the default profile only when this is on.
+MEASURE_NETWORK = os.environ.get("SELENIUM_MEASURE_NETWORK", "0") == "1"
+
+def analyze_with_selenium(image_bytes, imgbb_key, pool=None):
     IMGBB_KEY = imgbb_key
     
     # 1. Upload
-    public_url = upload_to_imgbb(image_bytes, IMGBB_KEY)
-    if not public_url:
-        raise Exception("Failed to upload image to ImgBB")
+    with span("upload"):
+        public_url = upload_to_imgbb(image_bytes, IMGBB_KEY)
     
     # 2. Scrape
-    print(f"Scraping Lens for URL: {public_url}")
-    # TEMPORARY: Set headless=False so the user can see/solve CAPTCHAs for their screenshot
-    results, used_class = scrape_google_lens_selenium(public_url, headless=False)
-    
-    keywords = get_common_words([m['title'] for m in results])
-
-    return {
-        "success": True,
-        "method": "Selenium Scraping",
-        "best_guesses": [k['word'] for k in keywords[:2]] if keywords else [],
-        "visual_matches": results,
-        "common_keywords": keywords,
-        "debug_info": f"Class used: {used_class}"
-    }
-
-def upload_to_imgbb(image_bytes, api_key):
-    upload_url = "https://api.imgbb.com/1/upload"
-    try:
-        files = {'image': image_bytes}
-        params = {'key': api_key}
-        response = requests.post(upload_url, params=params, files=files)
-        
-        if response.status_code == 200:
-            data = response.json()
-            if data['success']:
-                return data['data']['url']
-    except Exception as e:
-        print(f"ImgBB Upload Exception: {e}")
-    return None
+    results, used_class, page_stats = scrape_lens(public_url, pool)
+    return format_lens_result(results, used_class, page_stats)
 
-def detect_dynamic_class(soup, expected_text="Charmander"):
+def scrape_lens(public_url, pool=None):
     """
-    Searches the soup for elements containing expected_text.
-    Returns the most common class name among them.
+    Scrapes Lens for an already uploaded image under the "lens" guard.
+    Returns (results, title class, page_stats); a CAPTCHA page or a browser error raises.
     """
-    print(f"Attemping to auto-detect class using expected text: '{expected_text}'")
-    
-    # Find all elements containing the text (case-insensitive)
-    elements = soup.find_all(string=re.compile(expected_text, re.IGNORECASE))
-    
-    if not elements:
-        print(f"Debug: Expected text '{expected_text}' NOT FOUND in page source.")
-        return None
+    log.info(f"Scraping Lens for URL: {public_url}")
+    if pool is None:
+        return _scrape_guarded(public_url)
+    # Reuse a warm browser from the pool instead of paying Chrome startup per request. The
+    # lease comes first: no free browser (PoolTimeout) is our own contention, not a Lens
+    # failure, and must not count toward the "lens" circuit breaker.
+    with pool.lease() as driver:
+        return _scrape_guarded(public_url, driver)
 
-    class_counts = Counter()
-    
-    for text_node in elements:
-        parent = text_node.parent
-        if parent and parent.name in ['div', 'span', 'h3', 'a']:
-            classes = parent.get('class')
-            if classes:
-                for cls in classes:
-                    class_counts[cls] += 1
-    
-    if class_counts:
-        best_class = class_counts.most_common(1)[0][0]
-        print(f"Detected potential title class: '{best_class}'")
-        return best_class
-    
-    return None
+def _scrape_guarded(public_url, driver=None):
+    page_stats = {}
+    with get_guard("lens").call():
+        # Without a driver a fresh browser is launched (and quit) for this one page
+        results, used_class = scrape_google_lens_selenium(
+            public_url, headless=HEADLESS, driver=driver, page_stats=page_stats)
+        # Report these instead of returning an empty result, so the "lens" guard backs off
+        if page_stats.get("blocked"):
+            raise ProviderThrottled("lens", "Google served a CAPTCHA page")
+        if page_stats.get("error"):
+            raise Exception(f"Selenium Error: {page_stats['error']}")
+    return results, used_class, page_stats
 
-def scrape_google_lens_selenium(image_url, headless=True, expected_text="Charmander"):
-    global DETECTED_TITLE_CLASS
-    results = []
-    
-    print(f"Initializing Undetected Chrome Driver (Headless={headless})...")
+def create_driver(headless=True, profile=None, measure_network=None):
+    profile = profile or SELENIUM_PROFILE
+    if measure_network is None:
+        measure_network = profile == "lean" or MEASURE_NETWORK
+    log.info(f"Initializing Undetected Chrome Driver (Headless={headless}, profile={profile})...")
     options = uc.ChromeOptions()
     if headless:
         options.add_argument("--headless=new")
     # else:
     #     options.add_argument("--start-maximized") # Removed to reduce intrusiveness
 
-    options.add_argument("--window-size=1920,1080")
+    if profile == "lean":
+        options.add_argument(f"--window-size={LEAN_WINDOW_SIZE}")
+        options.add_argument("--disable-gpu")
+        options.add_argument("--disable-extensions")
+        options.add_argument("--blink-settings=imagesEnabled=false")
+        options.add_argument("--mute-audio")
+    else:
+        options.add_argument("--window-size=1920,1080")
     options.add_argument("--no-sandbox")
     options.add_argument("--disable-dev-shm-usage")
     options.add_argument("--lang=en-US")
+    if measure_network:
+        # Network events in the performance log are how bytes transferred are measured
+        options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+
+    driver = uc.Chrome(options=options, version_main=142)
+    driver.scan_profile = profile
+    driver.measure_network = measure_network
+
+    if profile == "lean":
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": LEAN_BLOCKED_URLS})
+
+    # Minimize window immediately to run in "background" (taskbar)
+    if not headless:
+        try:
+            driver.minimize_window()
+        except Exception:
+            pass # Ignore if minimization fails
+    return driver
+
+def read_network_log(driver):
+    """
+    Drains Chrome's performance log and totals what it says about the network since the
+    last call: {"requests", "blocked", "bytes_transferred"} (bytes as sent over the wire).
+    """
+    sent = blocked = transferred = 0
+    for entry in driver.get_log("performance"):
+        message = json.loads(entry["message"])["message"]
+        method = message.get("method")
+        if method == "Network.requestWillBeSent":
+            sent += 1
+        elif method == "Network.loadingFinished":
+            transferred += message["params"].get("encodedDataLength", 0)
+        elif method == "Network.loadingFailed" and message["params"].get("blockedReason"):
+            blocked += 1
+    return {"requests": sent, "blocked": blocked, "bytes_transferred": int(transferred)}
+
+def _drain_network_log(driver):
+    if not getattr(driver, "measure_network", True):
+        return None
+    try:
+        return read_network_log(driver)
+    except Exception as e:  # e.g. a driver created without performance logging
+        log.debug(f"No network log: {e}")
+        return None
+
+def scrape_google_lens_selenium(image_url, headless=True, expected_text="Charmander", driver=None, page_stats=None):
+    """
+    Scrapes Lens results for image_url.
+    If a driver is passed in (e.g. leased from a DriverPool) it is reused and left open,
+    otherwise a fresh browser is launched and quit afterwards.
+    If page_stats is a dict it is filled with page-level measurements (time-to-ready, requests
+    and bytes transferred, the browser profile), plus "blocked" for a CAPTCHA page and "error"
+    when the browser failed. A WebDriver error on a borrowed driver is raised as BrokenDriver,
+    so the pool it came from drops the browser instead of leasing it out again.
+    Results are read with the title class from the shared selector registry; if none are
+    found the registry is recalibrated in the background using expected_text.
+    """
+    results = []
+    title_class = lens_extractor.title_class()
     
-    driver = None
+    owns_driver = driver is None
     try:
-        driver = uc.Chrome(options=options, version_main=142)
-        
-        # Minimize window immediately to run in "background" (taskbar)
-        if not headless:
-            try:
-                driver.minimize_window()
-            except Exception:
-                pass # Ignore if minimization fails
-
-        lens_url = f"https://lens.google.com/uploadbyurl?url={urllib.parse.quote(image_url)}"
-        print(f"Navigating to: {lens_url}")
-        driver.get(lens_url)
+        if owns_driver:
+            with span("browser_start"):
+                driver = create_driver(headless)
+
+        measure = page_stats is not None
+        if measure:
+            _drain_network_log(driver)  # a pooled driver still holds the previous page's events
+
+        lens_url = f"{LENS_UPLOAD_URL}?url={urllib.parse.quote(image_url)}"
+        log.info(f"Navigating to: {lens_url}")
+        navigated = time.monotonic()
+        with span("page_load"):
+            driver.get(lens_url)
         
-        # Human-like pause
-        time.sleep(5)
+        # Wait until result nodes show up or the DOM settles, instead of a fixed 5s sleep
+        with span("page_wait"):
+            ready_reason, ready_seconds = wait_for_results(driver, f".{title_class}")
+        log.info(f"Page ready ({ready_reason}) after {ready_seconds:.2f}s")
+        if measure:
+            page_stats["ready_reason"] = ready_reason
+            page_stats["ready_seconds"] = round(ready_seconds, 3)
+            page_stats["time_to_ready_seconds"] = round(time.monotonic() - navigated, 3)
+            page_stats["profile"] = getattr(driver, "scan_profile", "default")
+            page_stats.update(_drain_network_log(driver) or {})
         
-        html = driver.page_source
-        soup = BeautifulSoup(html, 'html.parser')
+        with span("page_source"):
+            html = driver.page_source
         
         # Save debug artifacts
         if not headless:
              driver.save_screenshot("debug_lens_visible.png")
+
+        if is_blocked_page(html, driver.current_url):
+            log.warning("Lens served a CAPTCHA page")
+            if page_stats is not None:
+                page_stats["blocked"] = True
+            return results, title_class
         
-        # 1. Try with the currently known class
-        title_elements = soup.select(f".{DETECTED_TITLE_CLASS}")
-        
-        # 2. Dynamic Calibration
-        if not title_elements:
-            print(f"Warning: No elements found with class '{DETECTED_TITLE_CLASS}'. Attempting dynamic detection...")
-            
-            # Save HTML for inspection if we are about to fail
-            with open("debug_lens_failed.html", "w") as f:
-                f.write(html)
-            
-            new_class = detect_dynamic_class(soup, expected_text)
-            if new_class:
-                print(f"Calibration Successful! Updating class from '{DETECTED_TITLE_CLASS}' to '{new_class}'")
-                DETECTED_TITLE_CLASS = new_class
-                title_elements = soup.select(f".{DETECTED_TITLE_CLASS}")
-        
-        for item in title_elements:
-            title = item.get_text(strip=True)
-            link = "#"
-            parent_a = item.find_parent('a')
-            if parent_a:
-                link = parent_a.get('href', '#')
-            
-            if title:
-                results.append({
-                    "title": title,
-                    "link": link,
-                    "source": "Google Lens (Scraped)",
-                    "thumbnail": None
-                })
+        with span("parse"):
+            results, title_class, version = lens_extractor.extract(html, expected_text)
+        if page_stats is not None:
+            page_stats["selector_version"] = version
                 
+    except WebDriverException as e:
+        log.error(f"Selenium Error: {e}")
+        if page_stats is not None:
+            page_stats["error"] = str(e)
+        if not owns_driver:
+            raise BrokenDriver(f"Selenium Error: {e}") from e
     except Exception as e:
-        print(f"Selenium Error: {e}")
+        log.error(f"Selenium Error: {e}")
+        if page_stats is not None:
+            page_stats["error"] = str(e)
     finally:
-        if driver:
+        if owns_driver and driver:
             driver.quit()
             
-    return results, DETECTED_TITLE_CLASS
+    return results, title_class
 
 if __name__ == "__main__":
     load_dotenv()
@@ -212,7 +253,11 @@ if __name__ == "__main__":
     print(f"2. Uploading...")
     with open(img_path, "rb") as f:
         img_bytes = f.read()
-    public_url = upload_to_imgbb(img_bytes, api_key)
+    try:
+        public_url = upload_to_imgbb(img_bytes, api_key)
+    except ImgBBError as e:
+        print(e)
+        public_url = None
     
     if public_url:
         print(f"3. Scraping {public_url} ...")
@@ -226,6 +271,7 @@ if __name__ == "__main__":
             for r in res[:3]:
                 print(f" - {r['title']}")
         else:
-            print("No matches found. Check 'debug_lens_failed.html' if generated.")
+            print("No matches found. Recalibrating in the background; check 'debug_lens_failed.html'.")
+            lens_extractor.close()  # let the recalibration finish before exiting
     else:
         print("Upload failed.")
\ No newline at end of file
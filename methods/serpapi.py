@@ -1,49 +1,31 @@
-import requests
 from serpapi import GoogleSearch
-from collections import Counter
-import re
+import logging
+import os
+from methods.imgbb import upload_to_imgbb, upload_to_imgbb_async
+from methods.keywords import extract_keywords
+from methods.ratelimit import ProviderThrottled, get_guard
+from methods.telemetry import span
 
-def get_common_words(titles):
-    if not titles:
-        return []
-    STOP_WORDS = {
-        'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by',
-        'is', 'are', 'was', 'were', 'be', 'been', 'buy', 'sell', 'shop', 'online', 'store',
-        'price', 'best', 'review', 'images', 'photos', 'video', 'youtube', 'com', 'www', 'http',
-        'https', 'reddit', 'ebay', 'amazon', 'pinterest', 'twitter', 'facebook', 'instagram',
-        'stuffed', 'animal', 'toy', 'plush', 'soft', 'doll', 'figure', 'figurine', 'new', 'used',
-        'sale', 'free', 'shipping', 'official', 'licensed', 'authentic', 'japan', 'center', 'collection'
-    }
-    all_text = " ".join(titles)
-    cleaned_text = re.sub(r'[^a-zA-Z0-9\s]', '', all_text.lower())
-    words = cleaned_text.split()
-    meaningful_words = [w for w in words if w not in STOP_WORDS and len(w) > 2]
-    word_counts = Counter(meaningful_words)
-    return [{"word": word, "count": count} for word, count in word_counts.most_common(5)]
+log = logging.getLogger(__name__)
 
-def analyze_with_serpapi(image_bytes, serpapi_key, imgbb_key):
-    # 1. Upload to ImgBB first (SerpApi needs a public URL)
-    print("Method 2: Uploading to ImgBB for SerpApi...")
-    upload_url = "https://api.imgbb.com/1/upload"
-    files = {'image': image_bytes}
-    params = {'key': imgbb_key}
-    response = requests.post(upload_url, params=params, files=files)
-    
-    if response.status_code != 200:
-        raise Exception(f"ImgBB Upload Failed: {response.text}")
-    
-    public_url = response.json()['data']['url']
-    
-    # 2. Call SerpApi
-    print(f"Method 2: Querying SerpApi with {public_url}...")
-    params = {
-        "engine": "google_lens",
-        "url": public_url,
-        "api_key": serpapi_key
-    }
-    search = GoogleSearch(params)
-    data = search.get_dict()
-    
+# Override to point at a local stand-in when benchmarking
+SERPAPI_BACKEND = os.environ.get("SERPAPI_BACKEND", "https://serpapi.com")
+SERPAPI_TIMEOUT = float(os.environ.get("SERPAPI_TIMEOUT", 60))
+
+def read_serpapi_response(response):
+    """Parses a SerpApi answer; 429 and 5xx become errors the "serpapi" guard can count."""
+    status_code = response.status_code
+    if status_code == 429 or status_code >= 500:
+        try:
+            error = response.json().get("error")
+        except ValueError:
+            error = None
+        if status_code == 429:
+            raise ProviderThrottled("serpapi", error or "rate limited (HTTP 429)")
+        raise Exception(error or f"SerpApi HTTP {status_code}")
+    return response.json()
+
+def format_serpapi_results(data):
     if "error" in data:
         raise Exception(data["error"])
 
@@ -64,10 +46,54 @@ def analyze_with_serpapi(image_bytes, serpapi_key, imgbb_key):
                 "thumbnail": match.get("thumbnail")
             })
 
+    with span("keywords"):
+        keywords = extract_keywords([m['title'] for m in visual_matches])
+
     return {
         "success": True,
         "method": "SerpApi (Google Lens)",
         "best_guesses": best_guesses,
         "visual_matches": visual_matches[:10],
-        "common_keywords": get_common_words([m['title'] for m in visual_matches])
+        "common_keywords": keywords
+    }
+
+def analyze_with_serpapi(image_bytes, serpapi_key, imgbb_key):
+    # 1. Upload to ImgBB first (SerpApi needs a public URL)
+    log.info("Method 2: Uploading to ImgBB for SerpApi...")
+    with span("upload"):
+        public_url = upload_to_imgbb(image_bytes, imgbb_key)
+    
+    # 2. Call SerpApi
+    log.info(f"Method 2: Querying SerpApi with {public_url}...")
+    params = {
+        "engine": "google_lens",
+        "url": public_url,
+        "api_key": serpapi_key,
+        "output": "json",
+    }
+    search = GoogleSearch(params)
+    search.BACKEND = SERPAPI_BACKEND
+    search.timeout = SERPAPI_TIMEOUT  # the client's own default is 60000 seconds
+    with get_guard("serpapi").call(), span("provider"):
+        data = read_serpapi_response(search.get_response())
+
+    return format_serpapi_results(data)
+
+async def analyze_with_serpapi_async(image_bytes, serpapi_key, imgbb_key, http_client):
+    """Same as analyze_with_serpapi, but non-blocking on a shared httpx.AsyncClient."""
+    log.info("Method 2: Uploading to ImgBB for SerpApi...")
+    with span("upload"):
+        public_url = await upload_to_imgbb_async(http_client, image_bytes, imgbb_key)
+
+    log.info(f"Method 2: Querying SerpApi with {public_url}...")
+    params = {
+        "engine": "google_lens",
+        "url": public_url,
+        "api_key": serpapi_key,
+        "source": "python",
     }
+    async with get_guard("serpapi").call_async():
+        with span("provider"):
+            response = await http_client.get(f"{SERPAPI_BACKEND}/search", params=params, timeout=SERPAPI_TIMEOUT)
+            data = read_serpapi_response(response)
+    return format_serpapi_results(data)
@@ -0,0 +1,100 @@
+"""
+Request coalescing: concurrent calls with the same key share one execution.
+
+The first caller for a key (the leader) runs the work; callers arriving while it is in
+flight wait for it and get the same result, or the same exception. Nothing is cached
+here: once the call finishes, the next caller with that key starts a new one.
+"""
+import asyncio
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """For threads (Flask, jobs, ensemble providers)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._counters = {"leaders": 0, "coalesced": 0}
+
+    def do(self, key, fn, *args, on_join=None):
+        """
+        Returns (fn(*args), shared), where shared is True if another caller's call was joined.
+        on_join is called when that happens, before waiting (so joins that end in an error count too).
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self._counters["leaders"] += 1
+            else:
+                call.waiters += 1
+                self._counters["coalesced"] += 1
+
+        if not leader:
+            if on_join is not None:
+                on_join()
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn(*args)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, in_flight=len(self._calls),
+                        waiting=sum(call.waiters for call in self._calls.values()))
+
+
+class AsyncSingleFlight:
+    """
+    For the event loop. The work runs as its own task, and every caller (the leader too)
+    awaits it through asyncio.shield: a caller that is cancelled, e.g. because its client
+    disconnected, stops waiting but the others still get the result.
+    """
+
+    def __init__(self):
+        self._tasks = {}
+        self._counters = {"leaders": 0, "coalesced": 0}
+
+    async def do(self, key, coro_fn, *args, on_join=None):
+        task = self._tasks.get(key)
+        shared = task is not None
+        if shared:
+            self._counters["coalesced"] += 1
+            if on_join is not None:
+                on_join()
+        else:
+            self._counters["leaders"] += 1
+            task = self._tasks[key] = asyncio.ensure_future(coro_fn(*args))
+            task.add_done_callback(lambda t: self._finished(key, t))
+        return await asyncio.shield(task), shared
+
+    def _finished(self, key, task):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        # Mark the exception as retrieved in case every caller was cancelled
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self):
+        return dict(self._counters, in_flight=len(self._tasks))
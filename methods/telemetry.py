@@ -0,0 +1,292 @@
+"""
+Structured logging, per-stage timing spans and Prometheus metrics.
+
+Every log line carries the id of the request it belongs to. span("upload") times one stage
+of a scan: the duration goes into the scan_stage_seconds histogram and, when the request
+asked for it, into the `timings` block of the response. The request id, current scan method
+and timings live in contextvars, so they follow the request through async tasks; work handed
+to a thread pool has to be submitted with contextvars.copy_context().run to keep them.
+"""
+import bisect
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+# "json" (one object per line, for log shippers) or "text" (for reading in a terminal)
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json")
+
+_request_id = ContextVar("request_id", default=None)
+_scan_method = ContextVar("scan_method", default=None)
+_timings = ContextVar("timings", default=None)
+
+# Attributes every LogRecord has; anything else was passed in extra= and is logged as a field
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "request_id"}
+
+
+# --- Logging ---
+
+class _RequestIdFilter(logging.Filter):
+    def filter(self, record):
+        record.request_id = _request_id.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", None),
+            "message": record.getMessage(),
+        }
+        entry.update((k, v) for k, v in vars(record).items() if k not in _RECORD_ATTRS)
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        line = f"{self.formatTime(record, '%H:%M:%S')} {record.levelname:<7} [{getattr(record, 'request_id', None) or '-'}] {record.getMessage()}"
+        fields = " ".join(f"{k}={v}" for k, v in vars(record).items() if k not in _RECORD_ATTRS)
+        if fields:
+            line += f" ({fields})"
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+def configure_logging(level=LOG_LEVEL, fmt=LOG_FORMAT):
+    """Sends all logs to stderr in the chosen format. Safe to call more than once."""
+    root = logging.getLogger()
+    for handler in root.handlers:
+        if getattr(handler, "_scanner_handler", False):
+            return
+    handler = logging.StreamHandler(sys.stderr)
+    handler._scanner_handler = True
+    handler.addFilter(_RequestIdFilter())
+    handler.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+    root.addHandler(handler)
+    root.setLevel(level)
+    # httpx logs every request URL at INFO, and ours carry API keys in the query string
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+
+# --- Request context ---
+
+def new_request_id():
+    return uuid.uuid4().hex[:16]
+
+
+def current_request_id():
+    return _request_id.get()
+
+
+def current_timings():
+    return _timings.get()
+
+
+def start_request(request_id=None):
+    """
+    Binds a request id (a fresh one if None) and an empty timings dict to the current context.
+    Returns the request id. Used from before_request hooks, where a with-block does not fit.
+    """
+    request_id = request_id or new_request_id()
+    _request_id.set(request_id)
+    _timings.set({})
+    _scan_method.set(None)
+    return request_id
+
+
+@contextmanager
+def request_context(request_id=None):
+    """Like start_request, but restores the previous context afterwards (jobs, scripts)."""
+    tokens = (_request_id.set(request_id or new_request_id()), _timings.set({}), _scan_method.set(None))
+    try:
+        yield _timings.get()
+    finally:
+        _scan_method.reset(tokens[2])
+        _timings.reset(tokens[1])
+        _request_id.reset(tokens[0])
+
+
+@contextmanager
+def scan_context(method, collect=False):
+    """
+    Labels the spans inside with method. With collect=True the spans also go into a new
+    timings dict (yielded) instead of the request's, e.g. one per ensemble provider.
+    """
+    method_token = _scan_method.set(method)
+    timings_token = _timings.set({}) if collect else None
+    try:
+        yield _timings.get()
+    finally:
+        if timings_token is not None:
+            _timings.reset(timings_token)
+        _scan_method.reset(method_token)
+
+
+@contextmanager
+def span(stage):
+    """Times one stage of the current scan."""
+    method = _scan_method.get() or "none"
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        stage_errors.labels(method=method, stage=stage).inc()
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        stage_seconds.labels(method=method, stage=stage).observe(elapsed)
+        timings = _timings.get()
+        if timings is not None:
+            timings[stage] = round(timings.get(stage, 0) + elapsed, 4)
+
+
+# --- Metrics (Prometheus text format) ---
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children = {}
+
+    def labels(self, **labels):
+        key = tuple((name, str(labels[name])) for name in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            children = sorted(self._children.items())
+        for key, child in children:
+            lines.extend(child.render(self.name, key))
+        return lines
+
+
+class _CounterChild:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0.0
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def render(self, name, key):
+        return [f"{name}{_format_labels(key)} {self.value!r}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self._lock = threading.Lock()
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last one is +Inf
+        self.sum = 0.0
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def render(self, name, key):
+        with self._lock:
+            counts, total = list(self.counts), self.sum
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else f"{bound:g}"
+            lines.append(f"{name}_bucket{_format_labels(key + (('le', le),))} {cumulative}")
+        lines.append(f"{name}_sum{_format_labels(key)} {total!r}")
+        lines.append(f"{name}_count{_format_labels(key)} {cumulative}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+
+http_requests = Counter("scanner_http_requests_total", "HTTP requests by endpoint and status", ("endpoint", "status"))
+http_seconds = Histogram("scanner_http_request_seconds", "HTTP request latency by endpoint", ("endpoint",))
+scans = Counter("scanner_scans_total", "Scans by method and cache status", ("method", "cache"))
+stage_seconds = Histogram("scanner_stage_seconds", "Time spent per scan stage", ("method", "stage"))
+stage_errors = Counter("scanner_stage_errors_total", "Scan stages that raised", ("method", "stage"))
+coalesced = Counter("scanner_coalesced_total", "Scans that joined an identical scan already in flight", ("method",))
+
+METRICS = [http_requests, http_seconds, scans, stage_seconds, stage_errors, coalesced]
+
+
+def _flatten(prefix, value, out):
+    if isinstance(value, bool):
+        out.append((prefix, int(value)))
+    elif isinstance(value, (int, float)):
+        out.append((prefix, value))
+    elif isinstance(value, dict):
+        for key, item in value.items():
+            _flatten(f"{prefix}_{key}", item, out)
+
+
+def render_metrics(stats=None):
+    """
+    All metrics in the Prometheus text format. Numbers from the /stats payload (cache hits,
+    pool sizes, ...) can be passed in as stats and are exported as gauges.
+    """
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    if stats:
+        flat = []
+        _flatten("scanner", stats, flat)
+        for name, value in flat:
+            name = "".join(c if c.isalnum() or c == "_" else "_" for c in name)
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value!r}")
+    return "\n".join(lines) + "\n"
+
+
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
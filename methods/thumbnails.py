@@ -0,0 +1,321 @@
+"""
+Thumbnail proxy for the results grid.
+
+Result thumbnails (SerpApi's come from Google's image hosts) are rewritten to
+/thumb?url=...&sig=..., which the backend fetches once with a pooled session, shrinks to
+grid size and keeps in a disk cache with LRU eviction. The browser only ever talks to us.
+The signature (HMAC of the URL) stops /thumb from being used as an open proxy: only URLs
+that appeared in our own results can be fetched through it. Redirects are followed by hand,
+and only to public addresses, so a signed URL cannot point the server at internal hosts.
+"""
+import hashlib
+import hmac
+import io
+import ipaddress
+import logging
+import os
+import secrets
+import socket
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode, urljoin, urlparse
+
+import requests
+from PIL import Image
+from requests.adapters import HTTPAdapter
+
+from methods.singleflight import SingleFlight
+
+log = logging.getLogger(__name__)
+
+# --- THUMBNAIL CONFIG ---
+THUMB_ENABLED = os.environ.get("THUMB_ENABLED", "1") == "1"
+THUMB_SIZE = int(os.environ.get("THUMB_SIZE", 256))  # longest side in pixels
+THUMB_QUALITY = int(os.environ.get("THUMB_QUALITY", 80))
+THUMB_CACHE_DIR = os.environ.get("THUMB_CACHE_DIR", "cache/thumbs")
+THUMB_CACHE_MAX_BYTES = int(os.environ.get("THUMB_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+THUMB_MAX_SOURCE_BYTES = int(os.environ.get("THUMB_MAX_SOURCE_BYTES", 5 * 1024 * 1024))
+THUMB_PREFETCH_WORKERS = int(os.environ.get("THUMB_PREFETCH_WORKERS", 8))
+THUMB_PREFETCH_MAX_PENDING = int(os.environ.get("THUMB_PREFETCH_MAX_PENDING", 200))  # more are dropped
+THUMB_MAX_REDIRECTS = int(os.environ.get("THUMB_MAX_REDIRECTS", 3))
+
+
+def _load_secret(directory):
+    # Created once in the cache dir and shared by every process (and restart) using that dir
+    path = os.path.join(directory, ".secret")
+    try:
+        if not os.path.exists(path):
+            os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w") as f:
+                f.write(secrets.token_hex(16))
+            try:
+                os.link(tmp_path, path)  # fails if another process got there first; then use theirs
+            except FileExistsError:
+                pass
+            finally:
+                os.remove(tmp_path)
+        with open(path) as f:
+            return f.read().strip()
+    except OSError as e:
+        log.warning(f"Cannot keep the thumbnail secret in {directory} ({e}); set THUMB_SECRET. "
+                    f"Thumbnail links will not survive a restart or work across processes.")
+        return secrets.token_hex(16)
+
+
+# Must be the same for every worker process; without THUMB_SECRET it is kept in THUMB_CACHE_DIR
+THUMB_SECRET = os.environ.get("THUMB_SECRET") or _load_secret(THUMB_CACHE_DIR)
+
+
+class ThumbnailError(Exception):
+    def __init__(self, message, status_code=502):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def sign(url, secret=THUMB_SECRET):
+    return hmac.new(secret.encode(), url.encode(), hashlib.sha256).hexdigest()[:32]
+
+
+def verify(url, sig, secret=THUMB_SECRET):
+    return bool(url) and hmac.compare_digest(sig or "", sign(url, secret))
+
+
+def thumb_path(url, secret=THUMB_SECRET):
+    """The /thumb URL (path and query) that serves url."""
+    return "/thumb?" + urlencode({"url": url, "sig": sign(url, secret)})
+
+
+def check_redirect(url):
+    """Raises ThumbnailError unless url is http(s) on a host that resolves only to public addresses."""
+    parsed = urlparse(url)
+    if parsed.scheme not in ("http", "https") or not parsed.hostname:
+        raise ThumbnailError("Thumbnail redirected to an unsupported URL")
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(parsed.hostname, parsed.port or 443)}
+    except (socket.gaierror, UnicodeError) as e:
+        raise ThumbnailError(f"Thumbnail redirect host does not resolve: {e}") from e
+    for address in addresses:
+        if not ipaddress.ip_address(address.split("%")[0]).is_global:
+            raise ThumbnailError(f"Thumbnail redirected to a non-public address ({parsed.hostname})")
+
+
+class ThumbnailCache:
+    """
+    Resized thumbnails on disk, one file per source URL, evicted least recently used first
+    once the directory holds more than max_bytes. The LRU order is rebuilt from file mtimes
+    at startup and kept in memory after that.
+    """
+
+    def __init__(self, directory=THUMB_CACHE_DIR, max_bytes=THUMB_CACHE_MAX_BYTES, size=THUMB_SIZE,
+                 quality=THUMB_QUALITY, timeout=(3, 10), pool_size=16):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.size = size
+        self.quality = quality
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = "Mozilla/5.0 (thumbnail proxy)"
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._lock = threading.Lock()
+        self._files = OrderedDict()  # key -> size in bytes, least recently used first
+        self._total_bytes = 0
+        self._flight = SingleFlight()
+        self._counters = {"hits": 0, "misses": 0, "fetch_errors": 0, "evictions": 0, "bytes_fetched": 0}
+        self._load_index()
+
+    def _load_index(self):
+        try:
+            entries = [entry for entry in os.scandir(self.directory) if entry.name.endswith(".jpg")]
+        except FileNotFoundError:
+            return
+        for entry in sorted(entries, key=lambda e: e.stat().st_mtime):
+            size = entry.stat().st_size
+            self._files[entry.name[:-4]] = size
+            self._total_bytes += size
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".jpg")
+
+    def get(self, url):
+        """Returns the resized JPEG for url, fetching it on a miss. Raises ThumbnailError."""
+        key = hashlib.sha256(f"{self.size}:{url}".encode()).hexdigest()
+        data = self._read(key)
+        if data is not None:
+            return data
+        # Prefetch and the browser often ask for the same thumbnail at the same time
+        data, _ = self._flight.do(key, self._fetch_and_store, key, url)
+        return data
+
+    def _read(self, key):
+        with self._lock:
+            if key not in self._files:
+                return None
+            self._files.move_to_end(key)
+        try:
+            with open(self._path(key), "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            self._forget(key)
+            return None
+        try:
+            os.utime(self._path(key))  # keeps the LRU order across restarts
+        except FileNotFoundError:
+            pass  # evicted in the meantime
+        with self._lock:
+            self._counters["hits"] += 1
+        return data
+
+    def _fetch_and_store(self, key, url):
+        with self._lock:
+            self._counters["misses"] += 1
+        data = self._resize(self._download(url))
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f"{self._path(key)}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, self._path(key))
+        with self._lock:
+            self._total_bytes += len(data) - self._files.pop(key, 0)
+            self._files[key] = len(data)
+        self._evict()
+        return data
+
+    def _download(self, url):
+        if urlparse(url).scheme not in ("http", "https"):
+            raise ThumbnailError("Only http(s) thumbnails can be proxied", 400)
+        try:
+            for _ in range(THUMB_MAX_REDIRECTS + 1):
+                with self.session.get(url, timeout=self.timeout, stream=True, allow_redirects=False) as response:
+                    if response.is_redirect:
+                        url = urljoin(url, response.headers["Location"])
+                        check_redirect(url)
+                        continue
+                    if response.status_code != 200:
+                        raise ThumbnailError(f"Thumbnail fetch failed: HTTP {response.status_code}")
+                    body = bytearray()
+                    for chunk in response.iter_content(64 * 1024):
+                        body += chunk
+                        if len(body) > THUMB_MAX_SOURCE_BYTES:
+                            raise ThumbnailError("Thumbnail source too large")
+                    break
+            else:
+                raise ThumbnailError("Thumbnail fetch failed: too many redirects")
+        except requests.RequestException as e:
+            self._count_error()
+            raise ThumbnailError(f"Thumbnail fetch failed: {e}") from e
+        except ThumbnailError:
+            self._count_error()
+            raise
+        with self._lock:
+            self._counters["bytes_fetched"] += len(body)
+        return bytes(body)
+
+    def _resize(self, data):
+        try:
+            with Image.open(io.BytesIO(data)) as img:
+                img.draft("RGB", (self.size, self.size))  # JPEG: decode at reduced scale
+                img = img.convert("RGB")
+                img.thumbnail((self.size, self.size), Image.Resampling.LANCZOS)
+                out = io.BytesIO()
+                img.save(out, format="JPEG", quality=self.quality, optimize=True)
+                return out.getvalue()
+        except Exception as e:
+            self._count_error()
+            raise ThumbnailError(f"Not a usable image: {e}") from e
+
+    def _evict(self):
+        while True:
+            with self._lock:
+                if self._total_bytes <= self.max_bytes or len(self._files) <= 1:
+                    return
+                key, size = self._files.popitem(last=False)
+                self._total_bytes -= size
+                self._counters["evictions"] += 1
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+    def _forget(self, key):
+        with self._lock:
+            self._total_bytes -= self._files.pop(key, 0)
+
+    def _count_error(self):
+        with self._lock:
+            self._counters["fetch_errors"] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, files=len(self._files), bytes=self._total_bytes)
+
+
+class Prefetcher:
+    """
+    Fetches thumbnails in the background. At most max_pending fetches wait or run at once;
+    past that new ones are dropped (the browser still gets them from /thumb on demand).
+    """
+
+    def __init__(self, cache, workers=THUMB_PREFETCH_WORKERS, max_pending=THUMB_PREFETCH_MAX_PENDING):
+        self.cache = cache
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="thumb")
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._counters = {"prefetched": 0, "dropped": 0}
+
+    def submit(self, url):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._counters["dropped"] += 1
+                return False
+            self._pending += 1
+        self._executor.submit(self._prefetch, url)
+        return True
+
+    def _prefetch(self, url):
+        try:
+            self.cache.get(url)
+        except ThumbnailError as e:
+            log.debug(f"Thumbnail prefetch failed for {url}: {e}")
+        finally:
+            with self._lock:
+                self._pending -= 1
+                self._counters["prefetched"] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, pending=self._pending)
+
+
+thumbnail_cache = ThumbnailCache()
+prefetcher = Prefetcher(thumbnail_cache)
+
+
+def thumbnail_stats():
+    return dict(thumbnail_cache.stats(), prefetch=prefetcher.stats())
+
+
+def proxy_thumbnails(result, prefetch=True):
+    """
+    Returns a copy of result whose visual_matches thumbnails point at /thumb, and (unless
+    prefetch is False) starts fetching those thumbnails in the background so they are ready
+    when the browser asks. The cached result itself is not modified.
+    """
+    matches = result.get("visual_matches") if THUMB_ENABLED else None
+    if not matches:
+        return result
+    proxied = []
+    for match in matches:
+        url = match.get("thumbnail")
+        if url and urlparse(url).scheme in ("http", "https"):
+            if prefetch:
+                prefetcher.submit(url)
+            match = dict(match, thumbnail=thumb_path(url))
+        proxied.append(match)
+    return dict(result, visual_matches=proxied)
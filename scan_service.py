@@ -0,0 +1,513 @@
+"""
+Shared scan pipeline used by both the Flask server and the async server:
+configuration, result cache, near-duplicate index, Selenium pool, preprocessing
+and method dispatch.
+
+The provider modules (Cloud Vision, SerpApi, Selenium) are not imported here; the
+provider registry loads each one the first time its method is used (methods/providers.py).
+"""
+import contextvars
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from dotenv import load_dotenv
+
+# Load .env before the method modules read their settings at import time
+load_dotenv()
+
+from methods.telemetry import coalesced, configure_logging, current_timings, scan_context, span, scans
+
+configure_logging()
+
+# Import our distinct logic modules
+from methods.cache import ResultCache, image_digest, make_cache_key
+from methods.phash import HashIndex, dhash
+from methods.driver_pool import DriverPool
+from methods.imgbb import get_uploader
+from methods.providers import PROVIDERS_PRELOAD, ProviderRegistry
+from methods.ratelimit import guard_stats
+from methods.preprocess import normalize_image, preprocess_stats
+from methods.responses import response_stats
+from methods.ensemble import merge_results
+from methods.auto import TierLearner, confidence
+from methods.ratelimit import ProviderUnavailable
+from methods.singleflight import SingleFlight
+from methods.thumbnails import thumbnail_stats
+
+# --- CONFIG ---
+SERPAPI_KEY = os.environ.get("SERPAPI_KEY")
+IMGBB_KEY = os.environ.get("IMGBB_KEY")
+GOOGLE_CREDS = "my-google-cloud-key.json"
+
+# --- LENS BROKER CONFIG ---
+# With a broker (lens_broker.py), this process runs no browsers: the selenium method uploads the
+# image and hands the Lens scrape to the broker, which serves every worker from one browser budget.
+LENS_BROKER_URL = os.environ.get("LENS_BROKER_URL")
+
+# --- PROVIDERS ---
+# Each provider's module is imported on first use (SCAN_METHODS picks the enabled ones).
+
+def _run_cloud_vision(module, image_bytes):
+    return module.analyze_with_google_cloud(image_bytes, GOOGLE_CREDS)
+
+
+def _run_serpapi(module, image_bytes):
+    return module.analyze_with_serpapi(image_bytes, SERPAPI_KEY, IMGBB_KEY)
+
+
+def _run_selenium(module, image_bytes):
+    return module.analyze_with_selenium(image_bytes, IMGBB_KEY, pool=selenium_pool)
+
+
+providers = ProviderRegistry()
+providers.register("cloud_vision", "methods.google_cloud", _run_cloud_vision)
+providers.register("serpapi", "methods.serpapi", _run_serpapi, keys=("SERPAPI_KEY", "IMGBB_KEY"))
+providers.register("selenium", "methods.broker" if LENS_BROKER_URL else "methods.selenium_lens", _run_selenium,
+                   keys=("IMGBB_KEY",))
+
+# --- CACHE CONFIG ---
+# TTLs are in seconds; set a method's TTL to 0 to disable caching for it.
+CACHE_TTLS = {
+    "cloud_vision": int(os.environ.get("CACHE_TTL_CLOUD_VISION", 24 * 3600)),
+    "serpapi": int(os.environ.get("CACHE_TTL_SERPAPI", 24 * 3600)),
+    "selenium": int(os.environ.get("CACHE_TTL_SELENIUM", 6 * 3600)),
+}
+
+result_cache = ResultCache(
+    max_entries=int(os.environ.get("CACHE_MAX_ENTRIES", 512)),
+    max_bytes=int(os.environ.get("CACHE_MAX_BYTES", 32 * 1024 * 1024)),
+    db_path=os.environ.get("CACHE_DB_PATH") or None,  # e.g. "cache/results.sqlite3"
+    disk_max_bytes=int(os.environ.get("CACHE_DISK_MAX_BYTES", 256 * 1024 * 1024)),
+    ttls=CACHE_TTLS,
+)
+
+# --- NEAR-DUPLICATE CONFIG ---
+# Camera shots are never byte-identical, so we also match on a perceptual hash (dHash).
+PHASH_ENABLED = os.environ.get("PHASH_ENABLED", "1") == "1"
+PHASH_MAX_DISTANCE = int(os.environ.get("PHASH_MAX_DISTANCE", 4))
+PHASH_MAX_ENTRIES = int(os.environ.get("PHASH_MAX_ENTRIES", 200_000))
+
+# One index per method: a Vision result must not answer a SerpApi request.
+near_duplicate_index = {
+    method: HashIndex(max_distance=PHASH_MAX_DISTANCE, max_entries=PHASH_MAX_ENTRIES)
+    for method in CACHE_TTLS
+}
+
+# --- COALESCING CONFIG ---
+# Concurrent scans of the same image (same digest) with the same method share one upload and
+# provider call (or one Chrome session); the others wait for it and get its result or error.
+COALESCE_ENABLED = os.environ.get("COALESCE_ENABLED", "1") == "1"
+scan_flight = SingleFlight()
+
+# --- SELENIUM POOL CONFIG ---
+# 0 keeps the old behaviour of one fresh Chrome per request.
+SELENIUM_POOL_SIZE = int(os.environ.get("SELENIUM_POOL_SIZE", 0))
+
+def _create_pooled_driver():
+    selenium_lens = providers.load("selenium")
+    return selenium_lens.create_driver(headless=selenium_lens.HEADLESS)
+
+
+selenium_pool = None
+if SELENIUM_POOL_SIZE > 0 and providers.is_enabled("selenium") and not LENS_BROKER_URL:
+    selenium_pool = DriverPool(
+        factory=_create_pooled_driver,
+        size=SELENIUM_POOL_SIZE,
+        max_uses=int(os.environ.get("SELENIUM_POOL_MAX_USES", 20)),
+        acquire_timeout=float(os.environ.get("SELENIUM_POOL_TIMEOUT", 30)),
+    )
+    # Pre-warm in the background so the API comes up immediately
+    threading.Thread(target=selenium_pool.start, daemon=True).start()
+
+# --- UPLOAD CONFIG ---
+# Larger images are rejected with a 413 before their body is read into memory.
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", 20 * 1024 * 1024))
+# Request bodies above this size are spooled to a temporary file instead of held in memory.
+UPLOAD_SPOOL_BYTES = int(os.environ.get("UPLOAD_SPOOL_BYTES", 512 * 1024))
+
+# --- PREPROCESS CONFIG ---
+# Downscale / re-encode uploads before they are sent to ImgBB or Cloud Vision.
+PREPROCESS_ENABLED = os.environ.get("PREPROCESS_ENABLED", "0") == "1"
+PREPROCESS_MAX_DIMENSION = int(os.environ.get("PREPROCESS_MAX_DIMENSION", 1600))
+PREPROCESS_QUALITY = int(os.environ.get("PREPROCESS_QUALITY", 85))
+PREPROCESS_MIN_BYTES = int(os.environ.get("PREPROCESS_MIN_BYTES", 300 * 1024))
+
+# --- ENSEMBLE CONFIG ---
+# Providers run by method=ensemble, in merge priority order.
+# Methods not enabled by SCAN_METHODS are left out.
+ENSEMBLE_METHODS = [m.strip() for m in os.environ.get("ENSEMBLE_METHODS", "serpapi,cloud_vision,selenium").split(",")
+                    if providers.is_enabled(m.strip())]
+ENSEMBLE_DEADLINE = float(os.environ.get("ENSEMBLE_DEADLINE", 15))
+ENSEMBLE_MAX_DEADLINE = float(os.environ.get("ENSEMBLE_MAX_DEADLINE", 60))
+
+# Providers that miss the deadline keep running here and still fill the cache for next time.
+ensemble_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("ENSEMBLE_WORKERS", 12)), thread_name_prefix="ensemble")
+
+
+# --- AUTO CONFIG ---
+# method=auto tries these one at a time, in this order until enough has been learned to reorder
+# them, and stops at the first result whose confidence (0-1) reaches AUTO_THRESHOLD.
+AUTO_METHODS = [m.strip() for m in os.environ.get("AUTO_METHODS", "cloud_vision,serpapi,selenium").split(",")
+                if providers.is_enabled(m.strip())]
+AUTO_THRESHOLD = float(os.environ.get("AUTO_THRESHOLD", 0.6))
+# Price per call in cents ("method:cents,..."; list prices: Vision web detection 0.35, SerpApi ~1,
+# the scraper nothing) and how many seconds of latency a cent is worth when ordering the tiers
+AUTO_COSTS = {name.strip(): float(cents) for name, _, cents in
+              (item.partition(":") for item in os.environ.get(
+                  "AUTO_COSTS", "cloud_vision:0.35,serpapi:1,selenium:0").split(",") if ":" in item)}
+AUTO_COST_WEIGHT = float(os.environ.get("AUTO_COST_WEIGHT", 1.0))
+
+auto_tiers = TierLearner(
+    AUTO_METHODS,
+    min_samples=int(os.environ.get("AUTO_MIN_SAMPLES", 20)),
+    learn=os.environ.get("AUTO_LEARN", "1") == "1",
+    costs=AUTO_COSTS,
+    cost_weight=AUTO_COST_WEIGHT,
+)
+
+
+class ScanError(Exception):
+    def __init__(self, message, status_code=500):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def read_upload(file, max_bytes=MAX_UPLOAD_BYTES):
+    """
+    Reads an uploaded file (possibly spooled to disk) into the one buffer that is passed
+    through the rest of the pipeline. Oversized files are rejected before they are read.
+    """
+    stream = file.stream
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    stream.seek(0)
+    if size > max_bytes:
+        raise ScanError(f"Image too large ({size} bytes, max {max_bytes})", 413)
+    return stream.read()
+
+
+def check_method(method):
+    """
+    The enabled provider for method. Raises ScanError (400) otherwise; this runs before the
+    method is used as a metric label, so clients cannot add series with made-up methods.
+    """
+    provider = providers.get(method)
+    if provider is None:
+        raise ScanError("Invalid method specified", 400)
+    if not provider.enabled:
+        raise ScanError(f"Method {method} is not enabled on this server", 400)
+    return provider
+
+
+def ensemble_deadline(value=None):
+    """
+    Seconds to wait for ensemble providers, from the client's deadline (a form value or a number):
+    ENSEMBLE_DEADLINE if it is not given, capped at ENSEMBLE_MAX_DEADLINE. Raises ScanError (400)
+    unless it is a positive, finite number.
+    """
+    if value is None or value == "":
+        return ENSEMBLE_DEADLINE
+    try:
+        deadline = float(value)
+    except (TypeError, ValueError):
+        raise ScanError("deadline must be a number of seconds", 400)
+    if not 0 < deadline < math.inf:  # also false for NaN
+        raise ScanError("deadline must be a positive, finite number of seconds", 400)
+    return min(deadline, ENSEMBLE_MAX_DEADLINE)
+
+
+def get_provider(method):
+    """The enabled provider for method, with its API keys configured. Raises ScanError."""
+    provider = check_method(method)
+    missing = provider.missing_keys()
+    if missing:
+        raise ScanError(f"Missing {', '.join(missing)} for the {method} method", 500)
+    return provider
+
+
+def run_method(method, image_bytes):
+    return get_provider(method)(image_bytes)
+
+
+def prepare_image(image_bytes):
+    """Returns (bytes to send to the provider, preprocess info or None)."""
+    if not PREPROCESS_ENABLED:
+        return image_bytes, None
+    return normalize_image(
+        image_bytes,
+        max_dimension=PREPROCESS_MAX_DIMENSION,
+        quality=PREPROCESS_QUALITY,
+        min_bytes=PREPROCESS_MIN_BYTES,
+    )
+
+
+def is_cacheable(result):
+    # Scrapers fail "softly" with empty results (e.g. CAPTCHA); never pin those in the cache.
+    return bool(result.get("success")) and bool(result.get("visual_matches") or result.get("best_guesses"))
+
+
+def lookup_cached(method, image_bytes):
+    """
+    Looks the image up in the result cache, then in the near-duplicate index.
+    Returns (result or None, cache status, cache key, perceptual hash or None).
+    """
+    cache_key = make_cache_key(image_digest(image_bytes), method)
+    result = result_cache.get(cache_key)
+    if result is not None:
+        return result, "HIT", cache_key, None
+
+    index = near_duplicate_index.get(method) if PHASH_ENABLED else None
+    phash = None
+    if index is not None:
+        phash = dhash(image_bytes)
+        match = index.lookup(phash) if phash is not None else None
+        if match is not None:
+            _, similar_key = match
+            result = result_cache.get(similar_key)
+            if result is not None:
+                return result, "NEAR", cache_key, phash
+            index.discard(similar_key)  # the cached result behind it has expired
+
+    return None, "MISS", cache_key, phash
+
+
+def lookup_digest(method, digest):
+    """
+    The cached result for an image the client uploaded before, by its image_digest (sha256
+    hex), or None. Exact matches only: a near-duplicate lookup needs the pixels.
+    """
+    if method in ('ensemble', 'auto'):
+        raise ScanError("Digest lookups need a single method (ensemble and auto results are not cached)", 400)
+    check_method(method)
+    if len(digest) != 64 or any(c not in "0123456789abcdef" for c in digest.lower()):
+        raise ScanError("Digest must be the sha256 hex digest of the image", 400)
+    result = result_cache.get(make_cache_key(digest.lower(), method))
+    response_stats.count("digest_hits" if result is not None else "digest_misses")
+    return result
+
+
+def store_result(method, cache_key, phash, result):
+    if not is_cacheable(result):
+        return
+    result_cache.set(cache_key, method, result)
+    index = near_duplicate_index.get(method) if PHASH_ENABLED else None
+    if index is not None and phash is not None:
+        index.add(phash, cache_key)
+
+
+def scan(method, image_bytes):
+    """
+    Cached, coalesced scan. Returns (result, cache status, preprocess info or None); the cache
+    status is COALESCED when the result came from an identical scan already in flight.
+    """
+    check_method(method)
+    with scan_context(method):
+        with span("cache_lookup"):
+            result, cache_status, cache_key, phash = lookup_cached(method, image_bytes)
+        scans.labels(method=method, cache=cache_status).inc()
+        if result is not None:
+            return result, cache_status, None
+
+        if not COALESCE_ENABLED:
+            result, preprocess_info = scan_uncached(method, image_bytes, cache_key, phash)
+            return result, cache_status, preprocess_info
+
+        (result, preprocess_info), shared = scan_flight.do(
+            cache_key, scan_uncached, method, image_bytes, cache_key, phash,
+            on_join=coalesced.labels(method=method).inc)
+        if shared:
+            return result, "COALESCED", preprocess_info
+        return result, cache_status, preprocess_info
+
+
+def scan_uncached(method, image_bytes, cache_key, phash):
+    """Preprocess, call the provider and cache the result. Returns (result, preprocess info)."""
+    with span("preprocess"):
+        send_bytes, preprocess_info = prepare_image(image_bytes)
+    result = run_method(method, send_bytes)
+    with span("cache_store"):
+        store_result(method, cache_key, phash, result)
+    return result, preprocess_info
+
+
+def _timed_scan(method, image_bytes):
+    started = time.monotonic()
+    with scan_context(method, collect=True) as timings:
+        result, cache_status, _ = scan(method, image_bytes)
+    return result, cache_status, time.monotonic() - started, timings
+
+
+def add_provider_timings(method, timings):
+    """Copies one ensemble provider's stage timings into the request's, as "<method>.<stage>"."""
+    request_timings = current_timings()
+    if request_timings is not None and timings:
+        request_timings.update((f"{method}.{stage}", seconds) for stage, seconds in timings.items())
+
+
+def ensemble_failure(provider_status, last_error, deadline):
+    """
+    The error for an ensemble in which no provider finished: a 504 if any of them missed the
+    deadline, otherwise the last provider error (as for method=auto).
+    """
+    if not provider_status:
+        return ScanError("No provider is enabled for method ensemble", 400)
+    if last_error is None or any(s["status"] == "timeout" for s in provider_status.values()):
+        summary = ", ".join(f"{method}: {s['status']}" for method, s in provider_status.items())
+        return ScanError(f"No provider finished within the {deadline:g}s deadline ({summary})", 504)
+    return last_error
+
+
+def scan_ensemble(image_bytes, deadline=None):
+    """
+    Runs every ENSEMBLE_METHODS provider concurrently and merges whatever finished
+    within the deadline. Latency is bounded by the deadline, not the slowest provider.
+    """
+    deadline = ensemble_deadline(deadline)
+    started = time.monotonic()
+    # Each provider runs in a copy of the caller's context, so its logs keep the request id
+    futures = {
+        ensemble_executor.submit(contextvars.copy_context().run, _timed_scan, method, image_bytes): method
+        for method in ENSEMBLE_METHODS
+    }
+    done, _ = wait(futures, timeout=deadline)
+
+    finished, provider_status, last_error = [], {}, None
+    for future, method in futures.items():
+        if future not in done:
+            provider_status[method] = {"status": "timeout"}
+            continue
+        try:
+            result, cache_status, seconds, timings = future.result()
+        except Exception as e:
+            provider_status[method] = {"status": "error", "error": str(e)}
+            last_error = e
+            continue
+        provider_status[method] = {"status": "ok", "cache": cache_status, "seconds": round(seconds, 3)}
+        add_provider_timings(method, timings)
+        finished.append((method, result))
+    if not finished:
+        raise ensemble_failure(provider_status, last_error, deadline)
+
+    merged = merge_results(finished, provider_status)
+    merged["elapsed_seconds"] = round(time.monotonic() - started, 3)
+    return merged
+
+
+def _lens_stats():
+    # Only once the Selenium provider is loaded; importing these would pull in Selenium and lxml.
+    # With a broker, the pages are loaded and parsed there (see its /stats).
+    if not providers.get("selenium").loaded or LENS_BROKER_URL:
+        return None, None
+    from methods.lens_extract import lens_extractor
+    from methods.page_ready import readiness_log
+    return readiness_log.stats(), lens_extractor.stats()
+
+
+def _broker_stats():
+    if not LENS_BROKER_URL or not providers.get("selenium").loaded:
+        return None
+    return providers.load("selenium").get_client().stats()
+
+
+def health():
+    """Liveness plus which providers are enabled and which have been imported so far."""
+    return {
+        "status": "ok",
+        "enabled": providers.enabled(),
+        "loaded": providers.loaded(),
+        "providers": providers.stats(),
+    }
+
+
+def record_auto_tier(tiers, method, result, cache_status, seconds, threshold):
+    """Scores one auto tier's result, learns from it and adds it to tiers. Returns the confidence."""
+    score, signals = confidence(result)
+    # Cache hits and joined scans say nothing about how fast or good the provider is
+    if cache_status == "MISS":
+        auto_tiers.record(method, seconds, score >= threshold)
+    tiers.append({
+        "method": method,
+        "status": "confident" if score >= threshold else "below_threshold",
+        "confidence": score,
+        "signals": signals,
+        "cache": cache_status,
+        "seconds": round(seconds, 3),
+    })
+    return score
+
+
+def record_auto_error(tiers, method, error, seconds):
+    # A provider that was turned away or is not configured was never really tried
+    if not isinstance(error, (ProviderUnavailable, ScanError)):
+        auto_tiers.record(method, seconds, False)
+    tiers.append({"method": method, "status": "error", "error": str(error), "seconds": round(seconds, 3)})
+
+
+def finish_auto(tiers, best, started, threshold):
+    """
+    The response for method=auto: the confident result, or the most confident one if no
+    tier reached the threshold, plus the tiers that ran. Returns (result, cache status).
+    """
+    score, position, result, cache_status = best
+    auto_tiers.record_scan(len(tiers), score >= threshold)
+    tiers[position]["selected"] = True
+    result = dict(result, confidence=score, tiers=tiers, elapsed_seconds=round(time.monotonic() - started, 3))
+    return result, cache_status
+
+
+def scan_auto(image_bytes, threshold=None):
+    """
+    Tries the AUTO_METHODS providers one at a time, cheapest first (auto_tiers.order()), and
+    escalates to the next only while the result's confidence is below the threshold.
+    Returns (result, cache status of the selected tier).
+    """
+    threshold = AUTO_THRESHOLD if threshold is None else threshold
+    started = time.monotonic()
+    tiers, best, last_error = [], None, None
+    for method in auto_tiers.order():
+        tier_started = time.monotonic()
+        try:
+            result, cache_status, seconds, timings = _timed_scan(method, image_bytes)
+        except Exception as e:
+            record_auto_error(tiers, method, e, time.monotonic() - tier_started)
+            last_error = e
+            continue
+        add_provider_timings(method, timings)
+        score = record_auto_tier(tiers, method, result, cache_status, seconds, threshold)
+        if best is None or score > best[0]:
+            best = (score, len(tiers) - 1, result, cache_status)
+        if score >= threshold:
+            break
+
+    if best is None:
+        if last_error is None:
+            raise ScanError("No provider is enabled for method auto", 400)
+        raise last_error
+    return finish_auto(tiers, best, started, threshold)
+
+
+def service_stats():
+    lens_page_ready, lens_selectors = _lens_stats()
+    return {
+        "cache": result_cache.stats(),
+        "near_duplicate_index": {method: len(index) for method, index in near_duplicate_index.items()},
+        "selenium_pool": selenium_pool.stats() if selenium_pool else None,
+        "lens_page_ready": lens_page_ready,
+        "lens_selectors": lens_selectors,
+        "lens_broker": _broker_stats(),
+        "imgbb": get_uploader().stats(),
+        "providers": guard_stats(),
+        "auto": auto_tiers.stats(),
+        "coalescing": scan_flight.stats(),
+        "thumbnails": thumbnail_stats(),
+        "preprocess": preprocess_stats.stats(),
+        "responses": response_stats.stats(),
+    }
+
+
+# Trades a slower start for no import pause on each method's first request
+if PROVIDERS_PRELOAD:
+    providers.preload()
@@ -1,13 +1,11 @@
 import os
-import time
+import sys
 import urllib.parse
-import requests
 from dotenv import load_dotenv
 from bs4 import BeautifulSoup
 import undetected_chromedriver as uc
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
+from methods.page_ready import wait_for_results
+from methods.imgbb import upload_to_imgbb, ImgBBError
 
 # Load environment variables
 load_dotenv()
@@ -15,29 +13,13 @@ load_dotenv()
 IMGBB_KEY = os.environ.get("IMGBB_KEY")
 image_path = "image/test_char.jpg"
 
-if not IMGBB_KEY:
-    print("Error: IMGBB_KEY not found in .env file.")
-    exit(1)
-
-def upload_to_imgbb(filepath, api_key):
+def upload_file_to_imgbb(filepath, api_key):
     print(f"Uploading {filepath} to ImgBB...")
-    upload_url = "https://api.imgbb.com/1/upload"
     try:
         with open(filepath, 'rb') as f:
-            files = {'image': f}
-            params = {'key': api_key}
-            response = requests.post(upload_url, params=params, files=files)
-        
-        if response.status_code == 200:
-            data = response.json()
-            if data['success']:
-                return data['data']['url']
-            else:
-                print("ImgBB Upload failed:", data)
-        else:
-            print(f"ImgBB Upload HTTP Error: {response.status_code}")
-    except Exception as e:
-        print(f"ImgBB Upload Exception: {e}")
+            return upload_to_imgbb(f.read(), api_key)
+    except (OSError, ImgBBError) as e:
+        print(e)
     return None
 
 def scrape_google_lens(image_url):
@@ -62,7 +44,8 @@ def scrape_google_lens(image_url):
         driver.get(lens_url)
         
         print("Waiting for results to load...")
-        time.sleep(5) # Wait for JS
+        ready_reason, ready_seconds = wait_for_results(driver, ".Yt787")
+        print(f"Page ready ({ready_reason}) after {ready_seconds:.2f}s")
         
         # Save screenshot for debugging
         driver.save_screenshot("lens_screenshot.png")
@@ -110,10 +93,21 @@ def scrape_google_lens(image_url):
     finally:
         driver.quit()
 
-if __name__ == "__main__":
-    public_url = upload_to_imgbb(image_path, IMGBB_KEY)
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "bulk":
+        from methods.bulk import main as bulk_main
+        sys.exit(bulk_main(sys.argv[2:]))
+
+    if not IMGBB_KEY:
+        print("Error: IMGBB_KEY not found in .env file.")
+        exit(1)
+
+    public_url = upload_file_to_imgbb(image_path, IMGBB_KEY)
     if public_url:
         print(f"Image uploaded: {public_url}")
         scrape_google_lens(public_url)
     else:
-        print("Failed to get public URL.")
\ No newline at end of file
+        print("Failed to get public URL.")
+
+if __name__ == "__main__":
+    main()
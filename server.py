@@ -1,49 +1,345 @@
+import json
+import logging
+import math
 import os
-from flask import Flask, request, jsonify
-from dotenv import load_dotenv
+import tempfile
+import time
+from flask import Flask, Request, Response, g, request, jsonify
 
 # Import our distinct logic modules
-from methods.google_cloud import analyze_with_google_cloud
-from methods.serpapi import analyze_with_serpapi
-from methods.selenium_lens import analyze_with_selenium
+from methods.cache import image_digest, make_cache_key
+from methods.driver_pool import PoolTimeout
+from methods.ratelimit import ProviderUnavailable
+from methods.responses import encode as encode_response
+from methods.thumbnails import ThumbnailError, proxy_thumbnails, thumbnail_cache, verify
+from methods.jobs import JobManager, QueueFull, TERMINAL_STATUSES
+from scan_service import (
+    GOOGLE_CREDS, MAX_UPLOAD_BYTES, UPLOAD_SPOOL_BYTES, ScanError, result_cache, prepare_image, is_cacheable,
+    read_upload, scan, scan_auto, scan_ensemble, ensemble_deadline, service_stats, health as service_health, providers,
+    lookup_digest,
+)
+from methods.telemetry import (
+    METRICS_CONTENT_TYPE, current_request_id, current_timings, http_requests, http_seconds, render_metrics,
+    request_context, scan_context, start_request,
+)
+
+log = logging.getLogger(__name__)
+
+
+class ScanRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        # Uploads above UPLOAD_SPOOL_BYTES go to a temporary file while the form is parsed
+        return tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_BYTES, mode="rb+")
 
-load_dotenv()
 
 app = Flask(__name__)
+app.request_class = ScanRequest
 
 # --- CONFIG ---
-SERPAPI_KEY = os.environ.get("SERPAPI_KEY")
-IMGBB_KEY = os.environ.get("IMGBB_KEY")
-GOOGLE_CREDS = "my-google-cloud-key.json" 
+BATCH_MAX_FILES = int(os.environ.get("BATCH_MAX_FILES", 1000))
+BATCH_WORKERS = int(os.environ.get("BATCH_WORKERS", 4))
+# Whole request body limit for /scan/batch (single-image endpoints use MAX_UPLOAD_BYTES)
+BATCH_MAX_BYTES = int(os.environ.get("BATCH_MAX_BYTES", 512 * 1024 * 1024))
+
+# Room for the other form fields and multipart framing on top of the image itself
+app.config["MAX_CONTENT_LENGTH"] = MAX_UPLOAD_BYTES + 64 * 1024
+
+# --- JOB QUEUE CONFIG ---
+JOB_MAX_WAIT = float(os.environ.get("JOB_MAX_WAIT", 30))  # longest long-poll a client may ask for
+
+
+def wants_timings():
+    # ?timings=1 (or a timings=1 form field) adds a per-stage "timings" block to the response
+    return request.values.get('timings', '0').lower() in ('1', 'true', 'yes')
+
+
+def with_timings(result):
+    # Copy, so the cached result is never modified
+    return dict(result, timings=current_timings())
+
+
+def auto_threshold():
+    # method=auto escalates while confidence is below this (AUTO_THRESHOLD unless the client sets it)
+    threshold = request.form.get('threshold', type=float)
+    return None if threshold is None else min(1.0, max(0.0, threshold))
+
+
+def encoded(data):
+    # orjson body with a content-hash ETag, compressed if the client accepts it; 304 if its copy is current
+    status, body, headers = encode_response(data, request.headers.get("Accept-Encoding"),
+                                            request.headers.get("If-None-Match"), request.values.get("fields"))
+    return Response(body, status=status, headers=headers, mimetype="application/json")
+
+
+def run_job(method, image_bytes, deadline=None, threshold=None, request_id=None, timings=False):
+    # Jobs log under the id of the request that submitted them
+    with request_context(request_id):
+        if method == 'ensemble':
+            result = scan_ensemble(image_bytes, deadline)
+        elif method == 'auto':
+            result, _ = scan_auto(image_bytes, threshold)
+        else:
+            result, _, _ = scan(method, image_bytes)
+        result = proxy_thumbnails(result)
+        return with_timings(result) if timings else result
+
+
+job_manager = JobManager(
+    runner=run_job,
+    workers=int(os.environ.get("JOB_WORKERS", 2)),
+    max_queue=int(os.environ.get("JOB_MAX_QUEUE", 100)),
+    job_timeout=float(os.environ.get("JOB_TIMEOUT", 120)),
+    retention=float(os.environ.get("JOB_RETENTION", 600)),
+    max_retained=int(os.environ.get("JOB_MAX_RETAINED", 1000)),
+    evict_interval=float(os.environ.get("JOB_EVICT_INTERVAL", 30)),
+)
+
+
+@app.before_request
+def begin_request():
+    g.started = time.perf_counter()
+    start_request(request.headers.get("X-Request-ID"))
+
+
+@app.after_request
+def finish_request(response):
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    http_requests.labels(endpoint=endpoint, status=response.status_code).inc()
+    http_seconds.labels(endpoint=endpoint).observe(time.perf_counter() - g.started)
+    response.headers["X-Request-ID"] = current_request_id()
+    return response
+
+
+@app.errorhandler(413)
+def too_large(e):
+    limit = request.max_content_length
+    return jsonify({"error": f"Request too large (max {limit} bytes)"}), 413
+
+
+def unavailable(e):
+    # The provider is throttling us or its circuit is open: tell the client when to come back
+    response = jsonify({"error": str(e), "provider": e.provider})
+    response.status_code = 503
+    if e.retry_after:
+        response.headers["Retry-After"] = str(max(1, math.ceil(e.retry_after)))
+    return response
+
 
 @app.route('/scan', methods=['POST'])
 def scan_image():
     if 'image' not in request.files:
         return jsonify({"error": "No image file provided"}), 400
-    
+
     method = request.form.get('method', 'cloud_vision') # Default to method 1
     file = request.files['image']
-    image_bytes = file.read()
 
     try:
-        if method == 'cloud_vision':
-            result = analyze_with_google_cloud(image_bytes, GOOGLE_CREDS)
-        elif method == 'serpapi':
-            if not SERPAPI_KEY or not IMGBB_KEY:
-                return jsonify({"error": "Missing API Keys for SerpApi method"}), 500
-            result = analyze_with_serpapi(image_bytes, SERPAPI_KEY, IMGBB_KEY)
-        elif method == 'selenium':
-            if not IMGBB_KEY:
-                return jsonify({"error": "Missing ImgBB Key for Selenium method"}), 500
-            result = analyze_with_selenium(image_bytes, IMGBB_KEY)
+        image_bytes = read_upload(file)
+        if method == 'ensemble':
+            deadline = ensemble_deadline(request.form.get('deadline'))
+            result, cache_status, preprocess_info = scan_ensemble(image_bytes, deadline), "ENSEMBLE", None
+        elif method == 'auto':
+            (result, cache_status), preprocess_info = scan_auto(image_bytes, auto_threshold()), None
         else:
-            return jsonify({"error": "Invalid method specified"}), 400
-            
-        return jsonify(result)
+            result, cache_status, preprocess_info = scan(method, image_bytes)
+
+        # Thumbnails start downloading on the prefetch pool while the response is serialized
+        result = proxy_thumbnails(result)
+        if wants_timings():
+            result = with_timings(result)
+        response = encoded(result)
+        response.headers["X-Cache"] = cache_status
+        # The key for GET /scan/<digest> next time, without uploading the image again
+        response.headers["X-Image-Digest"] = image_digest(image_bytes)
+        if preprocess_info:
+            response.headers["X-Image-Bytes-Original"] = str(preprocess_info["original_bytes"])
+            response.headers["X-Image-Bytes-Sent"] = str(preprocess_info["sent_bytes"])
+        return response
 
+    except ScanError as e:
+        return jsonify({"error": str(e)}), e.status_code
+    except PoolTimeout as e:
+        return jsonify({"error": str(e)}), 503
+    except ProviderUnavailable as e:
+        return unavailable(e)
     except Exception as e:
-        print(f"Error processing request ({method}): {e}")
+        log.exception(f"Error processing request ({method}): {e}")
         return jsonify({"error": str(e)}), 500
 
+
+@app.route('/scan/<digest>', methods=['GET'])
+def scan_by_digest(digest):
+    # A result this server already has for the image, by digest; 404 means upload it to /scan
+    method = request.args.get('method', 'cloud_vision')
+    try:
+        result = lookup_digest(method, digest)
+    except ScanError as e:
+        return jsonify({"error": str(e)}), e.status_code
+    if result is None:
+        return jsonify({"error": "No cached result for this image; upload it to /scan"}), 404
+
+    # The client has (or is revalidating) this result; its thumbnails were prefetched with the scan
+    response = encoded(proxy_thumbnails(result, prefetch=False))
+    response.headers["X-Cache"] = "HIT"
+    response.headers["X-Image-Digest"] = digest.lower()
+    return response
+
+
+@app.route('/scan/batch', methods=['POST'])
+def scan_batch():
+    request.max_content_length = BATCH_MAX_BYTES
+    files = request.files.getlist('images')
+    if not files:
+        return jsonify({"error": "No image files provided (use the 'images' field)"}), 400
+    if len(files) > BATCH_MAX_FILES:
+        return jsonify({"error": f"Too many images (max {BATCH_MAX_FILES})"}), 400
+
+    method = request.form.get('method', 'cloud_vision')
+    if method != 'cloud_vision':
+        return jsonify({"error": "Batch scanning is only supported for the cloud_vision method"}), 400
+    if not providers.is_enabled(method):
+        return jsonify({"error": f"Method {method} is not enabled on this server"}), 400
+
+    try:
+        results = [None] * len(files)
+        pending = []  # (position, cache_key, image_bytes) for cache misses
+        for position, file in enumerate(files):
+            image_bytes = read_upload(file)
+            cache_key = make_cache_key(image_digest(image_bytes), method)
+            results[position] = result_cache.get(cache_key)
+            if results[position] is None:
+                pending.append((position, cache_key, image_bytes))
+
+        if pending:
+            google_cloud = providers.load(method)
+            with scan_context(method):
+                fresh = google_cloud.analyze_batch_with_google_cloud(
+                    [prepare_image(image_bytes)[0] for _, _, image_bytes in pending],
+                    GOOGLE_CREDS, max_workers=BATCH_WORKERS)
+            for (position, cache_key, _), result in zip(pending, fresh):
+                results[position] = result
+                if is_cacheable(result):
+                    result_cache.set(cache_key, method, result)
+
+        for file, result in zip(files, results):
+            result["filename"] = file.filename
+
+        body = {
+            "success": True,
+            "count": len(results),
+            "cached": len(files) - len(pending),
+            "results": results,
+        }
+        if wants_timings():
+            body["timings"] = current_timings()
+        return encoded(body)
+
+    except ScanError as e:
+        return jsonify({"error": f"{file.filename}: {e}"}), e.status_code
+    except Exception as e:
+        log.exception(f"Error processing batch request ({method}): {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    if 'image' not in request.files:
+        return jsonify({"error": "No image file provided"}), 400
+
+    method = request.form.get('method', 'cloud_vision')
+    if method not in ('ensemble', 'auto') and not providers.is_enabled(method):
+        return jsonify({"error": "Invalid method specified"}), 400
+
+    payload = {
+        "request_id": current_request_id(),
+        "timings": wants_timings(),
+    }
+    try:
+        if method == 'ensemble':
+            # Checked here so a bad deadline is a 400 now, not a failed job later
+            payload["deadline"] = ensemble_deadline(request.form.get('deadline'))
+        elif method == 'auto':
+            payload["threshold"] = auto_threshold()
+        payload["image_bytes"] = read_upload(request.files['image'])
+    except ScanError as e:
+        return jsonify({"error": str(e)}), e.status_code
+
+    try:
+        job = job_manager.submit(method, **payload)
+    except QueueFull as e:
+        return jsonify({"error": str(e)}), 503
+
+    response = jsonify(job.to_dict())
+    response.status_code = 202
+    response.headers["Location"] = f"/jobs/{job.id}"
+    return response
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    # ?wait=N long-polls for up to N seconds until the job finishes
+    wait = min(request.args.get('wait', 0, type=float), JOB_MAX_WAIT)
+    job = job_manager.wait(job_id, wait) if wait > 0 else job_manager.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown or expired job id"}), 404
+    return jsonify(job.to_dict())
+
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """Server-Sent Events: one event per status change, closed once the job finishes."""
+    if job_manager.get(job_id) is None:
+        return jsonify({"error": "Unknown or expired job id"}), 404
+
+    def stream():
+        last_status = None
+        while True:
+            job = job_manager.wait(job_id, 15)
+            if job is None:
+                return
+            if job.status != last_status:
+                last_status = job.status
+                yield f"event: {job.status}\ndata: {json.dumps(job.to_dict())}\n\n"
+            else:
+                yield ": keep-alive\n\n"
+            if job.status in TERMINAL_STATUSES:
+                return
+
+    return Response(stream(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+@app.route('/thumb', methods=['GET'])
+def thumb():
+    """A result thumbnail, resized and served from the disk cache (see methods/thumbnails.py)."""
+    url = request.args.get('url', '')
+    if not verify(url, request.args.get('sig')):
+        return jsonify({"error": "Invalid thumbnail signature"}), 403
+    try:
+        data = thumbnail_cache.get(url)
+    except ThumbnailError as e:
+        return jsonify({"error": str(e)}), e.status_code
+    return Response(data, mimetype="image/jpeg", headers={"Cache-Control": "public, max-age=86400"})
+
+
+@app.route('/health', methods=['GET'])
+def health():
+    """Liveness check that also lists the enabled providers and which of them are loaded."""
+    return jsonify(service_health())
+
+
+@app.route('/stats', methods=['GET'])
+def stats():
+    data = service_stats()
+    data["jobs"] = job_manager.stats()
+    return jsonify(data)
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus scrape endpoint: request/stage histograms plus the /stats numbers as gauges."""
+    data = service_stats()
+    data["jobs"] = job_manager.stats()
+    return Response(render_metrics(data), mimetype=METRICS_CONTENT_TYPE)
+
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=5000)
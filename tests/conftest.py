@@ -0,0 +1,20 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+# The provider stand-ins in benchmarks/fakes.py double as test fixtures
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from fakes import PROVIDERS, FakeProviders  # noqa: E402
+
+
+@pytest.fixture
+def fakes():
+    """The fake providers on a free local port, answering without latency."""
+    server = FakeProviders(port=0, latency={name: 0.0 for name in PROVIDERS}, seed=1).start()
+    yield server
+    server.stop()
@@ -0,0 +1,24 @@
+import asyncio
+import io
+
+import pytest
+
+pytest.importorskip("quart")
+from werkzeug.datastructures import FileStorage  # noqa: E402
+
+import async_server  # noqa: E402
+
+
+def post_scan(form):
+    async def post():
+        client = async_server.app.test_client()
+        response = await client.post("/scan", form=form,
+                                     files={"image": FileStorage(io.BytesIO(b"x" * 16), filename="a.jpg")})
+        return response.status_code, await response.get_json()
+    return asyncio.run(post())
+
+
+@pytest.mark.parametrize("deadline", ["0", "-1", "nan", "inf", "soon"])
+def test_bad_ensemble_deadline_is_refused(deadline):
+    status, body = post_scan({"method": "ensemble", "deadline": deadline})
+    assert status == 400 and "deadline" in body["error"]
@@ -0,0 +1,45 @@
+from methods.auto import TierLearner, confidence
+from methods.lens_extract import format_lens_result
+
+
+def lens_result(titles):
+    return format_lens_result([{"title": t, "link": f"https://example.com/{i}"} for i, t in enumerate(titles)],
+                              "Yt787", {})
+
+
+def test_lens_guesses_from_keywords_do_not_count():
+    unrelated = lens_result(["Orange Toy Stock Photo", "My Desk Setup Tour", "Garden Gnome Sale",
+                             "Vintage Lamp Repair", "Cat Sleeping On Keyboard"])
+    score, signals = confidence(unrelated)
+    assert signals["best_guess"] is None
+    assert score < 0.6
+
+
+def test_agreeing_lens_matches_are_confident():
+    agreeing = lens_result([f"Pokemon Center Charmander Plush #{i}" for i in range(8)])
+    score, _ = confidence(agreeing)
+    assert score >= 0.6
+
+
+def test_provider_guess_still_scores():
+    result = {
+        "success": True,
+        "best_guesses": ["charmander plush"],
+        "visual_matches": [{"title": f"Charmander Plush #{i}"} for i in range(8)],
+        "common_keywords": [{"word": "charmander", "count": 8}, {"word": "plush", "count": 8}],
+    }
+    score, signals = confidence(result)
+    assert signals["best_guess"] == 1.0
+    assert score > 0.9
+
+
+def test_tier_order_weighs_cost():
+    learner = TierLearner(["paid", "free"], min_samples=1, costs={"paid": 5.0, "free": 0.0}, cost_weight=1.0)
+    # Same success rate; "paid" is 1 s faster but costs 5 s worth per call
+    for _ in range(3):
+        learner.record("paid", 1.0, True)
+        learner.record("free", 2.0, True)
+    assert learner.order() == ["free", "paid"]
+
+    learner.cost_weight = 0.1
+    assert learner.order() == ["paid", "free"]
@@ -0,0 +1,86 @@
+import io
+import json
+import threading
+
+import pytest
+
+from methods import bulk
+from methods.bulk import Progress, load_finished, run
+
+
+@pytest.fixture
+def scans(monkeypatch):
+    """Replaces scan_file; paths containing "bad" fail. Returns the scanned paths."""
+    scanned = []
+    lock = threading.Lock()
+
+    def fake_scan_file(method, path):
+        with lock:
+            scanned.append(path)
+        if "bad" in path:
+            return {"path": path, "method": method, "status": "error", "error": "RuntimeError: boom"}
+        return {"path": path, "method": method, "status": "ok", "cache": "MISS", "result": {"success": True}}
+
+    monkeypatch.setattr(bulk, "scan_file", fake_scan_file)
+    return scanned
+
+
+def run_quietly(paths, output, **kwargs):
+    finished = load_finished(output)
+    progress = Progress(len(paths), sum(1 for path in paths if path in finished), stream=io.StringIO())
+    return run(paths, "serpapi", str(output), workers=2, progress=progress, **kwargs)
+
+
+def read_records(output):
+    return [json.loads(line) for line in output.read_text(encoding="utf-8").splitlines()]
+
+
+def test_truncated_last_line_is_cut_off(tmp_path):
+    output = tmp_path / "out.jsonl"
+    complete = json.dumps({"path": "a.jpg", "status": "ok"}) + "\n"
+    output.write_text(complete + '{"path": "b.jpg", "sta', encoding="utf-8")
+
+    assert load_finished(str(output)) == {"a.jpg"}
+    assert output.read_text(encoding="utf-8") == complete
+
+
+def test_later_record_for_a_path_wins(tmp_path):
+    output = tmp_path / "out.jsonl"
+    lines = [{"path": "a.jpg", "status": "ok"}, {"path": "b.jpg", "status": "ok"}, {"path": "b.jpg", "status": "error"}]
+    output.write_text("".join(json.dumps(line) + "\n" for line in lines), encoding="utf-8")
+    assert load_finished(str(output)) == {"a.jpg"}
+
+
+def test_missing_output_means_nothing_is_finished(tmp_path):
+    assert load_finished(str(tmp_path / "none.jsonl")) == set()
+
+
+def test_rerun_skips_ok_paths_and_retries_errors(scans, tmp_path):
+    output = tmp_path / "out.jsonl"
+    paths = ["a.jpg", "bad.jpg", "c.jpg"]
+
+    progress = run_quietly(paths, output)
+    assert sorted(scans) == paths
+    assert (progress.ok, progress.errors) == (2, 1)
+
+    scans.clear()
+    progress = run_quietly(paths, output)
+    assert scans == ["bad.jpg"]
+    assert (progress.skipped, progress.done, progress.errors) == (2, 1, 1)
+    assert [record["path"] for record in read_records(output)].count("bad.jpg") == 2
+
+
+def test_rerun_after_a_crash_appends_cleanly(scans, tmp_path):
+    output = tmp_path / "out.jsonl"
+    output.write_text(json.dumps({"path": "a.jpg", "status": "ok"}) + '\n{"path": "c.j', encoding="utf-8")
+
+    run_quietly(["a.jpg", "c.jpg"], output)
+    assert scans == ["c.jpg"]
+    assert [(r["path"], r["status"]) for r in read_records(output)] == [("a.jpg", "ok"), ("c.jpg", "ok")]
+
+
+def test_nothing_left_to_do(scans, tmp_path):
+    output = tmp_path / "out.jsonl"
+    output.write_text(json.dumps({"path": "a.jpg", "status": "ok"}) + "\n", encoding="utf-8")
+    progress = run_quietly(["a.jpg"], output)
+    assert scans == [] and progress.done == 0
@@ -0,0 +1,79 @@
+import time
+
+from methods.cache import ResultCache, image_digest, make_cache_key
+
+RESULT = {"success": True, "best_guesses": ["charmander plush"], "visual_matches": []}
+
+
+def test_key_is_content_addressed():
+    assert make_cache_key(image_digest(b"abc"), "serpapi") == make_cache_key(image_digest(b"abc"), "serpapi")
+    assert make_cache_key(image_digest(b"abc"), "serpapi") != make_cache_key(image_digest(b"abd"), "serpapi")
+    assert make_cache_key(image_digest(b"abc"), "serpapi") != make_cache_key(image_digest(b"abc"), "selenium")
+
+
+def test_get_set_and_copy():
+    cache = ResultCache()
+    assert cache.get("k") is None
+    cache.set("k", "serpapi", RESULT)
+    hit = cache.get("k")
+    assert hit == RESULT
+    hit["best_guesses"].append("changed")
+    assert cache.get("k") == RESULT  # callers get their own copy
+    stats = cache.stats()
+    assert (stats["memory_hits"], stats["misses"], stats["stores"]) == (2, 1, 1)
+
+
+def test_ttl_per_method():
+    cache = ResultCache(ttls={"selenium": 0, "serpapi": 0.05})
+    cache.set("a", "selenium", RESULT)
+    assert cache.get("a") is None  # TTL 0 is never stored
+    cache.set("b", "serpapi", RESULT)
+    assert cache.get("b") == RESULT
+    time.sleep(0.1)
+    assert cache.get("b") is None
+    assert cache.stats()["expired"] == 1
+
+
+def test_lru_eviction_by_count():
+    cache = ResultCache(max_entries=2)
+    cache.set("a", "m", RESULT)
+    cache.set("b", "m", RESULT)
+    cache.get("a")  # b is now least recently used
+    cache.set("c", "m", RESULT)
+    assert cache.get("b") is None
+    assert cache.get("a") == RESULT and cache.get("c") == RESULT
+    assert cache.stats()["evictions"] == 1
+
+
+def test_eviction_by_bytes():
+    big = dict(RESULT, padding="x" * 1000)
+    cache = ResultCache(max_bytes=2500)
+    for key in "abc":
+        cache.set(key, "m", big)
+    assert cache.stats()["memory_entries"] == 2
+    assert cache.get("a") is None
+
+
+def test_disk_tier_survives_a_restart(tmp_path):
+    db_path = str(tmp_path / "results.db")
+    ResultCache(db_path=db_path).set("k", "serpapi", RESULT)
+    cache = ResultCache(db_path=db_path)
+    assert cache.get("k") == RESULT
+    assert cache.stats()["disk_hits"] == 1
+    assert cache.get("k") == RESULT
+    assert cache.stats()["memory_hits"] == 1  # promoted to memory
+
+
+def test_disk_eviction_least_recently_used(tmp_path):
+    big = dict(RESULT, padding="x" * 1000)
+    cache = ResultCache(db_path=str(tmp_path / "results.db"), max_entries=1, disk_max_bytes=2500)
+    cache.set("a", "m", big)
+    time.sleep(0.01)
+    cache.set("b", "m", big)
+    time.sleep(0.01)
+    cache.get("a")  # from disk; a is now more recent than b
+    time.sleep(0.01)
+    cache.set("c", "m", big)
+    stats = cache.stats()
+    assert stats["disk_entries"] == 2 and stats["disk_evictions"] == 1
+    assert cache.get("b") is None
@@ -0,0 +1,115 @@
+import itertools
+
+import pytest
+
+from methods.driver_pool import BrokenDriver, DriverPool, PoolTimeout
+
+
+class FakeDriver:
+    ids = itertools.count()
+
+    def __init__(self):
+        self.id = next(self.ids)
+        self.alive = True
+        self.quit_called = False
+        self.cookies_cleared = 0
+
+    @property
+    def current_url(self):
+        if not self.alive:
+            raise RuntimeError("chrome not reachable")
+        return "about:blank"
+
+    def delete_all_cookies(self):
+        self.cookies_cleared += 1
+
+    def execute_cdp_cmd(self, cmd, params):
+        pass
+
+    def get(self, url):
+        pass
+
+    def quit(self):
+        self.quit_called = True
+
+
+def test_start_prewarms_and_lease_reuses():
+    pool = DriverPool(FakeDriver, size=2)
+    pool.start()
+    assert pool.stats()["idle"] == 2
+    with pool.lease() as first:
+        pass
+    with pool.lease() as second:
+        pass
+    assert second is first
+    assert first.cookies_cleared == 2  # scrubbed after every lease
+    assert pool.stats()["created"] == 2
+
+
+def test_recycled_after_max_uses():
+    pool = DriverPool(FakeDriver, size=1, max_uses=2)
+    drivers = []
+    for _ in range(3):
+        with pool.lease() as driver:
+            drivers.append(driver)
+    assert drivers[0] is drivers[1] is not drivers[2]
+    assert drivers[0].quit_called
+    assert pool.stats()["recycled"] == 1
+
+
+def test_broken_driver_is_dropped():
+    pool = DriverPool(FakeDriver, size=1)
+    with pytest.raises(BrokenDriver):
+        with pool.lease() as broken:
+            raise BrokenDriver("renderer crashed")
+    with pool.lease() as driver:
+        assert driver is not broken
+    assert broken.quit_called
+    assert pool.stats()["crashed"] == 1
+
+
+def test_other_errors_keep_a_live_driver():
+    pool = DriverPool(FakeDriver, size=1)
+    with pytest.raises(ValueError):
+        with pool.lease() as first:
+            raise ValueError("no results on the page")
+    with pool.lease() as driver:
+        assert driver is first
+
+
+def test_dead_idle_driver_is_replaced():
+    pool = DriverPool(FakeDriver, size=1)
+    with pool.lease() as first:
+        pass
+    first.alive = False  # the browser died while idle
+    with pool.lease() as driver:
+        assert driver is not first
+    assert pool.stats()["crashed"] == 1
+
+
+def test_pool_timeout_when_all_busy():
+    pool = DriverPool(FakeDriver, size=1)
+    with pool.lease():
+        with pytest.raises(PoolTimeout):
+            with pool.lease(timeout=0.05):
+                pass
+    assert pool.stats()["timeouts"] == 1
+    with pool.lease(timeout=0.05):  # free again
+        pass
+
+
+def test_failed_launch_frees_the_slot():
+    attempts = []
+
+    def factory():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError("chromedriver missing")
+        return FakeDriver()
+
+    pool = DriverPool(factory, size=1)
+    with pytest.raises(RuntimeError):
+        with pool.lease(timeout=0.05):
+            pass
+    with pool.lease(timeout=0.05) as driver:
+        assert isinstance(driver, FakeDriver)
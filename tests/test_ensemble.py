@@ -0,0 +1,141 @@
+import io
+import threading
+
+import pytest
+
+from methods.ensemble import MAX_VISUAL_MATCHES, merge_results
+
+VISION = {
+    "best_guesses": ["Charmander plush"],
+    "visual_matches": [
+        {"title": "Charmander Plush - Pokemon Center", "link": "https://example.com/item-1"},
+        {"title": "Charmander Figure", "link": "https://example.com/item-2/"},
+    ],
+}
+SERPAPI = {
+    "best_guesses": ["charmander plush ", "pokemon plush"],
+    "visual_matches": [
+        {"title": "Charmander Plush (eBay)", "link": "https://example.com/item-1/"},
+        {"title": "Charmander Figure", "link": "https://example.com/item-2"},
+        {"title": "Charmander Plush 12in", "link": "https://example.com/item-3"},
+    ],
+}
+SELENIUM = {
+    "best_guesses": [],
+    "visual_matches": [
+        {"title": "Charmander Plush 12IN ", "link": "#"},
+        {"title": "charmander plush 12in", "link": None},
+        {"title": "Vintage Charmander", "link": "#"},
+    ],
+}
+STATUS = {
+    "cloud_vision": {"status": "ok", "cache": "MISS", "seconds": 0.8},
+    "serpapi": {"status": "ok", "cache": "HIT", "seconds": 0.0},
+    "selenium": {"status": "ok", "cache": "MISS", "seconds": 4.1},
+}
+
+
+def merged():
+    results = [("cloud_vision", VISION), ("serpapi", SERPAPI), ("selenium", SELENIUM)]
+    return merge_results(results, STATUS)
+
+
+def test_matches_are_deduplicated_across_providers():
+    links = [(m["title"], m["link"]) for m in merged()["visual_matches"]]
+    assert links == [
+        # The first provider in priority order wins; trailing slashes do not make a new link
+        ("Charmander Plush - Pokemon Center", "https://example.com/item-1"),
+        ("Charmander Figure", "https://example.com/item-2/"),
+        ("Charmander Plush 12in", "https://example.com/item-3"),
+        # Scraped matches without a real link are deduplicated by title
+        ("Charmander Plush 12IN ", "#"),
+        ("Vintage Charmander", "#"),
+    ]
+
+
+def test_best_guesses_are_deduplicated_in_priority_order():
+    assert merged()["best_guesses"] == ["Charmander plush", "pokemon plush"]
+
+
+def test_provider_status_is_reported_as_is():
+    result = merged()
+    assert result["success"] is True and result["method"] == "Ensemble"
+    assert result["providers"] == STATUS
+    assert result["common_keywords"]
+
+
+def test_partial_results_keep_the_status_of_late_providers():
+    status = {
+        "cloud_vision": {"status": "ok", "cache": "MISS", "seconds": 0.8},
+        "serpapi": {"status": "error", "error": "Rate limited"},
+        "selenium": {"status": "timeout"},
+    }
+    result = merge_results([("cloud_vision", VISION)], status)
+    assert result["success"] is True
+    assert len(result["visual_matches"]) == 2
+    assert result["providers"]["selenium"] == {"status": "timeout"}
+    assert result["providers"]["serpapi"]["error"] == "Rate limited"
+
+
+def test_no_results_is_not_a_success():
+    status = {"serpapi": {"status": "timeout"}}
+    result = merge_results([], status)
+    assert result["success"] is False
+    assert result["visual_matches"] == [] and result["best_guesses"] == []
+    assert result["providers"] == status
+
+
+def test_visual_matches_are_capped():
+    many = {"visual_matches": [{"title": f"Item {i}", "link": f"https://example.com/{i}"} for i in range(50)]}
+    assert len(merge_results([("serpapi", many)], {})["visual_matches"]) == MAX_VISUAL_MATCHES
+
+
+@pytest.fixture
+def providers(monkeypatch):
+    """Ensemble providers that answer, fail or hang according to behaviour[method]."""
+    import scan_service
+
+    behaviour = {}
+    release = threading.Event()
+
+    def timed_scan(method, image_bytes):
+        action = behaviour[method]
+        if action == "hang":
+            release.wait(5)
+        elif action == "fail":
+            raise RuntimeError(f"{method} failed")
+        return dict(SERPAPI, success=True), "MISS", 0.01, {}
+
+    monkeypatch.setattr(scan_service, "_timed_scan", timed_scan)
+    monkeypatch.setattr(scan_service, "ENSEMBLE_METHODS", ["serpapi", "cloud_vision"])
+    yield behaviour
+    release.set()
+
+
+def post_ensemble(deadline="0.2"):
+    import server
+
+    data = {"image": (io.BytesIO(b"x" * 16), "a.jpg"), "method": "ensemble", "deadline": deadline}
+    return server.app.test_client().post("/scan", data=data)
+
+
+def test_scan_with_one_provider_finished(providers):
+    providers.update(serpapi="ok", cloud_vision="hang")
+    response = post_ensemble()
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body["success"] is True and body["providers"]["cloud_vision"] == {"status": "timeout"}
+
+
+def test_scan_with_no_provider_finished_times_out(providers):
+    providers.update(serpapi="hang", cloud_vision="fail")
+    response = post_ensemble()
+    assert response.status_code == 504
+    assert "serpapi: timeout" in response.get_json()["error"]
+
+
+def test_scan_with_every_provider_failed(providers):
+    providers.update(serpapi="fail", cloud_vision="fail")
+    response = post_ensemble()
+    assert response.status_code == 500
+    assert "cloud_vision failed" in response.get_json()["error"]
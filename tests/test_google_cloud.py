@@ -0,0 +1,27 @@
+import asyncio
+import os
+
+import pytest
+
+from methods import google_cloud
+
+IMAGE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "image")
+
+
+@pytest.fixture
+def vision_fake(fakes, monkeypatch):
+    monkeypatch.setattr(google_cloud, "VISION_API_ENDPOINT", fakes.base_url)
+    monkeypatch.setattr(google_cloud, "_client", None)
+    monkeypatch.setattr(google_cloud, "_async_client", None)
+    return fakes
+
+
+def sample_image():
+    with open(os.path.join(IMAGE_DIR, sorted(os.listdir(IMAGE_DIR))[0]), "rb") as f:
+        return f.read()
+
+
+def test_async_client_uses_the_endpoint(vision_fake):
+    result = asyncio.run(google_cloud.analyze_with_google_cloud_async(sample_image(), "unused.json"))
+    assert result["success"] and result["best_guesses"]
+    assert vision_fake.stats()["calls"]["vision"] == 1
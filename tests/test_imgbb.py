@@ -0,0 +1,60 @@
+import asyncio
+import hashlib
+
+import httpx
+import pytest
+
+from methods.imgbb import EXPIRY_SAFETY_MARGIN, ImgBBError, ImgBBUploader
+from methods.ratelimit import ProviderGuard
+
+IMAGE = b"\xff\xd8 not really a jpeg"
+
+
+@pytest.fixture
+def uploader(fakes):
+    uploader = ImgBBUploader(upload_url=f"{fakes.base_url}/1/upload", retries=3, backoff=0)
+    # Its own breaker, so failures injected here do not open the shared "imgbb" circuit
+    uploader.guard = ProviderGuard("imgbb-test")
+    return uploader
+
+
+def test_same_image_is_uploaded_once(uploader, fakes):
+    url = uploader.upload(IMAGE, "key")
+    assert url.startswith(fakes.base_url)
+    assert uploader.upload(IMAGE, "key") == url
+    assert uploader.upload(IMAGE + b"!", "key") != url
+    assert fakes.stats()["calls"]["imgbb"] == 2
+    assert uploader.stats()["reused"] == 1
+
+
+def test_url_close_to_expiry_is_not_reused(uploader, fakes):
+    digest = hashlib.sha256(IMAGE).hexdigest()
+    uploader._remember(digest, "https://i.ibb.co/old.jpg", EXPIRY_SAFETY_MARGIN // 2, len(IMAGE), 0.0)
+    assert uploader.upload(IMAGE, "key") != "https://i.ibb.co/old.jpg"
+    assert fakes.stats()["calls"]["imgbb"] == 1
+
+
+def test_retries_then_gives_up(uploader, fakes):
+    fakes.error_rate["imgbb"] = 1.0
+    with pytest.raises(ImgBBError, match="500"):
+        uploader.upload(IMAGE, "key")
+    assert fakes.stats()["calls"]["imgbb"] == 4
+    stats = uploader.stats()
+    assert (stats["retries"], stats["failures"], stats["uploads"]) == (3, 1, 0)
+
+
+def test_transient_errors_are_retried(uploader, fakes):
+    fakes.error_rate["imgbb"] = 0.5
+    uploader.retries = 10
+    assert uploader.upload(IMAGE, "key")
+    assert uploader.stats()["retries"] == fakes.stats()["errors"]["imgbb"]
+
+
+def test_async_upload_shares_the_cache(uploader, fakes):
+    async def upload_twice():
+        async with httpx.AsyncClient() as client:
+            return [await uploader.upload_async(client, IMAGE, "key") for _ in range(2)]
+
+    first, second = asyncio.run(upload_twice())
+    assert first == second == uploader.upload(IMAGE, "key")
+    assert fakes.stats()["calls"]["imgbb"] == 1
@@ -0,0 +1,78 @@
+import threading
+import time
+
+from methods.jobs import JobManager
+
+
+def test_hung_call_frees_the_worker():
+    release = threading.Event()
+
+    def runner(method, **payload):
+        if method == "hang":
+            release.wait()
+        return {"method": method}
+
+    manager = JobManager(runner, workers=2, job_timeout=0.2)
+    try:
+        hung = manager.submit("hang")
+        assert manager.wait(hung.id, 5).status == "timeout"
+        after = manager.submit("ok")
+        assert manager.wait(after.id, 5).status == "done"
+        assert manager.get(hung.id).status == "timeout"
+        assert manager.stats()["hung"] == 1
+    finally:
+        release.set()
+    time.sleep(0.1)
+    assert manager.stats()["hung"] == 0
+    # The late result is dropped
+    assert manager.get(hung.id).result is None
+
+
+def test_hung_calls_count_against_workers():
+    release = threading.Event()
+    live, peak = [0], [0]
+    lock = threading.Lock()
+
+    def runner(method, **payload):
+        with lock:
+            live[0] += 1
+            peak[0] = max(peak[0], live[0])
+        try:
+            release.wait()
+        finally:
+            with lock:
+                live[0] -= 1
+
+    manager = JobManager(runner, workers=2, job_timeout=0.05)
+    try:
+        jobs = [manager.submit("hang") for _ in range(6)]
+        time.sleep(0.5)  # long enough for every job to have timed out if calls were not bounded
+        stats = manager.stats()
+        assert peak[0] == 2
+        assert stats["hung"] == 2 and stats["timeout"] == 2 and stats["queued"] == 4
+    finally:
+        release.set()
+    # Once the hung calls return, the backlog runs
+    assert manager.wait(jobs[-1].id, 5).status == "done"
+    assert peak[0] == 2
+
+
+def test_failed_job():
+    def runner(method, **payload):
+        raise ValueError("bad image")
+
+    manager = JobManager(runner, workers=1)
+    job = manager.wait(manager.submit("x").id, 5)
+    assert job.status == "failed"
+    assert job.error == "bad image"
+
+
+def test_finished_jobs_are_evicted_without_new_submissions():
+    manager = JobManager(lambda method, **payload: {}, workers=1, retention=0.1, evict_interval=0.05)
+    job = manager.submit("x")
+    assert manager.wait(job.id, 5).status == "done"
+    deadline = time.monotonic() + 5
+    while manager.get(job.id) is not None and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert manager.get(job.id) is None
+    assert manager.stats()["evicted"] == 1
@@ -0,0 +1,35 @@
+from methods import ensemble
+from methods.keywords import KeywordCorpus, KeywordExtractor
+
+TITLES = [
+    ["Pokémon Center Charmander Plush", "ＰＯＫＥＭＯＮ charmander plush toy", "Charmander Sitting Cuties"],
+    ["ヒトカゲ ぬいぐるみ ポケモンセンター", "Charmander ぬいぐるみ 2024"],
+    [],
+    ["Squirtle Plush - eBay", "Squirtle, Official!"],
+]
+
+
+def test_batch_matches_extract():
+    extractor = KeywordExtractor()
+    assert extractor.extract_batch(TITLES) == [extractor.extract(titles) for titles in TITLES]
+
+
+def test_unicode_folding_and_cjk():
+    words = {k["word"] for k in KeywordExtractor(top_n=10).extract(TITLES[0] + TITLES[1])}
+    assert {"pokemon", "charmander", "ぬいぐるみ"} <= words
+
+
+def test_batch_updates_corpus_once_per_list():
+    corpus = KeywordCorpus()
+    KeywordExtractor(corpus=corpus).extract_batch(TITLES)
+    assert corpus.documents == 3  # the empty list is not a document
+    assert corpus.document_frequency["charmander"] == 2
+
+
+def test_ensemble_merge_leaves_corpus_alone(monkeypatch):
+    corpus = KeywordCorpus()
+    monkeypatch.setattr("methods.keywords.default_extractor", KeywordExtractor(corpus=corpus))
+    result = {"success": True, "best_guesses": [], "visual_matches": [{"title": t, "link": t} for t in TITLES[0]]}
+    merged = ensemble.merge_results([("serpapi", result)], {"serpapi": "ok"})
+    assert merged["common_keywords"]
+    assert corpus.documents == 0
@@ -0,0 +1,35 @@
+import threading
+
+import pytest
+
+import lens_broker
+
+
+@pytest.fixture(scope="module")
+def client():
+    # One worker with a stand-in scrape, so valid requests finish without a browser
+    scrape = lambda image_url: ([{"title": image_url}], "Yt787", {"profile": "test"})  # noqa: E731
+    threading.Thread(target=lens_broker.worker, args=(scrape,), daemon=True).start()
+    return lens_broker.app.test_client()
+
+
+@pytest.mark.parametrize("body", [
+    {"priority": "high"},
+    {"priority": [1]},
+    {"priority": float("inf")},
+    {"timeout": "soon"},
+    {"timeout": {"s": 1}},
+    {"timeout": -1},
+    {"timeout": float("nan")},
+])
+def test_bad_input_is_a_400(client, body):
+    response = client.post("/scrape", json=dict(body, image_url="https://example.com/a.jpg"))
+    assert response.status_code == 400
+    assert response.get_json()["kind"] == "bad_request"
+
+
+def test_valid_request(client):
+    response = client.post("/scrape", json={"image_url": "https://example.com/a.jpg", "priority": "2",
+                                            "timeout": "5"})
+    assert response.status_code == 200
+    assert response.get_json()["results"] == [{"title": "https://example.com/a.jpg"}]
@@ -0,0 +1,63 @@
+import json
+
+from fakes import lens_page
+from methods.lens_extract import LensExtractor, SelectorRegistry, extract_results
+
+EXPECTED_TEXT = "Charmander Plush"
+
+
+def test_extracts_results_from_a_lens_page():
+    results = extract_results(lens_page(results=5, script_kb=20), "Yt787")
+    assert [r["title"] for r in results] == [f"Pokemon Center Charmander Plush #{i}" for i in range(5)]
+    assert results[0]["link"] == "https://example.com/item-0"
+
+
+def test_unknown_class_finds_nothing():
+    assert extract_results(lens_page(results=5, script_kb=20), "NoSuchClass") == []
+
+
+def test_stale_title_class_triggers_recalibration(tmp_path):
+    registry = SelectorRegistry(path=str(tmp_path / "selectors.json"))
+    extractor = LensExtractor(registry, failed_page_path=str(tmp_path / "failed.html"))
+    page = lens_page(results=5, script_kb=20, title_class="Zq9x1")
+
+    results, title_class, version = extractor.extract(page, expected_text=EXPECTED_TEXT)
+    assert (results, title_class, version) == ([], "Yt787", 0)
+    extractor.close()  # waits for the background recalibration
+
+    version, title_class = registry.current()
+    assert version == 1 and title_class != "Yt787"
+    assert (tmp_path / "failed.html").exists()
+    assert extractor.stats()["recalibrations_changed"] == 1
+    assert len(extract_results(page, title_class)) == 5
+
+
+def test_empty_page_without_expected_text_is_not_recalibrated(tmp_path):
+    registry = SelectorRegistry(path=str(tmp_path / "selectors.json"))
+    extractor = LensExtractor(registry, failed_page_path=None)
+    extractor.extract(lens_page(results=5, script_kb=20, title_class="Zq9x1"))
+    extractor.close()
+    assert extractor.stats()["recalibrations"] == 0
+    assert registry.current() == (0, "Yt787")
+
+
+def test_registry_survives_a_reload(tmp_path):
+    path = str(tmp_path / "selectors.json")
+    assert SelectorRegistry(path=path).update("Zq9x1", expected_version=0) == (1, "Zq9x1")
+
+    reloaded = SelectorRegistry(path=path)
+    assert reloaded.current() == (1, "Zq9x1")
+    with open(path, encoding="utf-8") as f:
+        assert json.load(f)["history"] == [{"title_class": "Yt787", "version": 0}]
+
+
+def test_registry_refuses_a_stale_version(tmp_path):
+    path = str(tmp_path / "selectors.json")
+    # Two workers read version 0; the first one to recalibrate wins
+    first, second = SelectorRegistry(path=path), SelectorRegistry(path=path)
+    assert first.current() == second.current() == (0, "Yt787")
+
+    assert first.update("Zq9x1", expected_version=0) == (1, "Zq9x1")
+    assert second.update("Ab3c4", expected_version=0) == (1, "Zq9x1")
+    assert SelectorRegistry(path=path).current() == (1, "Zq9x1")
+    assert first.current() == (1, "Zq9x1")
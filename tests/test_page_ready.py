@@ -0,0 +1,41 @@
+"""
+wait_for_results against the static Lens stand-in page from benchmarks/fakes.py, in a real
+headless Chrome. Skipped where Chrome (or its driver) is not available.
+"""
+import pytest
+
+from methods.page_ready import wait_for_results
+
+
+@pytest.fixture(scope="module")
+def driver():
+    try:
+        from methods.selenium_lens import create_driver
+        driver = create_driver(headless=True)
+    except Exception as e:
+        pytest.skip(f"Chrome not available: {e}")
+    yield driver
+    driver.quit()
+
+
+def test_results_selector(driver, fakes):
+    driver.get(f"{fakes.base_url}/uploadbyurl?url=x")
+    reason, seconds = wait_for_results(driver, ".Yt787", timeout=10, quiet_period=1.0)
+    assert reason == "results"
+    assert seconds < 5
+
+
+def test_quiet_page_without_results(driver, fakes):
+    driver.get(f"{fakes.base_url}/uploadbyurl?url=x")
+    reason, seconds = wait_for_results(driver, ".no-such-class", timeout=10, quiet_period=0.5)
+    assert reason == "quiescent"
+    assert seconds < 5
+
+
+def test_client_side_navigation_after_get(driver, fakes):
+    # The observer installed on the interstitial is gone after it navigates; it must be reinstalled
+    driver.get(f"{fakes.base_url}/uploadbyurl?url=x&redirect=1")
+    reason, seconds = wait_for_results(driver, ".no-such-class", timeout=10, quiet_period=1.0)
+    assert reason == "quiescent"
+    assert seconds < 5
+    assert "redirect=0" in driver.current_url
@@ -0,0 +1,129 @@
+import io
+import os
+
+import pytest
+from PIL import Image
+
+from methods.phash import HashIndex, dhash, hamming_distance
+
+IMAGE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "image")
+
+
+def read_image(name):
+    with open(os.path.join(IMAGE_DIR, name), "rb") as f:
+        return f.read()
+
+
+def reencode(data, scale=1.0, fmt="JPEG", **save_args):
+    img = Image.open(io.BytesIO(data)).convert("RGB")
+    if scale != 1.0:
+        img = img.resize((int(img.width * scale), int(img.height * scale)))
+    out = io.BytesIO()
+    img.save(out, format=fmt, **save_args)
+    return out.getvalue()
+
+
+def solid(color, size=(200, 150)):
+    out = io.BytesIO()
+    Image.new("RGB", size, color).save(out, format="PNG")
+    return out.getvalue()
+
+
+@pytest.fixture
+def photo():
+    return read_image("test_char.jpg")
+
+
+@pytest.mark.parametrize("copy_args", [
+    {"scale": 0.5},
+    {"quality": 40},
+    {"scale": 0.3, "quality": 60},
+    {"fmt": "PNG"},
+])
+def test_resized_or_recompressed_copy_is_found(photo, copy_args):
+    index = HashIndex(max_distance=4)
+    index.add(dhash(photo), "original")
+    match = index.lookup(dhash(reencode(photo, **copy_args)))
+    assert match is not None and match[1] == "original"
+
+
+def test_unrelated_image_is_not_found(photo):
+    index = HashIndex(max_distance=4)
+    index.add(dhash(photo), "original")
+    other = dhash(read_image("SerpApi output.png"))
+    assert hamming_distance(dhash(photo), other) > 4
+    assert index.lookup(other) is None
+
+
+def test_flat_images_are_not_hashed():
+    assert dhash(solid("black")) is None
+    assert dhash(solid((200, 30, 30))) is None
+    assert dhash(b"not an image") is None
+
+
+def test_two_flat_images_do_not_match(monkeypatch):
+    import scan_service
+    from methods.cache import ResultCache
+
+    monkeypatch.setattr(scan_service, "PHASH_ENABLED", True)
+    monkeypatch.setattr(scan_service, "result_cache", ResultCache())
+    monkeypatch.setattr(scan_service, "near_duplicate_index", {"serpapi": HashIndex()})
+    black, white = solid("black"), solid("white")
+    result = {"success": True, "best_guesses": ["black square"], "visual_matches": []}
+
+    _, status, cache_key, phash = scan_service.lookup_cached("serpapi", black)
+    assert status == "MISS" and phash is None
+    scan_service.store_result("serpapi", cache_key, phash, result)
+
+    assert scan_service.lookup_cached("serpapi", white)[:2] == (None, "MISS")
+    assert scan_service.lookup_cached("serpapi", black)[:2] == (result, "HIT")
+    assert len(scan_service.near_duplicate_index["serpapi"]) == 0
+
+
+def test_lookup_finds_the_closest_hash():
+    index = HashIndex(max_distance=4)
+    base = 0x0123456789ABCDEF
+    index.add(base ^ 0b111, "three bits off")
+    index.add(base ^ 0b1, "one bit off")
+    assert index.lookup(base) == (1, "one bit off")
+    assert index.lookup(base, max_distance=0) is None
+
+
+def bucket_members(index):
+    return [set().union(*buckets.values()) if buckets else set() for buckets in index._buckets]
+
+
+def test_discard_removes_the_value_from_every_bucket():
+    index = HashIndex(max_distance=4)
+    index.add(0xFFFF0000FFFF0000, "a")
+    index.add(0x0F0F0F0F0F0F0F0F, "b")
+    index.discard("a")
+    index.discard("missing")
+
+    assert len(index) == 1
+    assert index.lookup(0xFFFF0000FFFF0000) is None
+    assert bucket_members(index) == [{"b"}] * 5
+
+
+def test_readding_a_value_moves_it():
+    index = HashIndex(max_distance=4)
+    index.add(0xFFFF0000FFFF0000, "a")
+    index.add(0x0F0F0F0F0F0F0F0F, "a")
+    assert len(index) == 1
+    assert index.lookup(0xFFFF0000FFFF0000) is None
+    assert index.lookup(0x0F0F0F0F0F0F0F0F) == (0, "a")
+    assert sum(len(bucket) for buckets in index._buckets for bucket in buckets.values()) == 5
+
+
+def test_eviction_keeps_buckets_consistent():
+    index = HashIndex(max_distance=4, max_entries=3)
+    hashes = {f"v{i}": (i * 0x9E3779B97F4A7C15) % (1 << 64) for i in range(1, 6)}
+    for value, hash_value in hashes.items():
+        index.add(hash_value, value)
+
+    assert len(index) == 3
+    assert index.lookup(hashes["v1"]) is None and index.lookup(hashes["v2"]) is None
+    assert index.lookup(hashes["v5"]) == (0, "v5")
+    assert bucket_members(index) == [{"v3", "v4", "v5"}] * 5
+    # No empty buckets are left behind
+    assert all(bucket for buckets in index._buckets for bucket in buckets.values())
@@ -0,0 +1,61 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from methods.providers import ProviderRegistry
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+HEAVY_MODULES = ("selenium", "undetected_chromedriver", "google.cloud.vision", "serpapi")
+
+# Run in a fresh interpreter: this test process has usually imported the providers already
+PROBE = """
+import json, sys
+import {server}
+import scan_service
+
+def heavy():
+    return sorted(m for m in {heavy!r} if m in sys.modules)
+
+before = heavy()
+scan_service.providers.load("cloud_vision")
+print(json.dumps({{"before": before, "after": heavy()}}))
+"""
+
+
+@pytest.mark.parametrize("server", ["server", "async_server"])
+def test_import_server_does_not_load_providers(server):
+    pytest.importorskip("quart" if server == "async_server" else "flask")
+    env = dict(os.environ, PROVIDERS_PRELOAD="0", SELENIUM_POOL_SIZE="0", LOG_LEVEL="WARNING")
+    out = subprocess.run(
+        [sys.executable, "-c", PROBE.format(server=server, heavy=HEAVY_MODULES)],
+        cwd=ROOT, env=env, capture_output=True, text=True, timeout=120, check=True,
+    ).stdout
+    modules = json.loads(out.strip().splitlines()[-1])
+
+    assert modules["before"] == []
+    # First use loads that provider's dependencies, and only those
+    assert modules["after"] == ["google.cloud.vision"]
+
+
+def test_provider_is_loaded_on_first_call():
+    registry = ProviderRegistry(enabled=["json"])
+    provider = registry.register("json", "json", lambda module, image_bytes: module.loads(image_bytes))
+    assert not provider.loaded and registry.loaded() == []
+
+    assert provider(b"[1]") == [1]
+    assert registry.loaded() == ["json"] and provider.stats()["import_seconds"] is not None
+
+
+def test_disabled_and_broken_providers():
+    registry = ProviderRegistry(enabled=["broken"])
+    registry.register("other", "json", lambda module, image_bytes: None)
+    broken = registry.register("broken", "methods.no_such_provider", lambda module, image_bytes: None)
+    assert registry.enabled() == ["broken"] and not registry.is_enabled("other")
+
+    registry.preload()  # logs and carries on
+    assert not broken.loaded and broken.stats()["error"].startswith("ModuleNotFoundError")
+    with pytest.raises(ImportError):
+        broken(b"")
@@ -0,0 +1,86 @@
+import time
+
+import pytest
+
+from methods.driver_pool import DriverPool, PoolTimeout
+from methods.ratelimit import ProviderGuard, ProviderThrottled, ProviderUnavailable
+
+
+def fail(guard, error=RuntimeError("HTTP 503")):
+    with pytest.raises(type(error)):
+        with guard.call():
+            raise error
+
+
+def test_breaker_opens_after_consecutive_errors():
+    guard = ProviderGuard("test", failure_threshold=3, reset_timeout=10)
+    for _ in range(2):
+        fail(guard)
+    with guard.call():
+        pass  # a success resets the count
+    for _ in range(3):
+        fail(guard)
+    assert guard.stats()["state"] == "open"
+    with pytest.raises(ProviderUnavailable, match="circuit open") as refused:
+        with guard.call():
+            pass
+    assert 0 < refused.value.retry_after <= 10
+    assert guard.stats()["calls"]["rejected_open"] == 1
+
+
+def test_half_open_probe_closes_or_reopens():
+    guard = ProviderGuard("test", failure_threshold=1, reset_timeout=0.05, max_reset_timeout=10)
+    fail(guard)
+    time.sleep(0.06)
+    probe = guard.acquire()  # the one probe
+    assert guard.stats()["state"] == "half_open"
+    with pytest.raises(ProviderUnavailable, match="probe in flight"):
+        guard.acquire()
+    guard.record("error", probe)
+    assert guard.stats()["state"] == "open"
+    assert guard.stats()["open_for_seconds"] > 0.05  # the reset timeout doubled
+
+    time.sleep(0.11)
+    with guard.call():
+        pass
+    assert guard.stats()["state"] == "closed"
+
+
+def test_throttling_slows_down_without_opening():
+    guard = ProviderGuard("test", rate=10, failure_threshold=1, backoff=0.2)
+    with pytest.raises(ProviderThrottled):
+        with guard.call():
+            raise ProviderThrottled("test", "HTTP 429")
+    stats = guard.stats()
+    assert stats["state"] == "closed"
+    assert stats["current_rate"] == 5
+    assert stats["paused_for_seconds"] > 0
+
+
+def test_another_guard_refusing_does_not_count():
+    guard = ProviderGuard("test", failure_threshold=1)
+    fail(guard, ProviderUnavailable("other", "circuit open"))
+    assert guard.stats()["state"] == "closed"
+    assert guard.stats()["consecutive_failures"] == 0
+
+
+def test_busy_browser_pool_does_not_count_against_lens(monkeypatch):
+    selenium_lens = pytest.importorskip("methods.selenium_lens")
+    lens = ProviderGuard("lens", failure_threshold=1)
+    monkeypatch.setattr(selenium_lens, "get_guard", lambda name: lens)
+    pool = DriverPool(object, size=1, acquire_timeout=0.01)
+    with pool.lease():
+        with pytest.raises(PoolTimeout):
+            selenium_lens.scrape_lens("https://example.com/a.jpg", pool)
+    assert lens.stats()["state"] == "closed"
+    assert lens.stats()["calls"]["error"] == 0
+
+
+def test_calls_over_the_rate_are_shed():
+    guard = ProviderGuard("test", rate=1, max_wait=0.1)
+    with guard.call():
+        pass
+    with pytest.raises(ProviderUnavailable, match="rate limited"):
+        with guard.call():
+            pass
+    assert guard.stats()["calls"]["shed"] == 1
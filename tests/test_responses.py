@@ -0,0 +1,118 @@
+import gzip
+import json
+
+import pytest
+
+from methods import responses
+from methods.cache import image_digest, make_cache_key
+from methods.responses import choose_encoding, encode, etag, etag_matches, select_fields
+
+RESULT = {
+    "success": True,
+    "method": "SerpApi",
+    "best_guesses": ["charmander plush"],
+    "visual_matches": [{"title": f"Charmander Plush #{i}", "link": f"https://example.com/{i}",
+                        "thumbnail": f"/thumb?url=x{i}", "source": "eBay"} for i in range(20)],
+    "common_keywords": [{"word": "charmander", "count": 20}],
+    "debug_info": {"api_time": 1.2},
+}
+
+
+def test_same_data_same_etag():
+    _, _, first = encode(RESULT)
+    _, _, second = encode(json.loads(json.dumps(RESULT)))  # equal data, new objects
+    assert first["ETag"] == second["ETag"]
+    assert first["ETag"].startswith('W/"')
+    _, _, other = encode(dict(RESULT, success=False))
+    assert other["ETag"] != first["ETag"]
+
+
+@pytest.mark.parametrize("header", [
+    "{tag}",
+    "{opaque}",  # strong form of the weak tag
+    'W/"somethingelse", {tag}',
+    '"somethingelse",{opaque}',
+    "*",
+])
+def test_if_none_match_gives_304(header):
+    _, _, headers = encode(RESULT)
+    tag = headers["ETag"]
+    status, body, headers = encode(RESULT, if_none_match=header.format(tag=tag, opaque=tag[2:]))
+    assert (status, body) == (304, b"")
+    assert headers["ETag"] == tag
+
+
+def test_other_etag_gives_the_body():
+    status, body, _ = encode(RESULT, if_none_match='W/"somethingelse"')
+    assert status == 200 and body
+    assert not etag_matches(None, etag(b"x"))
+
+
+@pytest.mark.parametrize("accept, expected", [
+    ("gzip", "gzip"),
+    ("gzip;q=0", None),
+    ("identity", None),
+    ("*", "gzip"),
+    ("*, gzip;q=0", None),
+    ("gzip;q=0.5, deflate", "gzip"),
+    ("", None),
+])
+def test_choose_encoding(accept, expected, monkeypatch):
+    monkeypatch.setattr(responses, "brotli", None)
+    assert choose_encoding(accept) == expected
+
+
+def test_compression_threshold(monkeypatch):
+    monkeypatch.setattr(responses, "RESPONSE_COMPRESS_MIN_BYTES", 10 ** 6)
+    status, body, headers = encode(RESULT, accept_encoding="gzip")
+    assert "Content-Encoding" not in headers
+    assert json.loads(body) == RESULT
+
+    monkeypatch.setattr(responses, "RESPONSE_COMPRESS_MIN_BYTES", 100)
+    status, body, headers = encode(RESULT, accept_encoding="gzip")
+    assert headers["Content-Encoding"] == "gzip"
+    assert json.loads(gzip.decompress(body)) == RESULT
+
+
+def test_compact_fields():
+    compact = select_fields(RESULT, "compact")
+    assert "debug_info" not in compact
+    assert compact["visual_matches"][0] == {"title": "Charmander Plush #0", "link": "https://example.com/0"}
+    assert RESULT["visual_matches"][0]["thumbnail"]  # the input is not modified
+    assert select_fields(RESULT) is RESULT
+
+    batch = {"success": True, "count": 2, "cached": 1, "results": [RESULT, RESULT]}
+    compact_batch = select_fields(batch, "compact")
+    assert compact_batch["count"] == 2
+    assert compact_batch["results"] == [compact, compact]
+
+
+@pytest.fixture
+def cached_scan():
+    """A Flask test client and the digest of an image with a cached serpapi result."""
+    import scan_service
+    import server
+
+    digest = image_digest(b"test_responses image")
+    scan_service.result_cache.set(make_cache_key(digest, "serpapi"), "serpapi", RESULT)
+    return server.app.test_client(), digest
+
+
+def test_scan_by_digest(cached_scan):
+    client, digest = cached_scan
+    response = client.get(f"/scan/{digest}?method=serpapi")
+    assert response.status_code == 200
+    assert response.headers["X-Cache"] == "HIT"
+    assert response.get_json()["best_guesses"] == ["charmander plush"]
+
+    again = client.get(f"/scan/{digest}?method=serpapi", headers={"If-None-Match": response.headers["ETag"]})
+    assert again.status_code == 304 and again.data == b""
+
+    compact = client.get(f"/scan/{digest}?method=serpapi&fields=compact")
+    assert "debug_info" not in compact.get_json()
+
+
+def test_scan_by_digest_miss(cached_scan):
+    client, _ = cached_scan
+    assert client.get(f"/scan/{image_digest(b'never uploaded')}?method=serpapi").status_code == 404
+    assert client.get("/scan/not-a-digest?method=serpapi").status_code == 400
@@ -0,0 +1,44 @@
+import pytest
+
+selenium_lens = pytest.importorskip("methods.selenium_lens")
+
+
+class FakeChrome:
+    """Stands in for uc.Chrome: keeps the options instead of starting a browser."""
+
+    def __init__(self, options, version_main=None):
+        self.capabilities = options.to_capabilities()
+        self.cdp = []
+
+    def execute_cdp_cmd(self, cmd, params):
+        self.cdp.append(cmd)
+
+    def get_log(self, kind):
+        raise AssertionError("the performance log was read from a driver that does not keep it")
+
+
+@pytest.fixture(autouse=True)
+def fake_chrome(monkeypatch):
+    monkeypatch.setattr(selenium_lens.uc, "Chrome", FakeChrome)
+
+
+@pytest.mark.parametrize("profile, measure_env, expected", [
+    ("default", False, False),
+    ("default", True, True),
+    ("lean", False, True),
+])
+def test_performance_log_only_when_measuring(monkeypatch, profile, measure_env, expected):
+    monkeypatch.setattr(selenium_lens, "MEASURE_NETWORK", measure_env)
+    driver = selenium_lens.create_driver(headless=True, profile=profile)
+    assert ("goog:loggingPrefs" in driver.capabilities) is expected
+    assert driver.measure_network is expected
+
+
+def test_explicit_measurement_overrides_the_profile():
+    assert selenium_lens.create_driver(profile="default", measure_network=True).measure_network
+    assert not selenium_lens.create_driver(profile="lean", measure_network=False).measure_network
+
+
+def test_unmeasured_driver_skips_the_network_log():
+    driver = selenium_lens.create_driver(profile="default", measure_network=False)
+    assert selenium_lens._drain_network_log(driver) is None
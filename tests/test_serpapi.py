@@ -0,0 +1,32 @@
+import time
+
+import pytest
+import requests
+
+from methods import serpapi
+from methods.ratelimit import ProviderGuard
+
+
+@pytest.fixture
+def serpapi_fake(fakes, monkeypatch):
+    monkeypatch.setattr(serpapi, "SERPAPI_BACKEND", fakes.base_url)
+    monkeypatch.setattr(serpapi, "upload_to_imgbb", lambda image_bytes, key: f"{fakes.base_url}/img/a.jpg")
+    # Its own breaker, so the timeouts here do not open the shared "serpapi" circuit
+    guard = ProviderGuard("serpapi-test")
+    monkeypatch.setattr(serpapi, "get_guard", lambda name: guard)
+    return fakes
+
+
+def test_sync_search(serpapi_fake):
+    result = serpapi.analyze_with_serpapi(b"image", "key", "key")
+    assert result["success"] and result["visual_matches"]
+    assert serpapi_fake.stats()["calls"]["serpapi"] == 1
+
+
+def test_sync_search_times_out(serpapi_fake, monkeypatch):
+    monkeypatch.setattr(serpapi, "SERPAPI_TIMEOUT", 0.2)
+    serpapi_fake.latency["serpapi"] = 1.0
+    started = time.monotonic()
+    with pytest.raises(requests.Timeout):
+        serpapi.analyze_with_serpapi(b"image", "key", "key")
+    assert time.monotonic() - started < 0.9
@@ -0,0 +1,90 @@
+import io
+import tempfile
+
+import pytest
+
+import server
+from scan_service import ScanError, read_upload
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setitem(server.app.config, "MAX_CONTENT_LENGTH", 1024)
+    return server.app.test_client()
+
+
+def upload(size):
+    return {"images": (io.BytesIO(b"x" * size), "a.jpg"), "method": "serpapi"}
+
+
+def test_batch_limit_replaces_the_scan_limit(client, fakes, monkeypatch):
+    from methods import google_cloud
+    from methods.cache import ResultCache
+
+    server.providers.load("cloud_vision")
+    monkeypatch.setattr(google_cloud, "VISION_API_ENDPOINT", fakes.base_url)
+    monkeypatch.setattr(google_cloud, "_client", None)
+    monkeypatch.setattr(server, "result_cache", ResultCache())
+    monkeypatch.setattr(server, "BATCH_MAX_BYTES", 8 * 1024)
+
+    # Over the /scan limit but under the batch one
+    data = {"images": (io.BytesIO(b"x" * 4 * 1024), "a.jpg"), "method": "cloud_vision"}
+    response = client.post("/scan/batch", data=data)
+    assert response.status_code == 200
+    assert response.get_json()["count"] == 1 and fakes.stats()["calls"]["vision"] == 1
+    assert client.post("/scan", data={"image": (io.BytesIO(b"x" * 4 * 1024), "a.jpg")}).status_code == 413
+
+
+def test_batch_over_its_limit(client, monkeypatch):
+    monkeypatch.setattr(server, "BATCH_MAX_BYTES", 8 * 1024)
+    response = client.post("/scan/batch", data=upload(16 * 1024))
+    assert response.status_code == 413
+    assert "8192" in response.get_json()["error"]
+
+
+def test_large_uploads_are_spooled_to_disk(monkeypatch):
+    monkeypatch.setattr(server, "UPLOAD_SPOOL_BYTES", 1024)
+    # A spooled file moves to disk by creating a TemporaryFile
+    rollovers = []
+    temporary_file = tempfile.TemporaryFile
+
+    def recording_temporary_file(*args, **kwargs):
+        rollovers.append(True)
+        return temporary_file(*args, **kwargs)
+
+    monkeypatch.setattr(tempfile, "TemporaryFile", recording_temporary_file)
+    for size, on_disk in ((512, False), (4096, True)):
+        rollovers.clear()
+        with server.app.test_request_context("/scan", method="POST", data=upload(size)):
+            file = server.request.files["images"]
+            assert bool(rollovers) == on_disk
+            assert len(read_upload(file)) == size
+
+
+def test_oversized_upload_is_refused_before_reading():
+    with server.app.test_request_context("/scan", method="POST", data=upload(4096)):
+        file = server.request.files["images"]
+        with pytest.raises(ScanError) as refused:
+            read_upload(file, max_bytes=1024)
+        assert refused.value.status_code == 413
+        assert file.stream.tell() == 0
+
+
+@pytest.mark.parametrize("deadline", ["0", "-1", "nan", "inf", "-inf", "soon"])
+def test_bad_ensemble_deadline_is_refused(client, deadline):
+    data = {"image": (io.BytesIO(b"x" * 16), "a.jpg"), "method": "ensemble", "deadline": deadline}
+    response = client.post("/scan", data=data)
+    assert response.status_code == 400 and "deadline" in response.get_json()["error"]
+
+    data["image"] = (io.BytesIO(b"x" * 16), "a.jpg")
+    assert client.post("/jobs", data=data).status_code == 400
+
+
+def test_ensemble_deadline_defaults_and_cap(monkeypatch):
+    import scan_service
+
+    monkeypatch.setattr(scan_service, "ENSEMBLE_DEADLINE", 15.0)
+    monkeypatch.setattr(scan_service, "ENSEMBLE_MAX_DEADLINE", 60.0)
+    assert scan_service.ensemble_deadline(None) == scan_service.ensemble_deadline("") == 15.0
+    assert scan_service.ensemble_deadline("2.5") == 2.5
+    assert scan_service.ensemble_deadline(1e9) == 60.0
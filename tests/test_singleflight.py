@@ -0,0 +1,129 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from methods.singleflight import AsyncSingleFlight, SingleFlight
+
+
+def run_concurrently(flight, n, fn, key="k"):
+    """Starts n threads calling flight.do(key, fn) and returns each one's outcome."""
+    outcomes = [None] * n
+
+    def call(i):
+        try:
+            outcomes[i] = flight.do(key, fn)
+        except Exception as e:
+            outcomes[i] = e
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(n)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    return outcomes
+
+
+def slow(result=None, error=None, calls=None):
+    def fn():
+        if calls is not None:
+            calls.append(1)
+        time.sleep(0.2)  # long enough for every thread to join
+        if error is not None:
+            raise error
+        return result
+
+    return fn
+
+
+def test_identical_keys_run_once():
+    flight, calls = SingleFlight(), []
+    outcomes = run_concurrently(flight, 8, slow({"ok": True}, calls=calls))
+    assert len(calls) == 1
+    assert all(result == {"ok": True} for result, _ in outcomes)
+    assert sorted(shared for _, shared in outcomes) == [False] + [True] * 7
+    stats = flight.stats()
+    assert (stats["leaders"], stats["coalesced"], stats["in_flight"]) == (1, 7, 0)
+
+
+def test_error_reaches_every_waiter():
+    error = RuntimeError("provider down")
+    outcomes = run_concurrently(SingleFlight(), 4, slow(error=error))
+    assert all(outcome is error for outcome in outcomes)
+
+
+def test_key_is_cleared_afterwards():
+    flight, calls = SingleFlight(), []
+    fn = lambda: calls.append(1) or len(calls)  # noqa: E731
+    assert flight.do("k", fn) == (1, False)
+    assert flight.do("k", fn) == (2, False)
+    with pytest.raises(ValueError):
+        flight.do("k", slow(error=ValueError("bad image")))
+    assert flight.do("k", fn) == (3, False)
+
+
+def test_different_keys_do_not_share():
+    flight, calls = SingleFlight(), []
+    outcomes = [None, None]
+    threads = [threading.Thread(target=lambda i=i: outcomes.__setitem__(i, flight.do(i, slow(i, calls=calls))))
+               for i in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert len(calls) == 2 and outcomes == [(0, False), (1, False)]
+
+
+def test_async_identical_keys_run_once():
+    flight, calls = AsyncSingleFlight(), []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "result"
+
+    async def main():
+        return await asyncio.gather(*(flight.do("k", work) for _ in range(5)))
+
+    outcomes = asyncio.run(main())
+    assert len(calls) == 1
+    assert [result for result, _ in outcomes] == ["result"] * 5
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_async_cancelled_waiter_does_not_cancel_the_work():
+    flight, finished = AsyncSingleFlight(), []
+
+    async def work():
+        await asyncio.sleep(0.1)
+        finished.append(1)
+        return "result"
+
+    async def main():
+        leader = asyncio.ensure_future(flight.do("k", work))
+        follower = asyncio.ensure_future(flight.do("k", work))
+        await asyncio.sleep(0.01)
+        leader.cancel()  # e.g. the leader's client disconnected
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    assert asyncio.run(main()) == ("result", True)
+    assert finished == [1]
+
+
+def test_async_error_reaches_every_waiter_and_clears_the_key():
+    flight = AsyncSingleFlight()
+
+    async def work():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("provider down")
+
+    async def main():
+        outcomes = await asyncio.gather(*(flight.do("k", work) for _ in range(3)), return_exceptions=True)
+        assert flight.stats()["in_flight"] == 0
+        return outcomes
+
+    outcomes = asyncio.run(main())
+    assert all(isinstance(outcome, RuntimeError) for outcome in outcomes)
@@ -0,0 +1,56 @@
+import os
+import threading
+from urllib.parse import quote
+
+import pytest
+
+from methods import thumbnails
+from methods.thumbnails import Prefetcher, ThumbnailCache, ThumbnailError
+
+
+def test_secret_is_kept_in_the_cache_dir(tmp_path):
+    first = thumbnails._load_secret(str(tmp_path))
+    assert first and thumbnails._load_secret(str(tmp_path)) == first
+    assert os.stat(tmp_path / ".secret").st_mode & 0o077 == 0
+
+
+def test_fetch_and_cache(fakes, tmp_path):
+    cache = ThumbnailCache(directory=str(tmp_path), size=64)
+    url = f"{fakes.base_url}/img/thumb-0.jpg"
+    assert cache.get(url)[:2] == b"\xff\xd8"
+    cache.get(url)
+    assert cache.stats()["misses"] == 1 and cache.stats()["hits"] == 1
+
+
+def test_redirect_to_internal_host_is_refused(fakes, tmp_path):
+    cache = ThumbnailCache(directory=str(tmp_path))
+    target = f"{fakes.base_url}/img/thumb-0.jpg"  # 127.0.0.1
+    with pytest.raises(ThumbnailError, match="non-public"):
+        cache.get(f"{fakes.base_url}/redirect?to={quote(target)}")
+    assert fakes.stats()["calls"]["image"] == 0
+
+
+def test_prefetch_backlog_is_bounded():
+    release = threading.Event()
+
+    class SlowCache:
+        def get(self, url):
+            release.wait(5)
+
+    prefetcher = Prefetcher(SlowCache(), workers=1, max_pending=2)
+    try:
+        assert [prefetcher.submit(f"https://example.com/{i}.jpg") for i in range(4)] == [True, True, False, False]
+        assert prefetcher.stats()["dropped"] == 2
+    finally:
+        release.set()
+
+
+def test_no_prefetch_on_revalidation(monkeypatch):
+    submitted = []
+    monkeypatch.setattr(thumbnails.prefetcher, "submit", submitted.append)
+    result = {"visual_matches": [{"title": "x", "thumbnail": "https://example.com/a.jpg"}]}
+    proxied = thumbnails.proxy_thumbnails(result, prefetch=False)
+    assert proxied["visual_matches"][0]["thumbnail"].startswith("/thumb?")
+    assert submitted == []
+    thumbnails.proxy_thumbnails(result)
+    assert submitted == ["https://example.com/a.jpg"]